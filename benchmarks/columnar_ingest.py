@@ -0,0 +1,57 @@
+"""Throughput of Model.save_columns() compared with save() per object.
+
+Usage:
+    python -m benchmarks.columnar_ingest [rows]
+"""
+
+import array
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.repository import SqlRepository
+
+
+def report(label: str, rows: int, elapsed: float):
+    print(f"{label:<28} {rows:>8} rows {elapsed:8.3f} s {rows / elapsed:12.0f} rows/s")
+
+
+def main(rows: int = 200000):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection(
+                os.path.join(tmp, "bench.db")))
+
+        class Measurement(BaseModel):
+            id = PrimaryKey()
+            sensor = StringProperty()
+            value = FloatProperty()
+            quality = IntProperty()
+
+        Measurement.init_class()
+
+        single_rows = min(rows, 2000)
+        start = time.perf_counter()
+        for i in range(single_rows):
+            Measurement(sensor=f"s{i % 100}", value=i * 0.5,
+                        quality=i % 10).save()
+        report("save()", single_rows, time.perf_counter() - start)
+
+        sensor = [f"s{i % 100}" for i in range(rows)]
+        value = array.array("d", (i * 0.5 for i in range(rows)))
+        quality = array.array("q", (i % 10 for i in range(rows)))
+
+        for cache in (False, True):
+            start = time.perf_counter()
+            Measurement.save_columns(
+                cache=cache, sensor=sensor, value=value, quality=quality)
+            report(f"save_columns(cache={cache})",
+                   rows, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,78 @@
+"""Multi-threaded read benchmark for ThreadSafeSqlRepository.
+
+Runs the same set of range selections through QueryBuilder.evaluate with
+an increasing number of threads sharing one repository.
+
+Usage:
+    python -m benchmarks.concurrent_reads [rows] [queries]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import IntProperty, PrimaryKey, StringProperty
+from src.query_builder import And, GreaterThan, LessThan
+from src.repository import ThreadSafeSqlRepository
+
+THREAD_COUNTS = [1, 2, 4, 8]
+
+
+def seed(db_path: str, table: str, rows: int):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        f"INSERT INTO {table} (name, age) VALUES (?, ?)",
+        ((f"name{i}", i % 1000) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def main(rows: int = 20000, queries: int = 400):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        shared_repository = ThreadSafeSqlRepository(
+            SqliteConnection(db_path, persistent=True), readers=max(THREAD_COUNTS))
+
+        class BaseModel(ModelMeta):
+            repository = shared_repository
+
+        class Person(BaseModel):
+            id = PrimaryKey()
+            name = StringProperty()
+            age = IntProperty()
+
+        Person.init_class()
+        seed(db_path, Person.table_name, rows)
+
+        def select(i: int):
+            low = (i * 37) % 990
+            condition = And(GreaterThan(Person.age, low),
+                            LessThan(Person.age, low + 10))
+            return len(Person.selection.where(condition).evaluate())
+
+        print(f"{rows} rows, {queries} queries per run")
+        base = None
+
+        for threads in THREAD_COUNTS:
+            shared_repository.clear_cache()
+            start = time.perf_counter()
+
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(select, range(queries)))
+
+            elapsed = time.perf_counter() - start
+            base = base or elapsed
+            print(f"threads={threads:<2} {queries / elapsed:10.1f} queries/s"
+                  f"  speedup x{base / elapsed:.2f}")
+
+        shared_repository.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+"""Read and write throughput under each connection profile.
+
+Usage:
+    python -m benchmarks.connection_profiles [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import PROFILES, SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.query_builder import GreaterThan
+from src.repository import SqlRepository
+
+
+def rate(operations: int, function) -> float:
+    start = time.perf_counter()
+    function()
+    return operations / (time.perf_counter() - start)
+
+
+def measure(profile: str, rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = SqliteConnection(os.path.join(
+            tmp, "bench.db"), persistent=True, profile=profile)
+
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(connection)
+
+        class Measurement(BaseModel):
+            id = PrimaryKey()
+            sensor = StringProperty()
+            value = FloatProperty()
+            quality = IntProperty()
+
+        Measurement.init_class()
+
+        saves = min(rows // 10, 2000)
+        single = rate(saves, lambda: [Measurement(
+            sensor="s", value=0.5, quality=i).save() for i in range(saves)])
+        bulk = rate(rows, lambda: Measurement.save_columns(
+            sensor=["s"] * rows, value=[0.5] * rows, quality=list(range(rows))))
+
+        BaseModel.repository.clear_cache()
+        evaluate = rate(rows, lambda: Measurement.selection.evaluate())
+        columns = rate(rows, lambda: Measurement.selection.where(
+            GreaterThan(Measurement.quality, -1)).columns())
+
+        connection.dispose()
+
+    print(f"{profile:<12} {single:12.0f} {bulk:12.0f} {evaluate:12.0f} {columns:12.0f}")
+
+
+def main(rows: int = 100000):
+    print(f"{rows} rows, rows/s")
+    print(f"{'profile':<12} {'save()':>12} {'bulk':>12} {'evaluate':>12} {'columns':>12}")
+
+    for profile in PROFILES:
+        measure(profile, rows)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,69 @@
+"""Streaming export() to different formats compared with evaluate() and to_json().
+
+Usage:
+    python -m benchmarks.export_formats [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.repository import SqlRepository
+
+
+def report(label: str, rows: int, elapsed: float, path: str):
+    print(f"{label:<22} {rows:>8} rows {elapsed:8.3f} s {rows / elapsed:12.0f} rows/s "
+          f"{os.path.getsize(path) / 2 ** 20:8.1f} MiB")
+
+
+def main(rows: int = 1000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection(
+                os.path.join(tmp, "bench.db"), persistent=True))
+
+        class Measurement(BaseModel):
+            id = PrimaryKey()
+            sensor = StringProperty()
+            value = FloatProperty()
+            count = IntProperty()
+
+        Measurement.init_class()
+        Measurement.save_columns(sensor=[f"sensor{i % 100}" for i in range(rows)],
+                                 value=[i * 0.5 for i in range(rows)],
+                                 count=list(range(rows)))
+
+        repository = BaseModel.repository
+
+        def timed(label: str, path: str, function):
+            repository.clear_cache()
+            start = time.perf_counter()
+            function(path)
+            report(label, rows, time.perf_counter() - start, path)
+
+        def evaluate_to_json(path: str):
+            with open(path, "w") as file:
+                for measurement in Measurement.selection.evaluate():
+                    file.write(measurement.to_json() + "\n")
+
+        timed("evaluate + to_json", os.path.join(tmp, "evaluated.jsonl"), evaluate_to_json)
+        timed("export csv", os.path.join(tmp, "export.csv"),
+              lambda path: Measurement.selection.export(path, "csv"))
+        timed("export jsonl", os.path.join(tmp, "export.jsonl"),
+              lambda path: Measurement.selection.export(path, "jsonl"))
+        timed("export json", os.path.join(tmp, "export.json"),
+              lambda path: Measurement.selection.export(path, "json"))
+        timed("export columnar", os.path.join(tmp, "export.bin"),
+              lambda path: Measurement.selection.export(path, "columnar"))
+        timed("export csv gzip", os.path.join(tmp, "export.csv.gz"),
+              lambda path: Measurement.selection.export(path, "csv", compression="gzip"))
+        timed("export jsonl depth=0", os.path.join(tmp, "objects.jsonl"),
+              lambda path: Measurement.selection.export(path, "jsonl", depth=0))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
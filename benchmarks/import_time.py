@@ -0,0 +1,50 @@
+"""Import time of the package, measured with python -X importtime.
+
+Every measurement runs a fresh interpreter, so modules imported by the
+package (and not by the interpreter itself) are imported from scratch.
+
+Usage:
+    python -m benchmarks.import_time [module] [top]
+"""
+
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+
+def measure(module: str = "src.model_meta") -> Dict[str, Tuple[int, int]]:
+    """Imports the module in a new interpreter.
+
+    Returns:
+        Self and cumulative import times in microseconds by name of every
+        module imported on the way, in the order of importing.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True)
+    times = dict()
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(self_time), int(cumulative)
+
+    return times
+
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "src.model_meta"
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    times = measure(module)
+
+    print(f"{module:30} {times[module][1] / 1000:8.1f} ms cumulative, {len(times)} modules")
+
+    for name, (self_time, _) in sorted(times.items(), key=lambda item: -item[1][0])[:top]:
+        print(f"  {name:28} {self_time / 1000:8.1f} ms self")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Selections of a fully cached model evaluated in memory compared with SQL.
+
+The in-memory path is measured scanning all objects and with indexes.
+
+Usage:
+    python -m benchmarks.memory_queries [rows] [queries]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import IntProperty, PrimaryKey, StringProperty
+from src.query_builder import And, Equals, GreaterThan, IsIn, LessThan
+from src.memory_index import HashIndex, SortedIndex
+from src.repository import SqlRepository
+
+
+def report(label: str, queries: int, elapsed: float):
+    print(f"{label:<10} {queries:>8} queries {elapsed:8.3f} s {queries / elapsed:12.0f} queries/s")
+
+
+def main(rows: int = 1000, queries: int = 2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection(
+                os.path.join(tmp, "bench.db"), persistent=True))
+
+        class Service(BaseModel):
+            id = PrimaryKey()
+            name = StringProperty()
+            tier = IntProperty()
+
+        Service.init_class()
+        Service.save_columns(name=[f"service{i}" for i in range(rows)],
+                             tier=[i % 10 for i in range(rows)])
+
+        conditions = [
+            Equals(Service.name, "service7"),
+            And(GreaterThan(Service.tier, 3), LessThan(Service.tier, 5)),
+            IsIn(Service.id, [1, 10, 100]),
+        ]
+
+        def run():
+            start = time.perf_counter()
+            for i in range(queries):
+                Service.selection.where(conditions[i % len(conditions)]).evaluate()
+            return time.perf_counter() - start
+
+        # warm the identity map, so both paths return cached objects
+        Service.selection.evaluate()
+        report("sql", queries, run())
+
+        BaseModel.repository.cache_model(Service)
+        report("memory", queries, run())
+
+        BaseModel.repository.cache_model(Service, indexes=[
+            HashIndex(Service.name), SortedIndex(Service.tier), HashIndex(Service.id)])
+        report("indexed", queries, run())
+
+        for stats in BaseModel.repository.index_stats(Service):
+            print(f"  {stats['kind']:<6} index on {stats['property']:<5} hit rate {stats['hit_rate']:.2f}, "
+                  f"{stats['memory_bytes'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+"""Benchmark of process-pool hydration of large result sets.
+
+Compares serial evaluate() with QueryBuilder.parallel() for 1/2/4/8
+worker processes.
+
+Usage:
+    python -m benchmarks.parallel_hydration [rows] [batch_size]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.repository import SqlRepository
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+_tmp = tempfile.TemporaryDirectory()
+
+
+class BaseModel(ModelMeta):
+    repository = SqlRepository(SqliteConnection(
+        os.path.join(_tmp.name, "bench.db")))
+
+
+class Measurement(BaseModel):
+    id = PrimaryKey()
+    sensor = StringProperty()
+    value = FloatProperty()
+    quality = IntProperty()
+
+
+def seed(rows: int):
+    Measurement.init_class()
+
+    conn = sqlite3.connect(BaseModel.repository.connection.db_path)
+    conn.executemany(
+        "INSERT INTO Measurement (sensor, value, quality) VALUES (?, ?, ?)",
+        ((f"sensor{i % 100}", i * 0.5, i % 10) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(label: str, load):
+    BaseModel.repository.clear_cache()
+    start = time.perf_counter()
+    count = len(load())
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.3f} s  {count / elapsed:12.0f} rows/s")
+
+
+def main(rows: int = 200000, batch_size: int = 20000):
+    seed(rows)
+    print(f"{rows} rows, batches of {batch_size} rows, {os.cpu_count()} cpus")
+
+    measure("evaluate", lambda: Measurement.selection.evaluate())
+
+    for workers in WORKER_COUNTS:
+        measure(f"workers={workers}", lambda: list(
+            Measurement.selection.parallel(workers).iterate(batch_size)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,72 @@
+"""Statements and time needed to load playground.py-style relations.
+
+Users list services, which list service infos. Loading is measured with
+per-object relation queries (default) and with prefetch_related().
+
+Usage:
+    python -m benchmarks.relation_loading [users]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import ListProperty, PrimaryKey, StringProperty
+from src.repository import SqlRepository
+from src.testing import capture_queries
+
+
+def main(users: int = 1000):
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection(
+                os.path.join(tmp, "bench.db"), persistent=True))
+
+        class ServiceInfo(BaseModel):
+            id = PrimaryKey()
+            name = StringProperty()
+
+        class Service(BaseModel):
+            id = PrimaryKey()
+            name = StringProperty()
+            info = ListProperty(ServiceInfo)
+
+        class User(BaseModel):
+            id = PrimaryKey()
+            username = StringProperty()
+            services = ListProperty(Service)
+
+        for model in (ServiceInfo, Service, User):
+            model.init_class()
+
+        infos = [ServiceInfo(name=f"info{i}") for i in range(50)]
+        for info in infos:
+            info.save()
+
+        services = [Service(name=f"service{i}", info=random.sample(infos, 5)) for i in range(100)]
+        for service in services:
+            service.save()
+
+        for i in range(users):
+            User(username=f"user{i}", services=random.sample(services, 5)).save()
+
+        for label, selection in (("default", lambda: User.selection),
+                                 ("prefetch_related", lambda: User.selection.prefetch_related("services__info"))):
+            BaseModel.repository.clear_cache()
+
+            with capture_queries() as queries:
+                start = time.perf_counter()
+                selection().evaluate()
+                elapsed = time.perf_counter() - start
+
+            print(f"{label:<18} {len(queries):>8} statements {elapsed:8.3f} s")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
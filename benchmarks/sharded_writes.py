@@ -0,0 +1,63 @@
+"""Write throughput of ShardedRepository for different shard counts.
+
+Usage:
+    python -m benchmarks.sharded_writes [rows]
+"""
+
+import array
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.repository import ShardedRepository
+
+SHARD_COUNTS = [1, 2, 4, 8]
+
+
+def report(shards: int, label: str, rows: int, elapsed: float):
+    print(f"{shards:>6} {label:<14} {rows:>8} rows {elapsed:8.3f} s {rows / elapsed:12.0f} rows/s")
+
+
+def main(rows: int = 200000):
+    print(f"{'shards':>6} {'operation':<14}")
+
+    for shard_count in SHARD_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            class BaseModel(ModelMeta):
+                repository = ShardedRepository([
+                    SqliteConnection(os.path.join(tmp, f"shard{i}.db"), persistent=True)
+                    for i in range(shard_count)
+                ])
+
+            class Measurement(BaseModel):
+                id = PrimaryKey()
+                sensor = StringProperty()
+                value = FloatProperty()
+                quality = IntProperty()
+
+            Measurement.init_class()
+
+            single_rows = min(rows, 2000)
+            start = time.perf_counter()
+            for i in range(single_rows):
+                Measurement(sensor=f"s{i % 100}", value=i * 0.5,
+                            quality=i % 10).save()
+            report(shard_count, "save()", single_rows, time.perf_counter() - start)
+
+            sensor = [f"s{i % 100}" for i in range(rows)]
+            value = array.array("d", (i * 0.5 for i in range(rows)))
+            quality = array.array("q", (i % 10 for i in range(rows)))
+
+            start = time.perf_counter()
+            Measurement.save_columns(sensor=sensor, value=value, quality=quality)
+            report(shard_count, "save_columns()", rows, time.perf_counter() - start)
+
+            BaseModel.repository.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+"""Warming the identity map from a snapshot compared with evaluate().
+
+Usage:
+    python -m benchmarks.snapshot_warm_start [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, IntProperty, PrimaryKey, StringProperty
+from src.repository import SqlRepository
+
+
+def report(label: str, rows: int, elapsed: float):
+    print(f"{label:<20} {rows:>8} rows {elapsed:8.3f} s {rows / elapsed:12.0f} rows/s")
+
+
+def main(rows: int = 1000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        class BaseModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection(
+                os.path.join(tmp, "bench.db"), persistent=True))
+
+        class Measurement(BaseModel):
+            id = PrimaryKey()
+            sensor = StringProperty()
+            value = FloatProperty()
+            count = IntProperty()
+
+        Measurement.init_class()
+        Measurement.save_columns(sensor=[f"sensor{i % 100}" for i in range(rows)],
+                                 value=[i * 0.5 for i in range(rows)],
+                                 count=list(range(rows)))
+
+        repository = BaseModel.repository
+        path = os.path.join(tmp, "bench.snapshot")
+
+        def timed(function):
+            repository.clear_cache()
+            start = time.perf_counter()
+            function()
+            return time.perf_counter() - start
+
+        report("evaluate", rows, timed(lambda: Measurement.selection.evaluate()))
+        report("export_snapshot", rows, timed(lambda: repository.export_snapshot([Measurement], path)))
+        report("import_snapshot", rows, timed(lambda: repository.import_snapshot(path)))
+        report("import_snapshot mmap", rows, timed(lambda: repository.import_snapshot(path, memory_map=True)))
+
+        print(f"snapshot {os.path.getsize(path) / 2 ** 20:.1f} MiB, "
+              f"database {os.path.getsize(os.path.join(tmp, 'bench.db')) / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
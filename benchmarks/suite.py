@@ -0,0 +1,279 @@
+"""Benchmarks of the ORM's hot paths with regression tracking.
+
+Results are written as JSON and compared with a stored baseline; a case
+is reported as regression when its throughput drops by more than the
+tolerance. Runs offline against temporary SQLite files.
+
+Usage:
+    python -m benchmarks.suite [--sizes 1000,100000] [--repeat 3]
+        [--output results.json] [--baseline benchmarks/baseline.json]
+        [--tolerance 0.25] [--only NAME ...] [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from src.connection import SqliteConnection
+from src.model_meta import ModelMeta
+from src.properties import FloatProperty, ForeignKey, IntProperty, ListProperty, PrimaryKey, StringProperty
+from src.query_builder import And, Equals, GreaterThan, LessThan, Or
+from src.repository import SqlRepository
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Cases issuing a query per object are capped, so large sizes stay feasible.
+PER_OBJECT_CAP = 5000
+
+_benchmarks: Dict[str, Callable[[str, int], Tuple[float, int]]] = {}
+
+
+def benchmark(name: str):
+    """Registers a benchmark.
+
+    The function gets a temporary directory and the size, and returns
+    the measured time in seconds and the number of processed operations.
+    """
+
+    def register(function):
+        _benchmarks[name] = function
+        return function
+
+    return register
+
+
+def make_models(db_path: str):
+    class BaseModel(ModelMeta):
+        repository = SqlRepository(SqliteConnection(db_path))
+
+    class Klass(BaseModel):
+        id = PrimaryKey()
+        name = StringProperty()
+
+    class Person(BaseModel):
+        id = PrimaryKey()
+        name = StringProperty()
+        age = IntProperty()
+        height = FloatProperty()
+
+    class Student(BaseModel):
+        id = PrimaryKey()
+        name = StringProperty()
+        klass = ForeignKey(Klass)
+
+    class Course(BaseModel):
+        id = PrimaryKey()
+        name = StringProperty()
+        students = ListProperty(Student)
+
+    for model in (Klass, Person, Student, Course):
+        model.init_class()
+
+    return BaseModel, Klass, Person, Student, Course
+
+
+def seed(db_path: str, size: int, courses: int = 0):
+    conn = sqlite3.connect(db_path)
+    conn.executemany("INSERT INTO Klass (name) VALUES (?)",
+                     ((f"k{i}",) for i in range(max(size // 100, 1))))
+    conn.executemany("INSERT INTO Person (name, age, height) VALUES (?, ?, ?)",
+                     ((f"p{i}", i % 100, i * 0.01) for i in range(size)))
+    conn.executemany("INSERT INTO Student (name, klass) VALUES (?, ?)",
+                     ((f"s{i}", i // 100 + 1) for i in range(size)))
+    conn.executemany("INSERT INTO Course (name) VALUES (?)",
+                     ((f"c{i}",) for i in range(courses)))
+    conn.executemany("INSERT INTO Course_students (Course_id, students_id) VALUES (?, ?)",
+                     ((i // 3 + 1, i % size + 1) for i in range(courses * 3)))
+    conn.commit()
+    conn.close()
+
+
+def timed(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+@benchmark("model_construction")
+def model_construction(tmp: str, size: int):
+    _, _, Person, _, _ = make_models(os.path.join(tmp, "db.db"))
+
+    return timed(lambda: [Person(name="p", age=i, height=1.0) for i in range(size)]), size
+
+
+@benchmark("save_single")
+def save_single(tmp: str, size: int):
+    _, _, Person, _, _ = make_models(os.path.join(tmp, "db.db"))
+    size = min(size, PER_OBJECT_CAP)
+    people = [Person(name="p", age=i, height=1.0) for i in range(size)]
+
+    return timed(lambda: [person.save() for person in people]), size
+
+
+@benchmark("save_bulk")
+def save_bulk(tmp: str, size: int):
+    _, _, Person, _, _ = make_models(os.path.join(tmp, "db.db"))
+    names = ["p"] * size
+    ages = list(range(size))
+
+    return timed(lambda: Person.save_columns(name=names, age=ages)), size
+
+
+@benchmark("evaluate_flat")
+def evaluate_flat(tmp: str, size: int):
+    db_path = os.path.join(tmp, "db.db")
+    _, _, Person, _, _ = make_models(db_path)
+    seed(db_path, size)
+
+    return timed(lambda: Person.selection.evaluate()), size
+
+
+@benchmark("evaluate_foreign_key")
+def evaluate_foreign_key(tmp: str, size: int):
+    db_path = os.path.join(tmp, "db.db")
+    _, _, _, Student, _ = make_models(db_path)
+    seed(db_path, size)
+
+    return timed(lambda: Student.selection.evaluate()), size
+
+
+@benchmark("evaluate_list_property")
+def evaluate_list_property(tmp: str, size: int):
+    db_path = os.path.join(tmp, "db.db")
+    _, _, _, _, Course = make_models(db_path)
+    courses = min(size, PER_OBJECT_CAP)
+    seed(db_path, size, courses)
+
+    return timed(lambda: Course.selection.evaluate()), courses
+
+
+@benchmark("evaluate_cache_hit")
+def evaluate_cache_hit(tmp: str, size: int):
+    db_path = os.path.join(tmp, "db.db")
+    _, _, Person, _, _ = make_models(db_path)
+    seed(db_path, size)
+    Person.selection.evaluate()
+
+    return timed(lambda: Person.selection.evaluate()), size
+
+
+@benchmark("serialize")
+def serialize(tmp: str, size: int):
+    _, _, Person, _, _ = make_models(os.path.join(tmp, "db.db"))
+    condition = Or(And(GreaterThan(Person.age, 18), LessThan(Person.age, 65)),
+                   Equals(Person.name, "x"))
+
+    return timed(lambda: [Person.selection.where(condition).limit(10).serialize() for _ in range(size)]), size
+
+
+@benchmark("init_class")
+def init_class(tmp: str, size: int):
+    class BaseModel(ModelMeta):
+        repository = SqlRepository(SqliteConnection(os.path.join(tmp, "db.db")))
+
+    models = min(size, 200)
+
+    def declare():
+        for i in range(models):
+            model = type(f"Model{i}", (BaseModel,), {
+                "id": PrimaryKey(), "name": StringProperty(), "value": IntProperty()})
+            model.init_class()
+
+    return timed(declare), models
+
+
+def run(names: List[str], sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    for name in names:
+        for size in sizes:
+            best, operations = None, 0
+
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as tmp:
+                    seconds, operations = _benchmarks[name](tmp, size)
+
+                best = seconds if best is None else min(best, seconds)
+
+            key = f"{name}[{size}]"
+            results[key] = {"seconds": best, "operations": operations,
+                            "ops_per_sec": operations / best if best else float("inf")}
+            print(f"{key:<36} {best:10.4f} s {results[key]['ops_per_sec']:14.0f} ops/s", flush=True)
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Returns descriptions of cases slower than baseline by more than the tolerance."""
+
+    regressions = []
+
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+
+        expected = baseline[key]["ops_per_sec"]
+        change = result["ops_per_sec"] / expected - 1
+
+        if change < -tolerance:
+            regressions.append(
+                f"{key}: {result['ops_per_sec']:.0f} ops/s, baseline {expected:.0f} ops/s ({change:+.0%})")
+
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000",
+                        help="comma separated numbers of rows")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", choices=sorted(_benchmarks))
+    parser.add_argument("--output", help="path of JSON file with results")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative drop of throughput")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store results as the new baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(args.only or list(_benchmarks), sizes, args.repeat)
+
+    report = {
+        "meta": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                 "platform": platform.platform(), "sizes": sizes},
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}")
+        return 0
+
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file)["results"], args.tolerance)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
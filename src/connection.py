@@ -1,7 +1,40 @@
+import itertools
+import os
+import pathlib
 import sqlite3
-from typing import List, Tuple
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
 from abc import ABC, abstractmethod
 
+from src import instrumentation
+
+# PRAGMAs applied to every sqlite connection opened with the profile.
+PROFILES: Dict[str, Dict[str, str | int]] = {
+    "default": {},
+    "bulk-load": {
+        "page_size": 16384,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -262144,
+        "temp_store": "MEMORY",
+    },
+    "read-heavy": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+    },
+}
+
+# PRAGMAs which modify the database file rather than the connection.
+_FILE_PRAGMAS = ("page_size", "journal_mode")
+
 
 class Connection(ABC):
     is_connected: bool
@@ -19,7 +52,17 @@ class Connection(ABC):
         ...
 
     @abstractmethod
-    def execute_query(self, query):
+    def execute_query(self, query, params=()):
+        assert self.is_connected, "Database not connected"
+        ...
+
+    @abstractmethod
+    def execute_many(self, query, rows):
+        assert self.is_connected, "Database not connected"
+        ...
+
+    @abstractmethod
+    def fetch_batches(self, query, batch_size: int):
         assert self.is_connected, "Database not connected"
         ...
 
@@ -37,27 +80,267 @@ class Connection(ABC):
 
 
 class SqliteConnection(Connection):
-    _connection_adaptee: sqlite3.Connection
+    _connection_adaptee: sqlite3.Connection | None
+
+    def __init__(self, db_path: str, read_only: bool = False, persistent: bool = False,
+                 profile: str | Dict[str, str | int] = "default") -> None:
+        """Initializes sqlite connection.
+
+        Args:
+            db_path: Path to the database file.
+            read_only: Whether to open the database in read-only mode.
+            persistent: Whether to keep the underlying sqlite connection
+                open between queries. Persistent connections may be used
+                from different threads, one thread at a time.
+            profile: Name of one of PROFILES or a dictionary of PRAGMAs
+                applied on connect. Most PRAGMAs (mmap_size, cache_size)
+                only last as long as the connection, so profiles are
+                meant to be used with persistent connections.
+        """
 
-    def __init__(self, db_path: str) -> None:
         super().__init__(db_path)
+        self.read_only = read_only
+        self.persistent = persistent
+        self._connection_adaptee = None
+        self._depth = 0
+        self._open_time = 0.0
+        self.profile = profile
 
     def set_connection(self, db_path) -> None:
         super().set_connection(db_path)
-        self._connection_adaptee = sqlite3.connect(db_path)
+        self._depth += 1
+
+        if self._connection_adaptee is None:
+            start = time.perf_counter()
+            self._connection_adaptee = self._connect(db_path)
+            self._open_time = time.perf_counter() - start
+
+    @property
+    def profile(self) -> Dict[str, str | int]:
+        """PRAGMAs applied on connect."""
+
+        return self._pragmas
+
+    @profile.setter
+    def profile(self, profile: str | Dict[str, str | int]):
+        if isinstance(profile, str):
+            if profile not in PROFILES:
+                raise ValueError(
+                    f"Unknown connection profile '{profile}'! Available only: {list(PROFILES)}")
+
+            profile = PROFILES[profile]
+
+        self._pragmas = dict(profile)
+
+        # Reconnect with the new PRAGMAs on next use.
+        if self.persistent and not self._depth:
+            self.dispose()
 
-    def execute_query(self, query: str) -> Tuple[List, int]:
-        super().execute_query(query)
+    def _connect(self, db_path) -> sqlite3.Connection:
+        if self.read_only:
+            uri = f"{pathlib.Path(db_path).absolute().as_uri()}?mode=ro"
+            connection = sqlite3.connect(
+                uri, uri=True, check_same_thread=not self.persistent)
+
+        else:
+            connection = sqlite3.connect(
+                db_path, check_same_thread=not self.persistent)
+
+        self._apply_pragmas(connection)
+
+        return connection
+
+    def _apply_pragmas(self, connection: sqlite3.Connection):
+        # page_size has to be set before journal_mode switches to WAL.
+        pragmas = sorted(self._pragmas.items(),
+                         key=lambda item: item[0] not in _FILE_PRAGMAS)
+
+        for name, value in pragmas:
+            if self.read_only and name in _FILE_PRAGMAS:
+                continue
+
+            connection.execute(f"PRAGMA {name}={value}")
+
+    def execute_query(self, query: str, params=()) -> Tuple[List, int]:
+        super().execute_query(query, params)
+        start = time.perf_counter()
         cursor = self._connection_adaptee.cursor()
-        cursor.execute(query)
+        cursor.execute(query, params)
         results = cursor.fetchall()
 
+        if instrumentation.is_enabled():
+            self._publish(query, params, time.perf_counter() - start,
+                          len(results) or max(cursor.rowcount, 0))
+
         if cursor.lastrowid is None:
             return results
 
         return results, cursor.lastrowid
 
+    def execute_many(self, query: str, rows: Iterable[tuple]) -> int:
+        """Executes parametrized query for every row, returns number of changed rows."""
+
+        super().execute_many(query, rows)
+        start = time.perf_counter()
+        cursor = self._connection_adaptee.cursor()
+        cursor.executemany(query, rows)
+
+        if instrumentation.is_enabled():
+            self._publish(query, "executemany", time.perf_counter() - start, cursor.rowcount)
+
+        return cursor.rowcount
+
+    def fetch_batches(self, query: str, batch_size: int) -> Iterator[List[tuple]]:
+        """Yields results of the query in batches fetched from the cursor."""
+
+        super().fetch_batches(query, batch_size)
+        start = time.perf_counter()
+        cursor = self._connection_adaptee.cursor()
+        cursor.execute(query)
+        rows = 0
+
+        try:
+            while batch := cursor.fetchmany(batch_size):
+                rows += len(batch)
+                yield batch
+
+        finally:
+            if instrumentation.is_enabled():
+                self._publish(query, (), time.perf_counter() - start, rows)
+
+    def backup(self, target: sqlite3.Connection):
+        """Copies content of the database into the target connection."""
+
+        with self:
+            self._connection_adaptee.backup(target)
+
+    def _publish(self, query, params, duration: float, rows: int):
+        instrumentation.publish_query(
+            query, params, duration, rows, self._open_time, self.db_path)
+        self._open_time = 0.0
+
     def close_connection(self) -> None:
         super().close_connection()
+        self._depth -= 1
         self._connection_adaptee.commit()
-        self._connection_adaptee.close()
+
+        # Nested usage (e.g. a write while iterating over results)
+        # must not close the connection under the outer block.
+        if self._depth:
+            self.is_connected = True
+
+        elif not self.persistent:
+            self.dispose()
+
+    def dispose(self) -> None:
+        """Closes the underlying sqlite connection, even if it is persistent."""
+
+        if self._connection_adaptee is not None:
+            self._connection_adaptee.close()
+            self._connection_adaptee = None
+
+
+class MemorySqliteConnection(SqliteConnection):
+    """Connection to a shared in-memory sqlite database.
+
+    The database lives as long as this connection object is open, and
+    can be opened by other connections through the same URI. Snapshots
+    taken with the sqlite backup API allow cloning a seeded database
+    in milliseconds, e.g. to reset it between tests.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, name: str | None = None,
+                 profile: str | Dict[str, str | int] = "default") -> None:
+        """Initializes connection and creates the database.
+
+        Args:
+            name: Name of the database, connections with the same name share
+                it. Unique name is generated by default.
+            profile: Name of one of PROFILES or a dictionary of PRAGMAs.
+        """
+
+        name = name or f"memory-{os.getpid()}-{next(self._counter)}"
+        super().__init__(f"file:{name}?mode=memory&cache=shared",
+                         persistent=True, profile=profile)
+        self._lock = threading.RLock()
+        self._connection_adaptee = self._connect(self.db_path)
+
+    @classmethod
+    def from_file(cls, db_path: str, name: str | None = None) -> "MemorySqliteConnection":
+        """Creates in-memory copy of a database file, e.g. as a hot read tier."""
+
+        connection = cls(name)
+        connection.load(db_path)
+
+        return connection
+
+    def _connect(self, db_path) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            db_path, uri=True, check_same_thread=False)
+        self._apply_pragmas(connection)
+
+        return connection
+
+    def set_connection(self, db_path) -> None:
+        self._lock.acquire()
+        super().set_connection(db_path)
+
+    def close_connection(self) -> None:
+        try:
+            super().close_connection()
+
+        finally:
+            self._lock.release()
+
+    def dispose(self) -> None:
+        """Keeps the database, which would be lost with its last connection.
+
+        Use close() to drop the database.
+        """
+
+    def close(self) -> None:
+        """Closes the connection, dropping the database if no one else uses it."""
+
+        super().dispose()
+
+    def snapshot(self) -> sqlite3.Connection:
+        """Returns private in-memory copy of the database."""
+
+        snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+        self.backup(snapshot)
+
+        return snapshot
+
+    def restore(self, snapshot: sqlite3.Connection):
+        """Replaces content of the database with the snapshot.
+
+        Objects cached by repositories using this connection have to be
+        cleared with SqlRepository.clear_cache().
+        """
+
+        with self._lock:
+            snapshot.backup(self._connection_adaptee)
+
+    def load(self, db_path: str):
+        """Replaces content of the database with content of a database file."""
+
+        source = sqlite3.connect(db_path)
+
+        try:
+            self.restore(source)
+
+        finally:
+            source.close()
+
+    def save(self, db_path: str):
+        """Writes content of the database to a database file."""
+
+        target = sqlite3.connect(db_path)
+
+        try:
+            self.backup(target)
+
+        finally:
+            target.close()
@@ -0,0 +1,184 @@
+import re
+import sqlite3
+import threading
+import warnings
+from contextlib import closing
+from typing import Dict, List, Tuple
+
+from src import instrumentation
+from src import properties
+from src.static_storage import StaticStorage
+
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+
+class FullScanWarning(UserWarning):
+    """Warns about a query scanning whole table."""
+
+
+class FullScanError(Exception):
+    """Raised when a query scans whole table in strict mode."""
+
+
+class QueryPlan:
+    """Query plan of a single statement."""
+
+    def __init__(self, statement: str, details: List[str]):
+        self.statement = statement
+        self.details = details
+
+    @property
+    def full_scans(self) -> List[str]:
+        """Returns names of tables scanned without using any index."""
+
+        scans = [_SCAN.match(detail) for detail in self.details]
+
+        return [scan.group(1) for scan, detail in zip(scans, self.details)
+                if scan is not None and "INDEX" not in detail]
+
+    def suggest_indexes(self) -> List[str]:
+        """Returns statements creating indexes which could avoid the full scans."""
+
+        return [suggestion for table in self.full_scans
+                for suggestion in suggest_indexes(table, self.statement)]
+
+    def __repr__(self):
+        details = "\n  ".join(self.details)
+        return f"{self.statement.strip()}\n  {details}"
+
+
+def suggest_indexes(table: str, statement: str) -> List[str]:
+    """Returns statements creating indexes on columns of the table filtered by the statement.
+
+    Candidate columns are derived from the properties of models stored in
+    the table, and from the columns of join tables of list properties.
+    """
+
+    _, _, condition = statement.partition("WHERE")
+    columns = []
+
+    for model in StaticStorage.get_models():
+        if model.table_name == table:
+            columns += [prop.name for prop in model.properties if not isinstance(
+                prop, (properties.ListProperty, properties.PrimaryKey))]
+
+        for prop in model.list_properties:
+            if f"{model.table_name}_{prop.name}" == table:
+                columns += [f"{model.table_name}_id", f"{prop.name}_id"]
+
+    filtered = [column for column in dict.fromkeys(columns)
+                if re.search(rf"\b{column}\b", condition)]
+
+    return [f"CREATE INDEX ix_{table}_{column} ON {table} ({column})" for column in filtered]
+
+
+class FullScanChecker:
+    """Development-mode check of queries executed by a repository.
+
+    Every SELECT is explained and a FullScanWarning is issued (or
+    FullScanError raised) when it scans a table with more rows than the
+    threshold. Messages contain suggested indexes.
+    """
+
+    def __init__(self, repository: "SqlRepository", threshold: int = 1000, strict: bool = False):
+        """Initializes checker.
+
+        Args:
+            repository: Repository whose queries are checked, on any of its
+                connections (see SqlRepository.db_paths), e.g. shards or
+                replicas.
+            threshold: Number of rows from which scanning a table is reported.
+            strict: Whether to raise FullScanError instead of warning.
+        """
+
+        self.repository = repository
+        self.threshold = threshold
+        self.strict = strict
+        self._row_counts: Dict[Tuple[str | None, str], int] = {}
+        self._checking = threading.local()
+
+    def attach(self):
+        """Starts checking queries."""
+
+        instrumentation.subscribe(instrumentation.QUERY, self)
+
+    def detach(self):
+        """Stops checking queries."""
+
+        instrumentation.unsubscribe(instrumentation.QUERY, self)
+
+    def reset(self):
+        """Forgets cached row counts of tables."""
+
+        self._row_counts.clear()
+
+    def __call__(self, event: instrumentation.QueryEvent):
+        if getattr(self._checking, "active", False):
+            return
+
+        if event.db_path not in self.repository.db_paths:
+            return
+
+        if not event.statement.lstrip().upper().startswith("SELECT"):
+            return
+
+        self._checking.active = True
+
+        try:
+            # The statement is explained on its own database through a separate connection,
+            # as the repository's connections and threads may be busy, e.g. with queries of
+            # other shards.
+            with closing(_connect(event.db_path)) as connection:
+                rows = connection.execute(f"EXPLAIN QUERY PLAN {event.statement}", event.params).fetchall()
+
+            self.check(QueryPlan(event.statement, [row[-1] for row in rows]), event.db_path)
+
+        finally:
+            self._checking.active = False
+
+    def check(self, plan: QueryPlan, db_path: str | None = None):
+        """Reports full scans of large tables in the plan.
+
+        Args:
+            plan: Plan of a statement.
+            db_path: Path of the database the statement was executed on,
+                whose tables are counted. By default tables are counted
+                through the repository.
+        """
+
+        for table in plan.full_scans:
+            row_count = self._row_count(table, db_path)
+
+            if row_count <= self.threshold:
+                continue
+
+            suggestions = suggest_indexes(table, plan.statement)
+            message = f"Query scans table {table} ({row_count} rows): {plan.statement.strip()}"
+
+            if suggestions:
+                message += "\nSuggested indexes:\n  " + "\n  ".join(suggestions)
+
+            if self.strict:
+                raise FullScanError(message)
+
+            warnings.warn(message, FullScanWarning, stacklevel=2)
+
+    def _row_count(self, table: str, db_path: str | None = None) -> int:
+        key = (db_path, table)
+
+        if key not in self._row_counts:
+            query = f"SELECT COUNT(*) FROM {table}"
+
+            if db_path is None:
+                self._row_counts[key] = self.repository.get_rows(query)[0][0]
+
+            else:
+                with closing(_connect(db_path)) as connection:
+                    self._row_counts[key] = connection.execute(query).fetchone()[0]
+
+        return self._row_counts[key]
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # In-memory databases are shared through URIs.
+    return sqlite3.connect(db_path, uri=db_path.startswith("file:"))
@@ -0,0 +1,143 @@
+"""Streaming writers of selected rows and objects.
+
+Rows are written batch by batch as they are fetched from the cursor, so
+only one batch is kept in memory. The columnar format is a snapshot file
+(see src.snapshot) with a row group per batch, each stored as a table
+{"table": <table name>, "columns": {...}}.
+"""
+
+import csv
+import json
+from typing import Iterable, Iterator, List, Sequence, TextIO
+
+from src import serialization
+from src import snapshot
+
+FORMATS = ("csv", "jsonl", "json", "columnar")
+COMPRESSIONS = ("gzip", "bz2", "xz")
+
+
+def open_text(path: str, compression: str | None = None) -> TextIO:
+    """Opens a text file for writing, compressed with gzip, bz2 or xz.
+
+    Raises:
+        ValueError: If the compression isn't supported.
+    """
+
+    if compression is None:
+        return open(path, "w", newline="", encoding="utf-8")
+
+    # Compression modules are imported only when used.
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+
+    if compression == "bz2":
+        import bz2
+        return bz2.open(path, "wt", newline="", encoding="utf-8")
+
+    if compression == "xz":
+        import lzma
+        return lzma.open(path, "wt", newline="", encoding="utf-8")
+
+    raise ValueError(f"Unsupported compression '{compression}'! Available only: {list(COMPRESSIONS)}")
+
+
+def write_rows(batches: Iterable[Sequence[tuple]], names: List[str], file: TextIO, format: str) -> int:
+    """Writes batches of rows to the file.
+
+    Args:
+        batches: Batches of rows, e.g. Repository.iter_rows().
+        names: Names of the columns of the rows.
+        file: Text file the rows are written to.
+        format: "csv" (with a header, NULLs as empty fields), "jsonl" (an
+            object per line) or "json" (an array of objects).
+
+    Returns:
+        Number of written rows.
+    """
+
+    count = 0
+
+    if format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(names)
+
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+
+        return count
+
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    if format == "jsonl":
+        for rows in batches:
+            file.write("".join(encode(dict(zip(names, row))) + "\n" for row in rows))
+            count += len(rows)
+
+        return count
+
+    if format == "json":
+        file.write("[")
+
+        for rows in batches:
+            if rows:
+                file.write(("," if count else "") + ",".join(encode(dict(zip(names, row))) for row in rows))
+                count += len(rows)
+
+        file.write("]")
+
+        return count
+
+    raise ValueError(f"Unsupported format '{format}'! Available only: {list(FORMATS)}")
+
+
+def write_columnar(batches: Iterable[Sequence[tuple]], names: List[str], path: str, table_name: str) -> int:
+    """Writes batches of rows to a snapshot file, a row group per batch.
+
+    Returns:
+        Number of written rows.
+    """
+
+    count = 0
+
+    def row_groups() -> Iterator[dict]:
+        nonlocal count
+
+        for rows in batches:
+            if rows:
+                count += len(rows)
+                yield {"table": table_name, "columns": dict(zip(names, map(list, zip(*rows))))}
+
+    snapshot.write(path, row_groups())
+
+    return count
+
+
+def write_objects(objects: Iterable["ModelMeta"], file: TextIO, format: str,
+                  depth: int | None = None, fields: Iterable[str] | None = None) -> int:
+    """Writes objects with their related objects (see serialization.Serializer).
+
+    Args:
+        format: "jsonl" or "json", other formats can't nest related objects.
+
+    Returns:
+        Number of written objects.
+    """
+
+    if format == "json":
+        return serialization.write_json(objects, file, depth, fields)
+
+    if format != "jsonl":
+        raise ValueError(f"Related objects can't be exported to format '{format}'!")
+
+    serializer = serialization.Serializer(depth, fields)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    count = 0
+
+    for obj in objects:
+        file.write(encode(serializer.to_dict(obj)) + "\n")
+        count += 1
+
+    return count
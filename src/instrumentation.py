@@ -0,0 +1,298 @@
+"""Hooks for observing statements sent to the database."""
+
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+QUERY = "query"
+EVALUATE = "evaluate"
+
+_subscribers: Dict[str, List[Callable]] = {QUERY: [], EVALUATE: []}
+_scopes: contextvars.ContextVar[Tuple["_Scope", ...]] = contextvars.ContextVar(
+    "instrumentation_scopes", default=())
+
+
+class QueryEvent:
+    """Describes a single statement executed by a connection."""
+
+    def __init__(self, statement: str, params: Any, duration: float, rows: int,
+                 connection_open_time: float, origin: str | None, db_path: str):
+        self.statement = statement
+        self.params = params
+        self.duration = duration
+        self.rows = rows
+        self.connection_open_time = connection_open_time
+        self.origin = origin
+        self.db_path = db_path
+
+    def __repr__(self):
+        return (f"QueryEvent(origin={self.origin}, duration={self.duration:.6f}, "
+                f"rows={self.rows}, statement={self.statement!r})")
+
+
+class EvaluateEvent:
+    """Describes a single QueryBuilder.evaluate call."""
+
+    def __init__(self, model: type["ModelMeta"], duration: float, statements: int, objects: int):
+        self.model = model
+        self.duration = duration
+        self.statements = statements
+        self.objects = objects
+
+    def __repr__(self):
+        return (f"EvaluateEvent(model={self.model.__name__}, duration={self.duration:.6f}, "
+                f"statements={self.statements}, objects={self.objects})")
+
+
+class _Scope:
+    def __init__(self, origin: str | None, events: List[QueryEvent] | None = None):
+        self.origin = origin
+        self.statements = 0
+        self.objects = 0
+        self.events = events
+
+
+def subscribe(event: str, callback: Callable):
+    """Registers callback called with every event of the given kind.
+
+    Args:
+        event: Either QUERY or EVALUATE.
+        callback: Callable taking the event object.
+    """
+
+    _subscribers[event].append(callback)
+
+
+def unsubscribe(event: str, callback: Callable):
+    """Removes previously registered callback."""
+
+    _subscribers[event].remove(callback)
+
+
+@contextmanager
+def subscribed(event: str, callback: Callable):
+    """Registers callback for the duration of the block."""
+
+    subscribe(event, callback)
+
+    try:
+        yield callback
+
+    finally:
+        unsubscribe(event, callback)
+
+
+def is_enabled() -> bool:
+    """Returns whether anybody listens to events or counts statements."""
+
+    return bool(_subscribers[QUERY] or _subscribers[EVALUATE] or _scopes.get())
+
+
+@contextmanager
+def origin(name: str):
+    """Marks statements executed within the block as coming from the origin.
+
+    Origins nest, statements are attributed to the innermost one.
+    """
+
+    scope = _Scope(name)
+    token = _scopes.set(_scopes.get() + (scope,))
+
+    try:
+        yield scope
+
+    finally:
+        _scopes.reset(token)
+
+
+@contextmanager
+def capture():
+    """Collects QueryEvents of statements executed within the block.
+
+    Only statements executed in the current thread (or context) are
+    collected, so concurrent work doesn't leak into the list.
+    """
+
+    events: List[QueryEvent] = []
+    token = _scopes.set(_scopes.get() + (_Scope(None, events),))
+
+    try:
+        yield events
+
+    finally:
+        _scopes.reset(token)
+
+
+def current_origin() -> str | None:
+    for scope in reversed(_scopes.get()):
+        if scope.origin is not None:
+            return scope.origin
+
+    return None
+
+
+def publish_query(statement: str, params: Any, duration: float, rows: int,
+                  connection_open_time: float = 0.0, db_path: str = ""):
+    """Publishes QueryEvent, called by connections after executing a statement."""
+
+    capturing = []
+
+    for scope in _scopes.get():
+        scope.statements += 1
+
+        if scope.events is not None:
+            capturing.append(scope.events)
+
+    if not _subscribers[QUERY] and not capturing:
+        return
+
+    event = QueryEvent(statement, params, duration, rows, connection_open_time,
+                       current_origin(), db_path)
+
+    for events in capturing:
+        events.append(event)
+
+    for callback in list(_subscribers[QUERY]):
+        callback(event)
+
+
+@contextmanager
+def evaluating(model: type["ModelMeta"]):
+    """Publishes EvaluateEvent describing statements executed within the block.
+
+    Number of evaluated objects has to be stored in the `objects`
+    attribute of the yielded scope.
+    """
+
+    if not is_enabled():
+        yield _Scope(EVALUATE)
+        return
+
+    start = time.perf_counter()
+
+    with origin(EVALUATE) as scope:
+        yield scope
+
+    event = EvaluateEvent(model, time.perf_counter() - start,
+                          scope.statements, scope.objects)
+
+    for callback in list(_subscribers[EVALUATE]):
+        callback(event)
+
+
+class Histogram:
+    """Histogram of observed values with fixed bucket boundaries."""
+
+    DEFAULT_BOUNDARIES = (0.0001, 0.0005, 0.001, 0.005, 0.01,
+                          0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, boundaries: Tuple[float, ...] = DEFAULT_BOUNDARIES):
+        self.boundaries = boundaries
+        self.buckets = [0] * (len(boundaries) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.boundaries, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "total": self.total, "mean": self.mean,
+                "max": self.max, "buckets": dict(zip(
+                    [*map(str, self.boundaries), "inf"], self.buckets))}
+
+
+class MetricsRegistry:
+    """In-process counters and histograms fed by instrumentation events."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, boundaries: Tuple[float, ...] | None = None):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(
+                    boundaries or Histogram.DEFAULT_BOUNDARIES)
+
+            self.histograms[name].observe(value)
+
+    def record_query(self, event: QueryEvent):
+        self.increment("queries")
+        self.increment(f"queries.{event.origin}")
+        self.increment("rows", event.rows)
+        self.observe("query_duration", event.duration)
+        self.observe(f"query_duration.{event.origin}", event.duration)
+
+        if event.connection_open_time:
+            self.observe("connection_open_time", event.connection_open_time)
+
+    def record_evaluate(self, event: EvaluateEvent):
+        self.increment("evaluations")
+        self.observe("evaluate_duration", event.duration)
+        self.observe(f"evaluate_statements.{event.model.__name__}", event.statements,
+                     (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024))
+
+    def attach(self):
+        """Subscribes the registry to instrumentation events."""
+
+        subscribe(QUERY, self.record_query)
+        subscribe(EVALUATE, self.record_evaluate)
+
+    def detach(self):
+        """Unsubscribes the registry from instrumentation events."""
+
+        unsubscribe(QUERY, self.record_query)
+        unsubscribe(EVALUATE, self.record_evaluate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns copy of all metrics."""
+
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()}}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class SlowQueryLog:
+    """Logs statements taking longer than the threshold.
+
+    Subscribe an instance to QUERY events to enable it.
+    """
+
+    def __init__(self, threshold: float = 0.1, logger: logging.Logger | None = None):
+        """Initializes the log.
+
+        Args:
+            threshold: Duration in seconds from which statements are logged.
+            logger: Logger to be used, 'src.slow_queries' by default.
+        """
+
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger("src.slow_queries")
+
+    def __call__(self, event: QueryEvent):
+        if event.duration >= self.threshold:
+            self.logger.warning("slow query (%.3f s, %d rows, origin=%s): %s %s",
+                                event.duration, event.rows, event.origin,
+                                event.statement, event.params or "")
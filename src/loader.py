@@ -0,0 +1,195 @@
+import csv
+import json
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from src import properties
+from src import query_builder
+
+# Rejected rows are counted, but only the first ones are described.
+MAX_ERRORS = 100
+
+
+class LoadReport:
+    """Result of loading rows from a file."""
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.rejected = 0
+        self.errors: List[Tuple[int, str]] = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line: int, message: str):
+        """Counts a rejected row, described by the number of its line."""
+
+        self.rejected += 1
+
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __repr__(self):
+        return (f"LoadReport(rows={self.rows}, rejected={self.rejected}, "
+                f"elapsed={self.elapsed:.3f}s, rows_per_second={self.rows_per_second:.0f})")
+
+
+def load_csv(model: type["ModelMeta"], path: str, chunk_size: int = 50000, **reader_options) -> LoadReport:
+    """Loads rows of a CSV file with a header naming properties of the model.
+
+    Empty fields of numeric properties and foreign keys are loaded as NULL.
+
+    Args:
+        reader_options: Passed to csv.DictReader, e.g. delimiter.
+
+    Raises:
+        ValueError: If the header names columns which aren't stored
+            properties of the model.
+    """
+
+    with open(path, newline="") as file:
+        reader = csv.DictReader(file, **reader_options)
+        model._check_columns(reader.fieldnames or [])
+
+        return load(model, ((reader.line_num, record) for record in reader), chunk_size)
+
+
+def load_jsonl(model: type["ModelMeta"], path: str, chunk_size: int = 50000) -> LoadReport:
+    """Loads rows of a JSON Lines file, an object named after properties of the model per line."""
+
+    def records() -> Iterator[Tuple[int, Any]]:
+        with open(path) as file:
+            for line, text in enumerate(file, 1):
+                if not text.strip():
+                    continue
+
+                try:
+                    yield line, json.loads(text)
+
+                except json.JSONDecodeError as error:
+                    yield line, error
+
+    return load(model, records(), chunk_size)
+
+
+def load(model: type["ModelMeta"], records: Iterable[Tuple[int, Any]], chunk_size: int = 50000) -> LoadReport:
+    """Saves records streamed in chunks, each chunk in a single transaction.
+
+    Values are converted to types of the properties. Records with values
+    which can't be converted, or referencing objects which don't exist
+    (foreign keys are given as ids), are rejected.
+
+    Args:
+        model: Model of the loaded rows.
+        records: Line numbers and dicts of values named after stored
+            properties. Other values are rejected.
+        chunk_size: Number of rows written in a transaction.
+
+    Returns:
+        Report of loaded and rejected rows.
+    """
+
+    start = time.perf_counter()
+    report = LoadReport()
+    converters = {prop.name: _converter(prop) for prop in query_builder._stored_properties(model)}
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+
+    for line, record in records:
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(str(record))
+
+            if not isinstance(record, dict):
+                raise ValueError("Row isn't an object!")
+
+            values = {name: converters[name](value) for name, value in record.items() if name in converters}
+
+            if len(values) < len(record):
+                raise ValueError(f"Unknown columns: {[name for name in record if name not in converters]}")
+
+        except (ValueError, TypeError, OverflowError) as error:
+            report.reject(line, str(error))
+            continue
+
+        chunk.append((line, values))
+
+        if len(chunk) >= chunk_size:
+            _save(model, chunk, report)
+            chunk = []
+
+    if chunk:
+        _save(model, chunk, report)
+
+    report.elapsed = time.perf_counter() - start
+
+    return report
+
+
+def _save(model: type["ModelMeta"], chunk: List[Tuple[int, Dict[str, Any]]], report: LoadReport):
+    for prop in model.foreign_keys:
+        ids = {values.get(prop.name) for _, values in chunk} - {None}
+
+        if not ids:
+            continue
+
+        referenced = prop.referenced_type
+        primary_key = referenced.primary_key
+        existing = set(referenced.selection.where(
+            query_builder.IsIn(primary_key, list(ids))).columns(primary_key)[primary_key.name])
+        missing = ids - existing
+
+        if missing:
+            for line, values in chunk:
+                if values.get(prop.name) in missing:
+                    report.reject(line, f"No {referenced.__name__} with id {values[prop.name]} referenced by '{prop.name}'!")
+
+            chunk = [(line, values) for line, values in chunk if values.get(prop.name) not in missing]
+
+    # Rows of JSON Lines may name different columns.
+    groups: Dict[tuple, List[Dict[str, Any]]] = dict()
+
+    for _, values in chunk:
+        groups.setdefault(tuple(values), []).append(values)
+
+    for names, rows in groups.items():
+        if not names:
+            continue
+
+        columns = {name: [values[name] for values in rows] for name in names}
+        report.rows += model.repository.insert_columns(model, columns)
+
+
+def _converter(prop: properties.Property) -> Callable[[Any], Any]:
+    if isinstance(prop, (properties.IntProperty, properties.PrimaryKey, properties.ForeignKey)):
+        return _to_int
+
+    if isinstance(prop, properties.FloatProperty):
+        return _to_float
+
+    return _to_str
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"Invalid integer: {value!r}")
+
+    return int(value)
+
+
+def _to_float(value):
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid number: {value!r}")
+
+    return float(value)
+
+
+def _to_str(value):
+    return None if value is None else str(value)
@@ -0,0 +1,296 @@
+from abc import ABC, abstractmethod
+import bisect
+import sys
+from typing import Any, Dict, Iterable, List, Set
+
+from src import properties
+from src import query_components
+
+
+class MemoryIndex(ABC):
+    """Index of cached objects of a fully cached model by value of a property.
+
+    Objects are indexed by values saved to the database; NULLs are not
+    indexed, as comparisons with NULL never match.
+    """
+
+    kind = ""
+
+    def __init__(self, prop: properties.Property) -> None:
+        """Initializes index.
+
+        Args:
+            prop: Indexed property.
+        """
+
+        if isinstance(prop, properties.ListProperty):
+            raise ValueError(f"ListProperty '{prop.name}' can't be indexed!")
+
+        self.property = prop
+        self.hits = 0
+        self._keys: Dict[int, Any] = dict()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def key(self, obj: "ModelMeta"):
+        """Returns value of the indexed property of the object."""
+
+        value = obj.__dict__.get(self.property.name)
+
+        if isinstance(self.property, properties.ForeignKey) and value is not None and not isinstance(value, (int, str)):
+            return getattr(value, value.primary_key.name)
+
+        return value
+
+    def add(self, id: int, obj: "ModelMeta"):
+        """Adds the object, replacing the previous entry of its id."""
+
+        self.remove(id)
+        key = self.key(obj)
+
+        if key is not None:
+            self._keys[id] = key
+            self._insert(id, key)
+
+    def remove(self, id: int):
+        """Removes entry of the object with the id."""
+
+        if id in self._keys:
+            self._delete(id, self._keys.pop(id))
+
+    @abstractmethod
+    def lookup(self, operator: str, value) -> Set[int] | None:
+        """Returns ids of objects satisfying the comparison of the property with the value.
+
+        Args:
+            operator: One of "=", ">", "<" or "IN" (value is then a list).
+
+        Returns:
+            Set of ids, or None if the index can't answer the comparison.
+        """
+
+        ...
+
+    def memory(self) -> int:
+        """Returns approximate number of bytes used by the index."""
+
+        return sys.getsizeof(self._keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "property": self.property.name,
+            "kind": self.kind,
+            "entries": len(self),
+            "hits": self.hits,
+            "memory_bytes": self.memory(),
+        }
+
+    @abstractmethod
+    def _insert(self, id: int, key):
+        ...
+
+    @abstractmethod
+    def _delete(self, id: int, key):
+        ...
+
+
+class HashIndex(MemoryIndex):
+    """Index answering equality and IN comparisons."""
+
+    kind = "hash"
+
+    def __init__(self, prop: properties.Property) -> None:
+        super().__init__(prop)
+        self._ids: Dict[Any, Set[int]] = dict()
+
+    def lookup(self, operator: str, value) -> Set[int] | None:
+        if operator == "=":
+            return set(self._ids.get(value, ()))
+
+        if operator == "IN":
+            return set().union(*[self._ids.get(v, ()) for v in value])
+
+        return None
+
+    def memory(self) -> int:
+        return super().memory() + sys.getsizeof(self._ids) + sum(sys.getsizeof(ids) for ids in self._ids.values())
+
+    def _insert(self, id: int, key):
+        self._ids.setdefault(key, set()).add(id)
+
+    def _delete(self, id: int, key):
+        ids = self._ids[key]
+        ids.discard(id)
+
+        if not ids:
+            del self._ids[key]
+
+
+class SortedIndex(MemoryIndex):
+    """Index answering range, equality and IN comparisons by bisection."""
+
+    kind = "sorted"
+
+    def __init__(self, prop: properties.Property) -> None:
+        super().__init__(prop)
+        self._sorted_keys: List[Any] = []
+        self._sorted_ids: List[int] = []
+
+    def lookup(self, operator: str, value) -> Set[int] | None:
+        keys = self._sorted_keys
+
+        if operator == "=":
+            return set(self._sorted_ids[bisect.bisect_left(keys, value):bisect.bisect_right(keys, value)])
+
+        if operator == "IN":
+            return set().union(*[self.lookup("=", v) for v in value])
+
+        if operator == ">":
+            return set(self._sorted_ids[bisect.bisect_right(keys, value):])
+
+        if operator == "<":
+            return set(self._sorted_ids[:bisect.bisect_left(keys, value)])
+
+        return None
+
+    def memory(self) -> int:
+        return super().memory() + sys.getsizeof(self._sorted_keys) + sys.getsizeof(self._sorted_ids)
+
+    def _insert(self, id: int, key):
+        position = bisect.bisect_right(self._sorted_keys, key)
+        self._sorted_keys.insert(position, key)
+        self._sorted_ids.insert(position, id)
+
+    def _delete(self, id: int, key):
+        position = bisect.bisect_left(self._sorted_keys, key)
+
+        while self._sorted_ids[position] != id:
+            position += 1
+
+        del self._sorted_keys[position]
+        del self._sorted_ids[position]
+
+
+_FLIPPED = {"=": "=", ">": "<", "<": ">"}
+
+
+class ModelIndexes:
+    """Indexes of a fully cached model, narrowing in-memory selections.
+
+    Values saved to the database are kept for every object too, so that
+    selections don't see changes which aren't saved yet, like SQL.
+    """
+
+    def __init__(self, indexes: Iterable[MemoryIndex]) -> None:
+        self.selections = 0
+        self._indexes: Dict[str, List[MemoryIndex]] = dict()
+        self._saved: Dict[int, Dict[str, Any]] = dict()
+
+        for index in indexes:
+            self._indexes.setdefault(index.property.name, []).append(index)
+
+    def __iter__(self):
+        for indexes in self._indexes.values():
+            yield from indexes
+
+    def add(self, id: int, obj: "ModelMeta"):
+        self._saved[id] = dict(obj.__dict__)
+
+        for index in self:
+            index.add(id, obj)
+
+    def remove(self, id: int):
+        self._saved.pop(id, None)
+
+        for index in self:
+            index.remove(id)
+
+    def saved_values(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """Returns values of the objects with the ids as they were last saved or loaded."""
+
+        saved = self._saved
+
+        return [saved[id] for id in ids]
+
+    def candidates(self, condition: query_components.QueryComponent) -> Set[int] | None:
+        """Returns ids of objects which may satisfy the condition.
+
+        Returns:
+            Set of ids, or None if no index applies and all objects have
+            to be scanned.
+        """
+
+        self.selections += 1
+        used: Set[MemoryIndex] = set()
+        ids = self._candidates(condition, used)
+
+        for index in used:
+            index.hits += 1
+
+        return ids
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Returns statistics of the indexes.
+
+        Hit rate of an index is the share of in-memory selections of the
+        model it was used for.
+        """
+
+        return [
+            {**index.stats(), "hit_rate": index.hits / self.selections if self.selections else 0.0}
+            for index in self
+        ]
+
+    def _candidates(self, condition, used: Set[MemoryIndex]) -> Set[int] | None:
+        if isinstance(condition, query_components.LogicalOperation):
+            left = self._candidates(condition.left, used)
+            right = self._candidates(condition.right, used)
+
+            if condition.operator == "AND":
+                if left is None or right is None:
+                    return right if left is None else left
+
+                return left & right
+
+            return None if left is None or right is None else left | right
+
+        if not isinstance(condition, query_components.Comparison):
+            return None
+
+        left, right, operator = condition.left, condition.right, condition.operator
+
+        if _property(right) is not None and operator in _FLIPPED:
+            left, right, operator = right, left, _FLIPPED[operator]
+
+        prop = _property(left)
+
+        if prop is None or not isinstance(right, query_components.Scalar):
+            return None
+
+        value = right.value
+
+        if isinstance(value, list):
+            value = [v.value for v in value]
+
+            if any(isinstance(v, properties.Property) for v in value):
+                return None
+
+        elif isinstance(value, properties.Property):
+            return None
+
+        for index in self._indexes.get(prop.name, ()):
+            ids = index.lookup(operator, value)
+
+            if ids is not None:
+                used.add(index)
+                return ids
+
+        return None
+
+
+def _property(component) -> properties.Property | None:
+    if isinstance(component, query_components.Scalar) and isinstance(component.value, properties.Property):
+        return component.value
+
+    return None
@@ -1,11 +1,13 @@
+import json
 from typing import List, Dict, Any
 
-import yaml
-
 from src.repository import Repository
 from src import properties as properties_m
 from src import query_builder
+from src import serialization
 from src import static_storage
+from src import instrumentation
+from src import loader
 
 
 class ModelMeta:
@@ -31,6 +33,67 @@ class ModelMeta:
             )
 
     def __repr__(self):
+        """Returns values of properties, e.g. Student(indexx=123, class_=StudentsClass(id=1, name=3A), ...).
+
+        Objects referenced by foreign keys are shown with their values, and
+        objects they reference, as well as objects of list properties, only
+        with their primary keys.
+        """
+
+        return self._repr(nested=True)
+
+    def _repr(self, nested: bool) -> str:
+        values = []
+
+        for prop in self.properties:
+            value = self.__dict__.get(prop.name, prop.get_default())
+
+            if isinstance(value, ModelMeta):
+                value = value._repr(nested=False) if nested else value._repr_key()
+
+            elif isinstance(prop, properties_m.ListProperty) and isinstance(value, list):
+                value = f"[{', '.join(v._repr_key() if isinstance(v, ModelMeta) else str(v) for v in value)}]"
+
+            values.append(f"{prop.name}={value}")
+
+        return f"{self.__class__.__name__}({', '.join(values)})"
+
+    def _repr_key(self) -> str:
+        key = self.primary_key.name
+
+        return f"{self.__class__.__name__}({key}={self.__dict__.get(key)})"
+
+    def to_dict(self, depth: int | None = None, fields: List[str] | None = None) -> Dict[str, Any]:
+        """Returns values of properties by their names, with related objects as dicts.
+
+        Objects referenced more than once (also cyclically) are serialized
+        the first time and then replaced by {"$ref": <class name>, <primary
+        key>: <id>}.
+
+        Args:
+            depth: Number of levels of related objects serialized as dicts,
+                deeper ones are replaced by their primary keys.
+            fields: Names of serialized properties, nested ones separated
+                by "__", e.g. ["name", "class___name"].
+        """
+
+        return serialization.Serializer(depth, fields).to_dict(self)
+
+    def to_json(self, depth: int | None = None, fields: List[str] | None = None, **kwargs) -> str:
+        """Returns JSON representation of to_dict(depth, fields).
+
+        **kwargs: Passed to json.dumps.
+        """
+
+        return json.dumps(self.to_dict(depth, fields), **kwargs)
+
+    def to_yaml(self) -> str:
+        """Returns YAML representation of the object, including related objects.
+
+        Requires PyYAML.
+        """
+
+        import yaml
 
         return yaml.dump(self._get_as_yaml())
 
@@ -46,7 +109,7 @@ class ModelMeta:
                 value = self.__dict__[prop.name]
 
                 if isinstance(value, ModelMeta):
-                    stringified_values[prop.name] = value.__repr__()
+                    stringified_values[prop.name] = value._get_as_yaml()
 
                 elif isinstance(value, list):
                     stringified_values[prop.name] = [
@@ -161,7 +224,8 @@ class ModelMeta:
 
         cls._assign_self_to_props()
 
-        cls.repository.migrate(cls)
+        with instrumentation.origin("migrate"):
+            cls.repository.migrate(cls)
 
     @classmethod
     def as_table(cls):
@@ -204,13 +268,91 @@ class ModelMeta:
 
     def save(self):
         """Saves model instance to database."""
-        self.repository.insert_object(self)
+        with instrumentation.origin("save"):
+            self.repository.insert_object(self)
+
+    @classmethod
+    def save_columns(cls, cache: bool = False, **columns) -> int:
+        """Saves rows given as columns of values, without creating model instances.
+
+        cache: Whether to add saved rows to the repository's cache, which
+            requires creating objects for them.
+        **columns: Equally long sequences (lists, array.array or NumPy
+            arrays) named after properties of the model.
+
+        Returns:
+            Number of saved rows.
+        """
+
+        cls._assign_self_to_props()
+        cls._check_columns(columns)
+
+        lengths = {name: len(column) for name, column in columns.items()}
+
+        if len(set(lengths.values())) > 1:
+            raise ValueError(
+                f"All columns must have the same length! Got: {lengths}")
+
+        if not columns or not next(iter(lengths.values())):
+            return 0
+
+        with instrumentation.origin("save_columns"):
+            return cls.repository.insert_columns(cls, columns, cache)
+
+    @classmethod
+    def _check_columns(cls, names: List[str]):
+        """Raises ValueError if any of the names isn't a stored property of the model."""
+
+        stored_props_names = [prop.name for prop in query_builder._stored_properties(cls)]
+
+        unrecognized_props = [
+            key for key in names if key not in stored_props_names]
+
+        if unrecognized_props:
+            raise ValueError(
+                f"Invalid columns for class {cls.__name__}:"
+                + f" {unrecognized_props}! Available only: {stored_props_names}"
+            )
+
+    @classmethod
+    def load_csv(cls, path: str, chunk_size: int = 50000, **reader_options) -> "loader.LoadReport":
+        """Saves rows of a CSV file, streamed in chunks of rows.
+
+        The header names stored properties of the model, foreign keys are
+        given as ids of referenced objects. Rows which can't be converted to
+        types of the properties, or reference objects which don't exist, are
+        rejected and listed in the report.
+
+        Args:
+            path: Path of the file.
+            chunk_size: Number of rows saved in a single transaction.
+            **reader_options: Passed to csv.DictReader, e.g. delimiter.
+
+        Returns:
+            Report of saved and rejected rows and throughput.
+        """
+
+        cls._assign_self_to_props()
+
+        with instrumentation.origin("load"):
+            return loader.load_csv(cls, path, chunk_size, **reader_options)
+
+    @classmethod
+    def load_jsonl(cls, path: str, chunk_size: int = 50000) -> "loader.LoadReport":
+        """Saves rows of a JSON Lines file, one object per line, like load_csv()."""
+
+        cls._assign_self_to_props()
+
+        with instrumentation.origin("load"):
+            return loader.load_jsonl(cls, path, chunk_size)
 
     def delete_object(self):
         """Deletes model instance from database."""
-        self.repository.delete_object(self)
+        with instrumentation.origin("delete"):
+            self.repository.delete_object(self)
 
     @classmethod
     def delete_model(cls):
         """Deletes model from database."""
-        cls.repository.delete_model(cls)
+        with instrumentation.origin("delete_model"):
+            cls.repository.delete_model(cls)
@@ -1,12 +1,18 @@
 from typing import List, Dict, Any, Optional
 from abc import ABC, abstractmethod
-import sqlite3
-import os
 
 
 class Property(ABC):
-    def __init__(self, name: Optional[str] = None):
+    def __init__(self, name: Optional[str] = None, index: bool = False):
+        """Initializes property.
+
+        Args:
+            name: Name of the column, name of the attribute by default.
+            index: Whether migrate should create an index on the column.
+        """
+
         self.name = name
+        self.index = index
         self.model = None
 
     @abstractmethod
@@ -53,28 +59,41 @@ class PrimaryKey(Property):
 
 class ForeignKey(Property):
     def __init__(
-        self, referenced_type: type["ModelMeta"] | str, name: Optional[str] = None
+        self, referenced_type: type["ModelMeta"] | str, name: Optional[str] = None, index: bool = False
     ):
-        super().__init__(name)
+        """Initializes foreign key.
 
-        if isinstance(referenced_type, str):
-            from src.static_storage import StaticStorage
+        Args:
+            referenced_type: Referenced model, or its name. Names are
+                resolved when the foreign key is first used, so the
+                referenced model may be declared later.
+        """
 
-            self._referenced_type = StaticStorage.get_model_by_name(
-                referenced_type)
+        super().__init__(name, index)
 
-        else:
-            self._referenced_type = referenced_type
+        self._referenced_type = referenced_type
 
     @property
     def referenced_type(self):
+        if isinstance(self._referenced_type, str):
+            from src.static_storage import StaticStorage
+
+            repository = None if self.model is None else self.model.repository
+            model = StaticStorage.get_model_by_name(self._referenced_type, repository)
+
+            if model is None:
+                raise ValueError(
+                    f"Model '{self._referenced_type}' referenced by '{self.name}' isn't initialized!")
+
+            self._referenced_type = model
+
         return self._referenced_type
 
     def get_default(self):
         return None
 
     def get_type_str(self):
-        return f"INTEGER REFERENCES {self._referenced_type.__name__}({self._referenced_type.primary_key.name})"
+        return f"INTEGER REFERENCES {self.referenced_type.__name__}({self.referenced_type.primary_key.name})"
 
 
 class ListProperty(Property):
@@ -99,3 +118,19 @@ class StringProperty(Property):
 
     def get_type_str(self):
         return "TEXT"
+
+
+DISCRIMINATOR = "model_type"
+
+
+class Discriminator(StringProperty):
+    """Column storing the class name of each row of a table shared by a
+    model and its subclasses.
+
+    It isn't declared on models, queries use it to select rows of
+    subclasses and to hydrate them polymorphically.
+    """
+
+    def __init__(self, model: type["ModelMeta"]):
+        super().__init__(DISCRIMINATOR)
+        self.model = model
@@ -1,7 +1,13 @@
-from typing import List
+import array
+from collections import deque
+from typing import Dict, Iterator, List, Sequence, Set, TextIO
 
+from src import export
+from src import instrumentation
 from src import query_components
 from src import properties
+from src import serialization
+from src.connection import MemorySqliteConnection, SqliteConnection
 
 
 class QueryBuilder:
@@ -9,6 +15,11 @@ class QueryBuilder:
         self._model = model
         self._condition: query_components.QueryComponent = None
         self._limit: query_components.Limit = None
+        self._workers: int | None = None
+        self._select_related: Dict[str, dict] = dict()
+        self._prefetch_related: Dict[str, dict] = dict()
+        # Whether cached objects and results are ignored, so that explain() sees all statements.
+        self._uncached = False
 
     def where(self, condition: query_components.QueryComponent):
         if self._condition is not None:
@@ -26,45 +37,417 @@ class QueryBuilder:
 
         return self
 
+    def select_related(self, *paths: str):
+        """Makes evaluate load objects referenced by foreign keys in the same query.
+
+        Referenced tables are LEFT JOINed, so an object and the objects
+        along the paths are hydrated from a single row. On partitioned
+        repositories (see ShardedRepository) referenced objects may live
+        on other shards, so they are loaded with a query per level instead.
+
+        Args:
+            paths: Names of foreign keys, nested ones separated by "__",
+                e.g. "class___school".
+        """
+
+        for path in paths:
+            _add_path(self._model, self._select_related, path, properties.ForeignKey)
+
+        return self
+
+    def prefetch_related(self, *paths: str):
+        """Makes evaluate load objects of list properties with one query per property.
+
+        Instead of querying the link table and the listed objects for
+        every object separately, listed objects of all loaded objects are
+        selected joined with the link table and grouped by the listing
+        object.
+
+        Args:
+            paths: Names of list properties, nested ones separated by "__",
+                e.g. "services__info".
+        """
+
+        for path in paths:
+            _add_path(self._model, self._prefetch_related, path, properties.ListProperty)
+
+        return self
+
+    def parallel(self, workers: int = 4):
+        """Makes evaluate and iterate load rows in a pool of processes.
+
+        Selected rows are partitioned into primary key ranges of equal
+        numbers of rows, which are queried and hydrated by worker processes
+        through read-only connections to the same SQLite file. Models have
+        to be importable by worker processes, i.e. declared at module level.
+
+        Args:
+            workers: Number of worker processes.
+
+        Raises:
+            ValueError: If the repository's connection isn't a
+                SqliteConnection to a file, e.g. in-memory databases can't
+                be opened by other processes.
+        """
+
+        connection = self._model.repository.connection
+
+        if not isinstance(connection, SqliteConnection) or isinstance(connection, MemorySqliteConnection):
+            raise ValueError(
+                "Parallel loading requires repository with SqliteConnection!")
+
+        self._workers = workers
+
+        return self
+
+    def iterate(self, batch_size: int = 10000) -> Iterator["ModelMeta"]:
+        """Yields selected objects in primary key order.
+
+        Objects are loaded in batches continuing after the last loaded
+        primary key, so only a few batches are kept in memory at a time.
+
+        Args:
+            batch_size: Number of objects loaded at once.
+        """
+
+        limit = None if self._limit is None else self._limit.value
+        yielded = 0
+
+        for objects in self._load_ranges(batch_size):
+            objects = self._model.repository.update_cache(objects)
+
+            if limit is not None:
+                objects = objects[:limit - yielded]
+
+            if objects:
+                self._assign_related_objects(objects, self._prefetch_related)
+
+            yield from objects
+
+            yielded += len(objects)
+
+            if limit is not None and yielded >= limit:
+                return
+
+    def write_json(self, file: TextIO, depth: int | None = None, fields: List[str] | None = None,
+                   batch_size: int = 10000) -> int:
+        """Writes selected objects to the file as a JSON array.
+
+        Objects are loaded with iterate() and serialized one at a time
+        (see ModelMeta.to_dict), so large selections aren't kept in memory.
+
+        Args:
+            file: Text file the array is written to.
+            depth: Number of levels of related objects serialized as dicts.
+            fields: Names of serialized properties, nested ones separated by "__".
+            batch_size: Number of objects loaded at once.
+
+        Returns:
+            Number of written objects.
+        """
+
+        return serialization.write_json(self.iterate(batch_size), file, depth, fields)
+
+    def export(self, path: str, format: str = "csv", fields: List[str] | None = None, depth: int | None = None,
+               compression: str | None = None, batch_size: int = 10000) -> int:
+        """Writes selected rows to a file, streamed batch by batch from the cursor.
+
+        Without depth no objects are created: stored properties are written
+        as selected, foreign keys as ids. With depth objects are loaded with
+        iterate() and serialized with their related objects (see
+        ModelMeta.to_dict), which only "json" and "jsonl" can hold.
+
+        Args:
+            path: Path of the written file.
+            format: "csv", "jsonl", "json" or "columnar" (a snapshot file
+                with a row group per batch, see src.export).
+            fields: Names of written properties, all stored properties by
+                default. Nested ones separated by "__" require depth.
+            depth: Number of levels of related objects serialized as dicts.
+            compression: "gzip", "bz2" or "xz", not supported by "columnar".
+            batch_size: Number of rows fetched and written at once.
+
+        Returns:
+            Number of written rows.
+        """
+
+        if format not in export.FORMATS:
+            raise ValueError(f"Unsupported format '{format}'! Available only: {list(export.FORMATS)}")
+
+        if compression is not None and (format == "columnar" or compression not in export.COMPRESSIONS):
+            raise ValueError(f"Unsupported compression '{compression}' of format '{format}'!")
+
+        if depth is not None:
+            if format not in ("json", "jsonl"):
+                raise ValueError(f"Related objects can't be exported to format '{format}'!")
+
+            with instrumentation.origin("export"), export.open_text(path, compression) as file:
+                return export.write_objects(self.iterate(batch_size), file, format, depth, fields)
+
+        stored = {prop.name: prop for prop in _stored_properties(self._model)}
+        unrecognized = [name for name in fields or [] if name not in stored]
+
+        if unrecognized:
+            raise ValueError(
+                f"Invalid fields for class {self._model.__name__}: {unrecognized}! Available only: {list(stored)}")
+
+        props = [stored[name] for name in fields] if fields else list(stored.values())
+        names = [prop.name for prop in props]
+        query = query_components.Query(props, self._where(), self._limit, self._model)
+
+        with instrumentation.origin("export"):
+            batches = self._model.repository.iter_rows(query.serialize(), batch_size)
+
+            if format == "columnar":
+                return export.write_columnar(batches, names, path, self._model.table_name)
+
+            with export.open_text(path, compression) as file:
+                return export.write_rows(batches, names, file, format)
+
+    def columns(self, *props: properties.Property, batch_size: int = 10000) -> Dict[str, Sequence]:
+        """Returns selected values as columns, without creating objects.
+
+        Integer and float columns are NumPy arrays when NumPy is installed
+        and array.array otherwise; foreign keys are returned as ids. String
+        columns and columns containing NULLs are lists.
+
+        Args:
+            props: Properties to be selected, all stored properties by default.
+            batch_size: Number of rows fetched from the cursor at once.
+        """
+
+        props = list(props) or _stored_properties(self._model)
+
+        for prop in props:
+            if isinstance(prop, properties.ListProperty):
+                raise ValueError(
+                    f"ListProperty '{prop.name}' can't be selected as column!")
+
+        query = query_components.Query(
+            props, self._where(), self._limit, self._model)
+
+        columns = {prop.name: _new_column(prop) for prop in props}
+
+        with instrumentation.origin("columns"):
+            for rows in self._model.repository.iter_rows(query.serialize(), batch_size):
+                for prop, values in zip(props, zip(*rows)):
+                    column = columns[prop.name]
+
+                    if isinstance(column, array.array) and None in values:
+                        column = columns[prop.name] = column.tolist()
+
+                    column.extend(values)
+
+        numpy = _numpy()
+
+        if numpy is not None:
+            for name, column in columns.items():
+                if isinstance(column, array.array):
+                    columns[name] = numpy.asarray(column)
+
+        return columns
+
     def evaluate(self):
-        primary_objects = self._collect_objects(self._make_query())
-        if len(primary_objects):
-            self._assign_related_objects(primary_objects)
-            return primary_objects
+        with instrumentation.evaluating(self._model) as scope:
+            if self._workers is not None:
+                primary_objects = list(self.iterate())
 
-        return []
+            elif self._select_related and not self._model.repository.partitioned:
+                primary_objects = self._collect_joined()
+                self._assign_related_objects(primary_objects, self._related())
 
-    def _assign_related_objects(self, primary_objects: List["ModelMeta"]):
+            else:
+                # Shards join only their own rows, so joined foreign keys are loaded per level.
+                primary_objects = self._collect_objects(self._make_query())
+                self._assign_related_objects(primary_objects, self._prefetch_related)
 
-        model = primary_objects[0].__class__
+            scope.objects = len(primary_objects)
+
+        return primary_objects
+
+    def explain(self) -> List["QueryPlan"]:
+        """Returns query plans of the statements executed by evaluate().
+
+        The query is evaluated (loading objects like evaluate() does), and
+        EXPLAIN QUERY PLAN is run for every SELECT it issued, including
+        relation-loading queries. Cached objects and results are ignored
+        while evaluating, so plans are the same as with a cold cache.
+        """
+
+        from src.explain import QueryPlan
+
+        self._uncached = True
+
+        try:
+            with instrumentation.capture() as events:
+                self.evaluate()
+
+        finally:
+            self._uncached = False
+
+        repository = self._model.repository
+
+        return [
+            QueryPlan(event.statement, repository.explain(event.statement, event.params))
+            for event in events if event.statement.lstrip().upper().startswith("SELECT")
+        ]
+
+    def _load_ranges(self, batch_size: int) -> Iterator[List["ModelMeta"]]:
+        model = self._model
+        repository = model.repository
+        primary_key = model.primary_key
+        types = repository.model_types(model)
+        condition = self._where()
+
+        def make_query(range_condition, limit=None) -> str:
+            if condition is not None:
+                range_condition = condition if range_condition is None else And(condition, range_condition)
+
+            return query_components.Query(_loaded_properties(model, types), range_condition, limit,
+                                          model=model, order_by=primary_key).serialize()
+
+        if self._workers is None:
+            # Keyset pagination, every batch continues after the last loaded primary key.
+            range_condition = None
+
+            while True:
+                rows = repository.get_rows(make_query(range_condition, query_components.Limit(batch_size)))
+
+                if not rows:
+                    return
+
+                objects = _hydrate(model, rows, types)
+
+                yield objects
+
+                if len(rows) < batch_size:
+                    return
+
+                range_condition = GreaterThan(primary_key, getattr(objects[-1], primary_key.name))
+
+        column = query_components.Scalar(primary_key).serialize()
+
+        def queries() -> Iterator[str]:
+            # Ranges hold batch_size rows each, the next boundary is found only when it's needed.
+            low = None
+
+            while True:
+                bounds = [] if condition is None else [condition.serialize()]
+
+                if low is not None:
+                    bounds.append(f"{column} >= {low}")
+
+                cond = f"WHERE {' AND '.join(bounds)}" if bounds else ""
+                rows = repository.get_rows(
+                    f"SELECT {column} FROM {model.table_name} {cond} ORDER BY {column} LIMIT 1 OFFSET {batch_size}")
+                high = rows[0][0] if rows else None
+
+                range_condition = None if low is None else GreaterThan(primary_key, low - 1)
+
+                if high is not None:
+                    upper = LessThan(primary_key, high)
+                    range_condition = upper if range_condition is None else And(range_condition, upper)
 
-        for prop in model.foreign_keys:
+                yield make_query(range_condition)
+
+                if high is None:
+                    return
+
+                low = high
+
+        # Imports multiprocessing, only needed by parallel loading.
+        from concurrent.futures import ProcessPoolExecutor
+
+        db_path = repository.connection.db_path
+
+        with ProcessPoolExecutor(self._workers) as pool:
+            pending = deque()
+
+            try:
+                for query in queries():
+                    pending.append(pool.submit(
+                        _load_range, model, types, db_path, query))
+
+                    if len(pending) > 2 * self._workers:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _assign_related_objects(self, primary_objects: List["ModelMeta"], loaded: Dict[str, dict] | None = None):
+
+        if not primary_objects:
+            return
+
+        with instrumentation.origin("relation load"):
+            self._load_related_objects(primary_objects, loaded or {})
+
+    def _load_related_objects(self, objects: List["ModelMeta"], loaded: Dict[str, dict]):
+
+        # Objects of subclasses have relations their parents haven't got.
+        classes = {cls: {prop.name for prop in cls.properties}
+                   for cls in dict.fromkeys(type(obj) for obj in objects)}
+
+        def owners(prop: properties.Property) -> List["ModelMeta"]:
+            if len(classes) == 1:
+                return objects
+
+            return [obj for obj in objects if prop.name in classes[type(obj)]]
+
+        foreign_keys = {prop.name: prop for cls in classes for prop in cls.foreign_keys}
+        list_properties = {prop.name: prop for cls in classes for prop in cls.list_properties}
+
+        for prop in foreign_keys.values():
+            primary_objects = owners(prop)
+
+            if prop.name in loaded:
+                # Already assigned from a join, load relations of the related objects.
+                related_objects = {id(obj): obj for obj in (
+                    primary_obj.__dict__.get(prop.name) for primary_obj in primary_objects) if obj is not None}
+
+                self._assign_related_objects(list(related_objects.values()), loaded[prop.name])
+
+                continue
 
             related_model = prop.referenced_type
 
-            related_ids = [
-                getattr(getattr(obj, prop.name), getattr(obj, prop.name).primary_key.name) for obj in primary_objects]
+            related_ids = {
+                _related_id(obj, prop) for obj in primary_objects} - {None}
 
-            query = query_components.Query([p for p in related_model.properties if not isinstance(
-                p, properties.ListProperty)], IsIn(related_model.primary_key, related_ids))
+            query = query_components.Query(_loaded_properties(related_model),
+                                           IsIn(related_model.primary_key, list(related_ids)), model=related_model)
 
             related_objects = self._collect_objects(query)
 
             self._assign_related_objects(related_objects)
 
-            for primary_obj, related_obj in zip(primary_objects, related_objects):
-                setattr(primary_obj, prop.name, related_obj)
+            related_by_id = {
+                getattr(obj, obj.primary_key.name): obj for obj in related_objects}
+
+            for primary_obj in primary_objects:
+                setattr(primary_obj, prop.name, related_by_id.get(
+                    _related_id(primary_obj, prop)))
+
+        for prop in list_properties.values():
+            primary_objects = owners(prop)
 
-        for prop in model.list_properties:
+            if prop.name in loaded:
+                self._prefetch(primary_objects, prop, loaded[prop.name])
+
+                continue
 
             for obj in primary_objects:
                 related_ids = self._model.repository.get_listed_objects_ids(
-                    obj, prop)
+                    obj, prop, cached=not self._uncached)
 
                 related_model = prop.contained_type
 
-                query = query_components.Query([p for p in related_model.properties if not isinstance(
-                    p, properties.ListProperty)], IsIn(related_model.primary_key, related_ids))
+                query = query_components.Query(_loaded_properties(related_model),
+                                               IsIn(related_model.primary_key, related_ids), model=related_model)
 
                 related_objects = self._collect_objects(query)
 
@@ -72,56 +455,352 @@ class QueryBuilder:
 
                 setattr(obj, prop.name, related_objects)
 
+    def _related(self) -> Dict[str, dict]:
+        # Joined foreign keys and prefetched list properties never share names.
+        return {**self._select_related, **self._prefetch_related}
+
+    def _prefetch(self, primary_objects: List["ModelMeta"], prop: properties.ListProperty, loaded: Dict[str, dict]):
+        model = primary_objects[0].__class__
+        repository = self._model.repository
+        related_model = prop.contained_type
+
+        ids = list(dict.fromkeys(getattr(obj, obj.primary_key.name) for obj in primary_objects))
+        rows = repository.get_listed_rows(model, prop, ids, _loaded_properties(related_model))
+
+        related_objects = repository.update_cache(_hydrate(related_model, [row[:-1] for row in rows]))
+        listed: Dict[int, List["ModelMeta"]] = {id: [] for id in ids}
+
+        for row, obj in zip(rows, related_objects):
+            listed[row[-1]].append(obj)
+
+        for obj in primary_objects:
+            setattr(obj, prop.name, listed[getattr(obj, obj.primary_key.name)])
+
+        unique_objects = {id(obj): obj for obj in related_objects}
+        self._assign_related_objects(list(unique_objects.values()), loaded)
+
+    def _collect_joined(self) -> List["ModelMeta"]:
+        model = self._model
+        repository = model.repository
+        joins = []
+
+        def add_joins(parent: type["ModelMeta"], parent_alias: str, tree: Dict[str, dict]):
+            for name, subtree in tree.items():
+                foreign_key = _property_by_name(parent, name)
+                join = query_components.Join(foreign_key, f"{parent_alias}__{name}", parent_alias,
+                                             _loaded_properties(foreign_key.referenced_type))
+                joins.append(join)
+                add_joins(join.model, join.alias, subtree)
+
+        add_joins(model, model.table_name, self._select_related)
+
+        query = query_components.Query(
+            _loaded_properties(model), self._where(), self._limit, model, joins=joins)
+        rows = repository.get_rows(query.serialize(), self._cached_tables(query))
+
+        width = len(_loaded_properties(model))
+        primary_objects = repository.update_cache(_hydrate(model, [row[:width] for row in rows]))
+        objects_by_alias = {model.table_name: primary_objects}
+
+        for join in joins:
+            columns = slice(width, width + len(join.properties))
+            key = width + join.properties.index(join.model.primary_key)
+            width += len(join.properties)
+
+            # Rows without a referenced object have NULL primary key.
+            joined_rows = [row[columns] for row in rows if row[key] is not None]
+            joined_objects = iter(repository.update_cache(_hydrate(join.model, joined_rows)))
+
+            objects = objects_by_alias[join.alias] = [
+                next(joined_objects) if row[key] is not None else None for row in rows]
+
+            for parent, obj in zip(objects_by_alias[join.parent_alias], objects):
+                if parent is not None:
+                    setattr(parent, join.foreign_key.name, obj)
+
+        return primary_objects
+
     def _collect_objects(self, query: query_components.Query):
 
+        objects = None if self._uncached else _select_cached(query)
+
+        if objects is not None:
+            return objects
+
+        # The discriminator index covers ids, keep them in primary key order.
         ids_collecting_query = query_components.Query(
-            [query.model.primary_key], query.condition, query.limit
+            [query.model.primary_key], query.condition, query.limit, query.model,
+            order_by=query.model.primary_key
         )
 
         ids = query.model.repository.get_rows(
-            ids_collecting_query.serialize())
+            ids_collecting_query.serialize(), self._cached_tables(ids_collecting_query))
         ids = [id[0] for id in ids]
 
-        objects = query.model.repository.get_objects(query.model, ids)
-
-        ids = [getattr(obj, obj.primary_key.name) for obj in objects]
-
-        modified_condition = NotIn(query.model.primary_key, ids)
+        objects = [] if self._uncached else query.model.repository.get_objects(query.model, ids)
 
-        if query.condition is not None:
-            modified_condition = And(query.condition, modified_condition)
+        if len(objects) == len(ids):
+            return objects
 
-        props = [prop for prop in query.model.properties if not isinstance(
-            prop, properties.ListProperty)]
+        cached_ids = {getattr(obj, obj.primary_key.name) for obj in objects}
+        missing_ids = [id for id in ids if id not in cached_ids]
 
+        # Selected by ids, as the condition and limit could pick other rows through an index.
         remainder_query = query_components.Query(
-            props, modified_condition, query.limit
+            _loaded_properties(query.model), IsIn(query.model.primary_key, missing_ids), model=query.model
         )
 
         remainder_rows = query.model.repository.get_rows(
             remainder_query.serialize()
         )
 
-        remainder_objects = [
-            query.model(**dict(zip([prop.name for prop in props], row))) for row in remainder_rows
-        ]
+        remainder_objects = _hydrate(query.model, remainder_rows)
 
-        query.model.repository.update_cache(remainder_objects)
+        remainder_objects = query.model.repository.update_cache(
+            remainder_objects)
 
-        return objects + remainder_objects
+        # Keep the order (and the limit) of the ids query.
+        objects_by_id = {getattr(obj, obj.primary_key.name): obj for obj in objects + remainder_objects}
 
-    def _make_query(self):
+        return [objects_by_id[id] for id in ids if id in objects_by_id]
 
-        props = [prop for prop in self._model.properties if not isinstance(
-            prop, properties.ListProperty)]
+    def _cached_tables(self, query: query_components.Query) -> Set[str]:
+        # Results are cached only if tables they are read from are given.
+        return set() if self._uncached else query.referenced_tables()
+
+    def _make_query(self):
 
         return query_components.Query(
-            props, self._condition, self._limit, self._model if not props else None
+            _loaded_properties(self._model), self._where(), self._limit, self._model
         )
 
+    def _where(self) -> query_components.QueryComponent | None:
+        """Returns the condition restricted to rows of the model and its subclasses.
+
+        Selections of base models select all rows of their table.
+        """
+
+        if _is_base_model(self._model):
+            return self._condition
+
+        model_type = IsIn(properties.Discriminator(self._model),
+                          list(self._model.repository.model_types(self._model)))
+
+        return model_type if self._condition is None else And(self._condition, model_type)
+
     def serialize(self):
         return self._make_query().serialize()
 
+    def subquery(self, prop: properties.Property | None = None) -> query_components.Subquery:
+        """Returns the selection as a subquery, e.g. for IsIn.
+
+        Args:
+            prop: Selected property, the primary key by default.
+        """
+
+        return query_components.Subquery(query_components.Query(
+            [prop or self._model.primary_key], self._where(), self._limit, self._model))
+
+
+def _stored_properties(model: type["ModelMeta"]) -> List[properties.Property]:
+    """Returns properties of the model stored in the model's table."""
+
+    return [prop for prop in model.properties if not isinstance(prop, properties.ListProperty)]
+
+
+def _loaded_properties(model: type["ModelMeta"],
+                       types: Dict[str, type["ModelMeta"]] | None = None) -> List[properties.Property]:
+    """Returns columns selected to hydrate objects of the model.
+
+    Stored properties of the model and its subclasses are followed by the
+    discriminator, so that rows of subclasses are hydrated into objects of
+    their own class (see _hydrate).
+
+    Args:
+        types: The model and its subclasses by discriminator value, as
+            returned by Repository.model_types.
+    """
+
+    types = types or model.repository.model_types(model)
+    loaded = {prop.name: prop for prop in _stored_properties(model)}
+
+    for cls in types.values():
+        for prop in _stored_properties(cls):
+            loaded.setdefault(prop.name, prop)
+
+    return [*loaded.values(), properties.Discriminator(model)]
+
+
+def _is_base_model(model: type["ModelMeta"]) -> bool:
+    return model.__bases__[0].__bases__[0].__name__ == "ModelMeta"
+
+
+def _select_cached(query: query_components.Query) -> List["ModelMeta"] | None:
+    """Evaluates the query over cached objects of a fully cached model.
+
+    Returns:
+        Selected objects in primary key order, or None if the model isn't
+        fully cached or the condition can't be evaluated in memory.
+    """
+
+    select = None
+
+    if query.condition is not None:
+        try:
+            select = query.condition.compile_filter()
+
+        except query_components.CompileError:
+            return None
+
+    cached = query.model.repository.cached_values(query.model, query.condition)
+
+    if cached is None:
+        return None
+
+    objects, values = cached
+
+    if select is not None:
+        # Like SQL, conditions are tested on saved values, not on unsaved changes.
+        objects = select(objects, values)
+
+    if query.limit is not None and query.limit.value >= 0:
+        objects = objects[:query.limit.value]
+
+    return objects
+
+
+def _property_by_name(model: type["ModelMeta"], name: str) -> properties.Property:
+    for prop in model.properties:
+        if prop.name == name:
+            return prop
+
+    raise ValueError(f"Class '{model.__name__}' has no property '{name}'!")
+
+
+def _add_path(model: type["ModelMeta"], tree: Dict[str, dict], path: str, kind: type):
+    """Adds relation path, e.g. "class___school", to a tree of relations.
+
+    Raises:
+        ValueError: If a property along the path doesn't exist or isn't of
+            the kind.
+    """
+
+    while path:
+        # Names may end with underscores (e.g. "class_"), match the longest one.
+        names = [prop.name for prop in model.properties
+                 if path == prop.name or path.startswith(f"{prop.name}__")]
+
+        if not names:
+            raise ValueError(f"Class '{model.__name__}' has no property for path '{path}'!")
+
+        name = max(names, key=len)
+        prop = _property_by_name(model, name)
+
+        if not isinstance(prop, kind):
+            raise ValueError(
+                f"Property '{name}' of class '{model.__name__}' isn't {kind.__name__}!")
+
+        tree = tree.setdefault(name, {})
+        model = prop.referenced_type if isinstance(prop, properties.ForeignKey) else prop.contained_type
+        path = path[len(name) + 2:]
+
+
+def _hydrate(model: type["ModelMeta"], rows: List[tuple],
+             types: Dict[str, type["ModelMeta"]] | None = None, trusted: bool = False) -> List["ModelMeta"]:
+    """Creates objects from rows of the model's loaded properties (see _loaded_properties).
+
+    Each row is hydrated into the subclass named by its discriminator, or
+    the model if there's none. Foreign keys are left as raw ids, to be
+    resolved by the query builder.
+
+    Args:
+        trusted: Whether to assign values without calling the constructor,
+            which validates names of the properties for every object.
+    """
+
+    types = types or model.repository.model_types(model)
+    names = [prop.name for prop in _loaded_properties(model, types)[:-1]]
+
+    if trusted:
+        for cls in types.values():
+            cls._assign_self_to_props()
+
+        create = _create_trusted
+
+    else:
+        def create(cls, values):
+            return cls(**values)
+
+    if len(types) == 1:
+        return [create(model, dict(zip(names, row))) for row in rows]
+
+    columns = {}
+
+    for cls in types.values():
+        stored = {prop.name for prop in _stored_properties(cls)}
+        columns[cls] = [(i, name) for i, name in enumerate(names) if name in stored]
+
+    objects = []
+
+    for row in rows:
+        cls = types.get(row[-1], model)
+        objects.append(create(cls, {name: row[i] for i, name in columns[cls]}))
+
+    return objects
+
+
+def _create_trusted(cls: type["ModelMeta"], values: Dict[str, object]) -> "ModelMeta":
+    obj = cls.__new__(cls)
+    obj.__dict__.update(values)
+
+    return obj
+
+
+def _numpy():
+    """Returns NumPy, or None if it isn't installed.
+
+    It's imported on first use, as importing it is slow.
+    """
+
+    try:
+        import numpy
+
+    except ImportError:
+        return None
+
+    return numpy
+
+
+def _new_column(prop: properties.Property) -> array.array | list:
+    if isinstance(prop, (properties.IntProperty, properties.PrimaryKey, properties.ForeignKey)):
+        return array.array("q")
+
+    if isinstance(prop, properties.FloatProperty):
+        return array.array("d")
+
+    return []
+
+
+def _load_range(model: type["ModelMeta"], types: Dict[str, type["ModelMeta"]],
+                db_path: str, query: str) -> List["ModelMeta"]:
+    """Loads objects in a worker process through read-only connection."""
+
+    with SqliteConnection(db_path, read_only=True) as db:
+        rows = db.execute_query(query)[0]
+
+    return _hydrate(model, rows, types)
+
+
+def _related_id(obj: "ModelMeta", prop: properties.ForeignKey):
+    """Returns id of object referenced by the foreign key of the object."""
+
+    value = obj.__dict__.get(prop.name)
+
+    if value is not None and not isinstance(value, (int, str)):
+        return getattr(value, value.primary_key.name)
+
+    return value
+
 
 def Or(left, right):
     return _logical(left, right, "OR")
@@ -164,13 +843,84 @@ def LessThan(left, right):
 
 
 def IsIn(left, right):
-    right = [query_components.Scalar(value) for value in right]
-    return _comparison(left, query_components.Scalar(right), "IN")
+    if not isinstance(right, query_components.Subquery):
+        right = query_components.Scalar([query_components.Scalar(value) for value in right])
+
+    return _comparison(left, right, "IN")
 
 
 def NotIn(left, right):
-    right = [query_components.Scalar(value) for value in right]
-    return _comparison(left, query_components.Scalar(right), "NOT IN")
+    if not isinstance(right, query_components.Subquery):
+        right = query_components.Scalar([query_components.Scalar(value) for value in right])
+
+    return _comparison(left, right, "NOT IN")
+
+
+def Has(relation, condition=None):
+    """Returns condition satisfied by objects having a related object.
+
+    Args:
+        relation: ForeignKey or ListProperty.
+        condition: Condition the related object has to satisfy.
+
+    Raises:
+        ValueError: If the relation belongs to a partitioned repository
+            (see ShardedRepository), whose shards see only their own rows.
+    """
+
+    return _exists(relation, condition, False)
+
+
+def HasNo(relation, condition=None):
+    """Returns condition satisfied by objects without a related object.
+
+    Args:
+        relation: ForeignKey or ListProperty.
+        condition: Condition related objects can't satisfy.
+
+    Raises:
+        ValueError: If the relation belongs to a partitioned repository.
+    """
+
+    return _exists(relation, condition, True)
+
+
+def _exists(relation, condition, negate):
+    if condition is not None and not isinstance(condition, query_components.QueryComponent):
+        raise TypeError("Condition of related objects must be a query component!")
+
+    owner = relation.model
+
+    if isinstance(relation, properties.ForeignKey):
+        target = relation.referenced_type
+        source = target.table_name
+        correlation = f"{target.table_name}.{target.primary_key.name} = {owner.table_name}.{relation.name}"
+        tables = {target.table_name}
+
+    elif isinstance(relation, properties.ListProperty):
+        target = relation.contained_type
+        list_table_name = f"{owner.table_name}_{relation.name}"
+        correlation = f"{list_table_name}.{owner.table_name}_id = {owner.table_name}.{owner.primary_key.name}"
+        tables = {list_table_name}
+        source = list_table_name
+
+        if condition is not None:
+            source = (f"{list_table_name} JOIN {target.table_name} ON "
+                      f"{target.table_name}.{target.primary_key.name} = {list_table_name}.{relation.name}_id")
+            tables.add(target.table_name)
+
+    else:
+        raise TypeError("Relation must be ForeignKey or ListProperty!")
+
+    if target.table_name == owner.table_name and (condition is not None or isinstance(relation, properties.ForeignKey)):
+        # Columns of the related table couldn't be told apart from the outer ones.
+        raise ValueError("Relations of a table to itself can't be filtered!")
+
+    if owner.repository.partitioned:
+        # Every shard would evaluate the subquery over its own rows only.
+        raise ValueError("Relations of partitioned repositories can't be filtered!")
+
+    return query_components.Exists(source, correlation, tables, condition, negate)
 
 
 def _logical(left, right, operator):
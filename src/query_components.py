@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Set
 
 from src import properties
 
@@ -12,10 +12,82 @@ class QueryComponent(ABC):
         """Returns a string representation of the query component."""
         pass
 
+    def referenced_tables(self) -> Set[str]:
+        """Returns names of tables the query component reads from."""
+
+        return set()
+
+    def compile(self) -> Callable[["ModelMeta"], Any]:
+        """Returns predicate deciding whether an object satisfies the condition.
+
+        The component is translated into the source of a single Python
+        function, which selects the same rows as SQLite would: comparisons
+        with NULL (None) are never satisfied and NULL propagates through
+        arithmetic. Conditions have no NOT, so NULL may be evaluated as
+        false.
+
+        Raises:
+            CompileError: If the component can't be evaluated in memory
+                with the same result as in SQLite.
+        """
+
+        return self._compile()[0]
+
+    def compile_filter(self) -> Callable[..., List["ModelMeta"]]:
+        """Returns function selecting objects satisfying the condition from a list.
+
+        Same as filtering with compile(), without calling the predicate
+        for every object. The function optionally takes dicts of values the
+        objects are tested by, parallel to the objects, instead of their
+        current values.
+        """
+
+        return self._compile()[1]
+
+    def _compile(self):
+        key = self.serialize()
+        compiled = _compiled.get(key)
+
+        if compiled is None:
+            source = _Source()
+            expression = self._source(source)
+            exec(
+                f"def predicate(obj):\n    d = obj.__dict__\n    return {expression}\n"
+                f"def select(objects, values=None):\n"
+                f"    if values is not None:\n        return [obj for obj, d in zip(objects, values) if {expression}]\n"
+                f"    return [obj for obj in objects if (d := obj.__dict__) is not None and {expression}]",
+                source.namespace)
+            compiled = source.namespace["predicate"], source.namespace["select"]
+
+            if len(_compiled) >= _COMPILED_CACHE_SIZE:
+                _compiled.clear()
+
+            _compiled[key] = compiled
+
+        return compiled
+
+    def _source(self, source: "_Source") -> str:
+        """Returns Python expression computing value of the component."""
+
+        raise CompileError(f"{self.__class__.__name__} can't be evaluated in memory!")
+
     def __repr__(self):
         return f"{self.__class__.__name__}({self.serialize()})"
 
 
+# Compiled functions by serialized condition.
+_compiled: Dict[str, tuple] = dict()
+_COMPILED_CACHE_SIZE = 1024
+
+
+class CompileError(ValueError):
+    """Raised when a query component can't be evaluated in memory."""
+
+
+_NUMERIC_PROPERTIES = (properties.IntProperty, properties.FloatProperty,
+                       properties.PrimaryKey, properties.ForeignKey)
+
+
 class Scalar(QueryComponent):
     """Represents a scalar value in an SQL query."""
 
@@ -26,6 +98,15 @@ class Scalar(QueryComponent):
 
         self._value = value
 
+    def referenced_tables(self) -> Set[str]:
+        if isinstance(self._value, properties.Property):
+            return {self._value.model.table_name}
+
+        elif isinstance(self._value, list):
+            return set().union(*[v.referenced_tables() for v in self._value])
+
+        return set()
+
     def serialize(self) -> str:
         """Returns a string representation of the scalar."""
 
@@ -40,6 +121,32 @@ class Scalar(QueryComponent):
 
         return str(self._value)
 
+    def _source(self, source: "_Source") -> str:
+        value = self._value
+
+        if isinstance(value, properties.ListProperty):
+            raise CompileError(f"ListProperty '{value.name}' can't be compared!")
+
+        if isinstance(value, properties.ForeignKey):
+            return f"_foreign_id(d.get({value.name!r}))"
+
+        if isinstance(value, properties.Discriminator):
+            return "type(obj).__name__"
+
+        if isinstance(value, properties.Property):
+            return f"d.get({value.name!r})"
+
+        if isinstance(value, list):
+            raise CompileError("List of values can only be compared with IN!")
+
+        return source.constant(value)
+
+    @property
+    def value(self):
+        """Returns the wrapped value, property or list of scalars."""
+
+        return self._value
+
 
 class LogicalOperation(QueryComponent):
     """Represents a logical operation in an SQL query."""
@@ -51,6 +158,21 @@ class LogicalOperation(QueryComponent):
         self._right = right
         self._operator = operator
 
+    @property
+    def left(self) -> QueryComponent:
+        return self._left
+
+    @property
+    def right(self) -> QueryComponent:
+        return self._right
+
+    @property
+    def operator(self) -> str:
+        return self._operator
+
+    def referenced_tables(self) -> Set[str]:
+        return self._left.referenced_tables() | self._right.referenced_tables()
+
     def serialize(self) -> str:
         """Returns a string representation of the logical operation."""
 
@@ -58,6 +180,11 @@ class LogicalOperation(QueryComponent):
             f"({self._left.serialize()}) {self._operator} ({self._right.serialize()})"
         )
 
+    def _source(self, source: "_Source") -> str:
+        operator = self._operator.lower()
+
+        return f"({self._left._source(source)} {operator} {self._right._source(source)})"
+
 
 class ArithmeticOperation(QueryComponent):
     """Represents an arithmetic operation in an SQL query."""
@@ -69,6 +196,9 @@ class ArithmeticOperation(QueryComponent):
         self._right = right
         self._operator = operator
 
+    def referenced_tables(self) -> Set[str]:
+        return self._left.referenced_tables() | self._right.referenced_tables()
+
     def serialize(self) -> str:
         """Returns a string representation of the arithmetic operation."""
 
@@ -76,6 +206,16 @@ class ArithmeticOperation(QueryComponent):
             f"({self._left.serialize()}) {self._operator} ({self._right.serialize()})"
         )
 
+    def _source(self, source: "_Source") -> str:
+        if _kind(self._left) != "number" or _kind(self._right) != "number":
+            raise CompileError(f"Operands of '{self._operator}' must be numbers!")
+
+        a, b = source.variable(), source.variable()
+        left, right = self._left._source(source), self._right._source(source)
+        result = f"_divide({a}, {b})" if self._operator == "/" else f"{a} {self._operator} {b}"
+
+        return f"(None if ({a} := {left}) is None or ({b} := {right}) is None else {result})"
+
 
 class Limit(QueryComponent):
     """Represents a limit in an SQL query."""
@@ -85,6 +225,12 @@ class Limit(QueryComponent):
 
         self._limit = limit
 
+    @property
+    def value(self) -> int:
+        """Returns the maximal number of rows."""
+
+        return self._limit
+
     def serialize(self) -> str:
         """Returns a string representation of the limit."""
 
@@ -101,10 +247,171 @@ class Comparison(QueryComponent):
         self.right = right
         self.operator = operator
 
+    def referenced_tables(self) -> Set[str]:
+        return self.left.referenced_tables() | self.right.referenced_tables()
+
     def serialize(self) -> str:
         """Returns a string representation of the comparison."""
         return f"{self.left.serialize()} {self.operator} {self.right.serialize()}"
 
+    def _source(self, source: "_Source") -> str:
+        a = source.variable()
+        left = self.left._source(source)
+
+        if self.operator in ("IN", "NOT IN"):
+            if not isinstance(self.right, Scalar) or not isinstance(self.right.value, list):
+                raise CompileError(f"Right operand of '{self.operator}' must be a list!")
+
+            if not self.right.value:
+                # x IN () is false even if x is NULL
+                return str(self.operator == "NOT IN")
+
+            if _kind(self.left) is None or _kind(self.left) != _kind(self.right):
+                raise CompileError(f"Operands of '{self.operator}' must be of the same type!")
+
+            values = [v.value for v in self.right.value]
+
+            if any(isinstance(v, properties.Property) for v in values):
+                raise CompileError(f"Right operand of '{self.operator}' must be a list of values!")
+
+            operator = self.operator.lower()
+
+            return f"(({a} := {left}) is not None and {a} {operator} {source.constant(frozenset(values))})"
+
+        # SQLite would apply column affinity to mismatched values.
+        if _kind(self.left) is None or _kind(self.left) != _kind(self.right):
+            raise CompileError(f"Operands of '{self.operator}' must be of the same type!")
+
+        b = source.variable()
+        right = self.right._source(source)
+        operator = "==" if self.operator == "=" else self.operator
+
+        return f"(({a} := {left}) is not None and ({b} := {right}) is not None and {a} {operator} {b})"
+
+
+class Subquery(QueryComponent):
+    """Represents a subquery, e.g. right operand of IN."""
+
+    def __init__(self, query: "Query"):
+        """Initializes a Subquery instance.
+
+        Args:
+            query: Query selecting a single column.
+
+        Raises:
+            ValueError: If the query selects more than one column, or rows
+                of a partitioned repository (see ShardedRepository).
+        """
+
+        if len(query.properties) != 1:
+            raise ValueError("Subquery must select exactly one property!")
+
+        if query.model.repository.partitioned:
+            # Every shard would evaluate the subquery over its own rows only.
+            raise ValueError("Subqueries of partitioned repositories aren't supported!")
+
+        self.query = query
+
+    def referenced_tables(self) -> Set[str]:
+        return self.query.referenced_tables()
+
+    def serialize(self) -> str:
+        """Returns a string representation of the subquery."""
+
+        return f"({self.query.serialize().strip()})"
+
+
+class Exists(QueryComponent):
+    """Represents an EXISTS (or NOT EXISTS) condition over related rows."""
+
+    def __init__(self, source: str, correlation: str, tables: Set[str],
+                 condition: QueryComponent | None = None, negate: bool = False):
+        """Initializes an Exists instance.
+
+        Args:
+            source: FROM clause of the subquery, without FROM.
+            correlation: Condition relating rows of the subquery to rows
+                of the outer query.
+            tables: Tables of the source.
+            condition: Additional condition on rows of the subquery.
+            negate: Whether to serialize NOT EXISTS.
+        """
+
+        self.source = source
+        self.correlation = correlation
+        self.tables = set(tables)
+        self.condition = condition
+        self.negate = negate
+
+    def referenced_tables(self) -> Set[str]:
+        tables = set(self.tables)
+
+        if self.condition is not None:
+            tables |= self.condition.referenced_tables()
+
+        return tables
+
+    def serialize(self) -> str:
+        """Returns a string representation of the condition."""
+
+        cond = self.correlation
+
+        if self.condition is not None:
+            cond = f"{cond} AND ({self.condition.serialize()})"
+
+        exists = "NOT EXISTS" if self.negate else "EXISTS"
+
+        return f"{exists} (SELECT 1 FROM {self.source} WHERE {cond})"
+
+
+class Join(QueryComponent):
+    """Represents a LEFT JOIN of the model referenced by a foreign key."""
+
+    def __init__(self, foreign_key: properties.ForeignKey, alias: str, parent_alias: str,
+                 selected: List[properties.Property] | None = None):
+        """Initializes a Join instance.
+
+        Args:
+            foreign_key: Foreign key followed by the join.
+            alias: Alias of the joined table.
+            parent_alias: Alias (or name) of the table owning the foreign key.
+            selected: Selected columns of the joined table, stored
+                properties of the joined model by default.
+        """
+
+        self.foreign_key = foreign_key
+        self.alias = alias
+        self.parent_alias = parent_alias
+        self._selected = selected
+
+    @property
+    def model(self) -> type["ModelMeta"]:
+        """Returns the joined model."""
+
+        return self.foreign_key.referenced_type
+
+    @property
+    def properties(self) -> List[properties.Property]:
+        """Returns selected columns of the joined table."""
+
+        if self._selected is not None:
+            return self._selected
+
+        return [prop for prop in self.model.properties if not isinstance(prop, properties.ListProperty)]
+
+    def referenced_tables(self) -> Set[str]:
+        return {self.model.table_name}
+
+    def serialize(self) -> str:
+        """Returns a string representation of the join."""
+
+        primary_key = self.model.primary_key.name
+
+        return (
+            f"LEFT JOIN {self.model.table_name} AS {self.alias} "
+            f"ON {self.alias}.{primary_key} = {self.parent_alias}.{self.foreign_key.name}"
+        )
+
 
 class Query(QueryComponent):
     """Represents an SQL query."""
@@ -114,30 +421,42 @@ class Query(QueryComponent):
         properties: List[properties.Property],
         condition: QueryComponent | None = None,
         limit: Limit | None = None,
-        model: type['ModelMeta'] = None
+        model: type['ModelMeta'] = None,
+        order_by: properties.Property | None = None,
+        joins: List[Join] | None = None
     ):
-        """Initializes a Query instance."""
+        """Initializes a Query instance.
 
-        unique_props_models = set([prop.model for prop in properties])
+        Columns of joined models follow the selected properties, in the
+        order of the joins. Properties may belong to a model and its
+        subclasses, as long as they are stored in one table; the model is
+        then given explicitly.
+        """
 
-        if len(unique_props_models) > 1:
-            raise ValueError("All properties must belong to the same model!")
+        unique_props_tables = set([prop.model.table_name for prop in properties])
 
-        elif len(unique_props_models) == 0:
+        if len(unique_props_tables) > 1:
+            raise ValueError("All properties must belong to the same model!")
 
-            if model is None:
-                raise ValueError(
-                    "Query must be provided with either a model or a positive number of properties!")
+        elif model is not None:
+            if unique_props_tables and unique_props_tables != {model.table_name}:
+                raise ValueError("All properties must belong to the same model!")
 
             self._model = model
 
+        elif len(unique_props_tables) == 0:
+            raise ValueError(
+                "Query must be provided with either a model or a positive number of properties!")
+
         else:
-            self._model = unique_props_models.pop()
+            self._model = properties[0].model
 
         self._properties = properties
 
         self._condition = condition
         self._limit = limit
+        self._order_by = order_by
+        self._joins = joins or []
 
     @property
     def model(self) -> type["ModelMeta"]:
@@ -163,17 +482,29 @@ class Query(QueryComponent):
 
         return self._limit
 
+    def referenced_tables(self) -> Set[str]:
+        tables = {self._model.table_name}
+
+        if self._condition is not None:
+            tables |= self._condition.referenced_tables()
+
+        for join in self._joins:
+            tables |= join.referenced_tables()
+
+        return tables
+
     def _make_fields_list(self):
         """Creates a list of fields to be selected."""
 
         listed_fields: List[str] = []
 
         for prop in self._properties:
-            if not isinstance(prop, properties.ForeignKey) and not isinstance(
-                prop, properties.ListProperty
-            ):
+            if not isinstance(prop, properties.ListProperty):
                 listed_fields.append(f"{prop.model.table_name}.{prop.name}")
 
+        for join in self._joins:
+            listed_fields += [f"{join.alias}.{prop.name}" for prop in join.properties]
+
         return listed_fields
 
     def serialize(self) -> str:
@@ -185,6 +516,76 @@ class Query(QueryComponent):
 
         limit = "" if self._limit is None else f"{self._limit.serialize()}"
 
-        from_table = f"FROM {self._model.table_name}"
+        from_table = " ".join([f"FROM {self._model.table_name}"] + [join.serialize() for join in self._joins])
+
+        order = "" if self._order_by is None else f"ORDER BY {Scalar(self._order_by).serialize()}"
+
+        return f"SELECT {listed_fields} {from_table} {cond} {order} {limit}"
+
+
+def _divide(a, b):
+    if b == 0:
+        return None
+
+    if isinstance(a, int) and isinstance(b, int):
+        # integer division truncates towards zero
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+
+    return a / b
+
+
+def _foreign_id(value):
+    if value is not None and not isinstance(value, (int, str)):
+        return getattr(value, value.primary_key.name)
+
+    return value
+
+
+class _Source:
+    """Namespace of the source of a compiled predicate."""
+
+    def __init__(self):
+        self.namespace = {"_divide": _divide, "_foreign_id": _foreign_id}
+        self._variables = 0
+
+    def constant(self, value) -> str:
+        name = f"_c{len(self.namespace)}"
+        self.namespace[name] = value
+
+        return name
+
+    def variable(self) -> str:
+        self._variables += 1
+
+        return f"_v{self._variables}"
+
+
+def _kind(component: QueryComponent) -> str | None:
+    """Returns "number" or "text" for components of a known type, None otherwise."""
+
+    if isinstance(component, ArithmeticOperation):
+        return "number"
+
+    if not isinstance(component, Scalar):
+        return None
+
+    value = component.value
+
+    if isinstance(value, properties.StringProperty):
+        return "text"
+
+    if isinstance(value, _NUMERIC_PROPERTIES):
+        return "number"
+
+    if isinstance(value, list):
+        kinds = {_kind(v) for v in value}
+        return kinds.pop() if len(kinds) == 1 else None
+
+    if isinstance(value, str):
+        return "text"
+
+    if isinstance(value, (int, float)):
+        return "number"
 
-        return f"SELECT {listed_fields} {from_table} {cond} {limit}"
+    return None
@@ -1,13 +1,36 @@
-from src.connection import Connection
-from src.properties import *
+from src.connection import Connection, MemorySqliteConnection, SqliteConnection
+from src.memory_index import MemoryIndex, ModelIndexes
+from src.result_cache import ResultCache
+from src.static_storage import StaticStorage
+from src import query_builder
+from src import snapshot
+from src.properties import DISCRIMINATOR, Discriminator, ForeignKey, ListProperty, PrimaryKey, Property
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+import os
+import re
+import sqlite3
+import zlib
+from typing import Any, Dict, Iterable, List, Sequence, Set, Tuple
+import queue
+import threading
 
 
 class Repository(ABC):
+    # Whether rows of a table are spread across databases, so that joins and
+    # subqueries executed by each database only see rows of that database.
+    partitioned = False
+
     @abstractmethod
     def insert_object(self, obj: type['ModelMeta']):
         ...
 
+    @abstractmethod
+    def insert_columns(self, model: type["ModelMeta"], columns: Dict[str, Sequence], cache: bool = False):
+        ...
+
     @abstractmethod
     def delete_model(self, model: type["ModelMeta"]):
         ...
@@ -21,7 +44,7 @@ class Repository(ABC):
         ...
 
     @abstractmethod
-    def get_rows(self, query):
+    def get_rows(self, query, tables: Iterable[str] = ()):
         ...
 
     @abstractmethod
@@ -40,40 +63,357 @@ class Repository(ABC):
     def update_cache(self, objects: List["ModelMeta"]):
         ...
 
+    @abstractmethod
+    def cached_objects(self, model: type["ModelMeta"], condition=None) -> List["ModelMeta"] | None:
+        ...
+
+    @abstractmethod
+    def cached_values(self, model: type["ModelMeta"], condition=None) -> Tuple[List["ModelMeta"], List[Dict[str, Any]]] | None:
+        ...
+
+    @abstractmethod
+    def model_types(self, model: type["ModelMeta"]) -> Dict[str, type["ModelMeta"]]:
+        ...
+
 
 class SqlRepository(Repository):
-    def __init__(self, connection: Connection) -> None:
+    def __init__(self, connection: Connection, result_cache: ResultCache | None = None) -> None:
+        """Initializes repository.
+
+        Args:
+            connection: Connection to the database.
+            result_cache: Optional cache of selected rows, invalidated
+                whenever the repository modifies a table they were read from.
+        """
+
         self._connection = connection
-        self._cache = dict()
+        self._result_cache = result_cache
+        # Objects by table, models sharing a table share their identity map.
+        self._cache: Dict[str, Dict[int, "ModelMeta"]] = dict()
+        self._cache_lock = threading.RLock()
+        self._fully_cached: Dict[type["ModelMeta"], ModelIndexes] = dict()
+        # Migrated models by table and discriminator value.
+        self._table_models: Dict[str, Dict[str, type["ModelMeta"]]] = dict()
 
     @property
     def connection(self):
         return self._connection
 
+    @property
+    def result_cache(self) -> ResultCache | None:
+        return self._result_cache
+
+    @property
+    def db_paths(self) -> Set[str]:
+        """Returns paths of databases the repository's connections execute queries on."""
+
+        return {self.connection.db_path}
+
+    def set_profile(self, profile: str | Dict[str, str | int]):
+        """Sets PRAGMA profile (see connection.PROFILES) of the repository's connections."""
+
+        self.connection.profile = profile
+
     def get_objects(self, model: type["ModelMeta"], ids: List[int]):
         """Returns requested objects from cache.
 
+        Objects of subclasses of the model are returned as well.
+
         Args:
             ids: List of ids of objects to be returned.
         """
 
-        if model not in self._cache:
-            self._cache[model] = []
+        with self._cache_lock:
+            cached = self._cache.setdefault(model.table_name, {})
+
+            return [cached[id] for id in ids if id in cached and isinstance(cached[id], model)]
+
+    def model_types(self, model: type["ModelMeta"]) -> Dict[str, type["ModelMeta"]]:
+        """Returns the model and its migrated subclasses by discriminator value.
+
+        Rows of the model's table whose discriminator is one of the values
+        are selected by selections of the model.
+        """
+
+        types = {
+            name: cls for name, cls in self._table_models.get(model.table_name, {}).items()
+            if issubclass(cls, model)
+        }
 
-        return [obj for obj in self._cache[model] if getattr(obj, obj.primary_key.name) in ids]
+        return types or {model.__name__: model}
 
     def update_cache(self, objects: List["ModelMeta"]):
         """Updates cache with new objects.
 
+        Objects whose primary key is already cached are not replaced, so
+        concurrent loads of the same row resolve to a single instance.
+
         Args:
             objects: List of objects to be added to cache.
+
+        Returns:
+            List of cached instances corresponding to the passed objects.
+        """
+
+        cached_objects = []
+        # Table, primary key and indexes by class, looked up once per call.
+        models: Dict[type["ModelMeta"], tuple] = dict()
+
+        with self._cache_lock:
+            for obj in objects:
+                model = type(obj)
+
+                if model not in models:
+                    models[model] = (self._cache.setdefault(model.table_name, {}),
+                                     model.primary_key.name, self._indexes_of(model))
+
+                cached, primary_key, indexes = models[model]
+                obj_id = getattr(obj, primary_key)
+                cached_obj = cached.setdefault(obj_id, obj)
+                cached_objects.append(cached_obj)
+
+                if cached_obj is obj:
+                    for model_indexes in indexes:
+                        model_indexes.add(obj_id, obj)
+
+        return cached_objects
+
+    def _replace_cached(self, model: type["ModelMeta"], obj_id: int, obj: "ModelMeta"):
+        # Saved object replaces the cached one, its indexed values may have changed.
+        with self._cache_lock:
+            cached = self._cache.setdefault(model.table_name, {})
+
+            if obj_id in cached:
+                cached[obj_id] = obj
+
+                for model_indexes in self._indexes_of(model):
+                    model_indexes.add(obj_id, obj)
+
+    def _indexes_of(self, model: type["ModelMeta"]) -> List[ModelIndexes]:
+        # Objects of a model are selected by the model and its parents.
+        with self._cache_lock:
+            return [indexes for cached, indexes in self._fully_cached.items() if issubclass(model, cached)]
+
+    def cache_model(self, model: type["ModelMeta"], indexes: Iterable[MemoryIndex] = ()):
+        """Loads all objects of the model into cache and keeps them there.
+
+        Selections of the model are then evaluated in memory, as long as
+        their conditions can be compiled (see QueryComponent.compile).
+        Meant for small lookup tables. The cache is kept consistent with
+        writes made through this repository; rows written by other
+        processes are not seen until clear_cache() and cache_model() are
+        called again.
+
+        Args:
+            model: Model to be cached.
+            indexes: In-memory indexes (HashIndex, SortedIndex) over
+                properties of the model, used to avoid scanning all objects.
+        """
+
+        model.selection.evaluate()
+        self._mark_fully_cached(model, indexes)
+
+    def _mark_fully_cached(self, model: type["ModelMeta"], indexes: Iterable[MemoryIndex] = ()):
+        model_indexes = ModelIndexes(indexes)
+
+        with self._cache_lock:
+            for obj_id, obj in self._cache.get(model.table_name, {}).items():
+                if isinstance(obj, model):
+                    model_indexes.add(obj_id, obj)
+
+            self._fully_cached[model] = model_indexes
+
+    def export_snapshot(self, models: Iterable[type["ModelMeta"]], path: str) -> int:
+        """Writes all rows of the models and join tables of their list properties to a snapshot file.
+
+        The file is columnar and binary (see src.snapshot), to be loaded by
+        import_snapshot, e.g. by workers warming their caches at start.
+
+        Args:
+            models: Exported models, rows of their subclasses included.
+            path: Path of the snapshot file.
+
+        Returns:
+            Number of exported rows of the models.
         """
 
-        for obj in objects:
-            if type(obj) not in self._cache:
-                self._cache[type(obj)] = []
+        tables = []
+        rows = 0
 
-            self._cache[type(obj)].append(obj)
+        for model in models:
+            types = self.model_types(model)
+            columns = model.selection.columns(*query_builder._loaded_properties(model, types))
+            tables.append({"model": model.__name__, "columns": columns})
+            rows += len(columns[DISCRIMINATOR])
+
+            exported = set()
+
+            for cls in types.values():
+                for prop in cls.list_properties:
+                    # Subclasses inherit list properties of their parents.
+                    if prop.name in exported:
+                        continue
+
+                    exported.add(prop.name)
+                    list_table_name = f"{model.table_name}_{prop.name}"
+                    link_rows = self.get_rows(
+                        f"SELECT {model.table_name}_id, {prop.name}_id FROM {list_table_name} ORDER BY rowid")
+                    tables.append({"model": cls.__name__, "list_property": prop.name,
+                                   "columns": {"owner": [row[0] for row in link_rows], "item": [row[1] for row in link_rows]}})
+
+        snapshot.write(path, tables)
+
+        return rows
+
+    def import_snapshot(self, path: str, memory_map: bool = False, cache_models: bool = False) -> int:
+        """Loads objects from a snapshot file into cache, without SQL.
+
+        Related objects found in the snapshot are assigned to foreign keys
+        and list properties. Selections still query the database, but
+        imported objects needn't be hydrated again.
+
+        Args:
+            path: Path of a file written by export_snapshot.
+            memory_map: Whether to map the file into memory instead of
+                reading it at once.
+            cache_models: Whether to mark imported models fully cached
+                (see cache_model), so that selections are answered in
+                memory. Only use it if the database holds the rows of the
+                snapshot and is written only through this repository, as
+                other rows aren't seen until clear_cache().
+
+        Returns:
+            Number of imported objects.
+
+        Raises:
+            ValueError: If a model of the snapshot isn't initialized or its
+                columns have changed since the export.
+        """
+
+        imported: List["ModelMeta"] = []
+        lists = []
+
+        for table in snapshot.read(path, memory_map):
+            model = StaticStorage.get_model_by_name(table["model"], self)
+
+            if model is None:
+                raise ValueError(f"Model '{table['model']}' of the snapshot isn't initialized!")
+
+            if "list_property" in table:
+                lists.append((model, table))
+                continue
+
+            types = self.model_types(model)
+            names = [prop.name for prop in query_builder._loaded_properties(model, types)]
+
+            if list(table["columns"]) != names:
+                raise ValueError(f"Columns of '{model.__name__}' have changed since the export!")
+
+            rows = zip(*table["columns"].values())
+            # Columns match the model's properties, objects needn't be validated.
+            imported += self.update_cache(query_builder._hydrate(model, rows, types, trusted=True))
+
+            if cache_models:
+                self._mark_fully_cached(model)
+
+        with self._cache_lock:
+            foreign_keys = {model: [(prop.name, self._cache.get(prop.referenced_type.table_name, {}))
+                                    for prop in model.foreign_keys]
+                            for model in {type(obj) for obj in imported}}
+
+            for obj in imported:
+                for name, referenced in foreign_keys[type(obj)]:
+                    value = obj.__dict__.get(name)
+
+                    if isinstance(value, int):
+                        obj.__dict__[name] = referenced.get(value, value)
+
+            for model, table in lists:
+                prop = next(prop for prop in model.list_properties if prop.name == table["list_property"])
+                items = self._cache.get(prop.contained_type.table_name, {})
+                listed: Dict[int, List["ModelMeta"]] = dict()
+
+                for owner, item in zip(table["columns"]["owner"], table["columns"]["item"]):
+                    listed.setdefault(owner, []).append(items.get(item))
+
+                # Lists of cached owners missing in the snapshot are left as they are.
+                for obj in imported:
+                    if isinstance(obj, model):
+                        objects = listed.get(getattr(obj, obj.primary_key.name), [])
+
+                        # Lists with items missing in the snapshot are loaded by selections.
+                        if None not in objects:
+                            obj.__dict__[prop.name] = objects
+
+        return len(imported)
+
+    def cached_objects(self, model: type["ModelMeta"], condition=None) -> List["ModelMeta"] | None:
+        """Returns cached objects of a fully cached model in primary key order.
+
+        Args:
+            model: Model of the objects.
+            condition: Condition of a selection. If given, indexes of the
+                model narrow the returned objects to those which may
+                satisfy it.
+
+        Returns:
+            List of objects, or None if the model isn't fully cached.
+        """
+
+        cached = self.cached_values(model, condition)
+
+        return None if cached is None else cached[0]
+
+    def cached_values(self, model: type["ModelMeta"], condition=None) -> Tuple[List["ModelMeta"], List[Dict[str, Any]]] | None:
+        """Returns cached objects of a fully cached model with values last saved or loaded.
+
+        Values don't include changes of the objects which aren't saved, so
+        in-memory selections match what SQL would select.
+
+        Returns:
+            Objects (see cached_objects) and dicts of their values, or None
+            if the model isn't fully cached.
+        """
+
+        with self._cache_lock:
+            if model not in self._fully_cached:
+                return None
+
+            model_indexes = self._fully_cached[model]
+            cached = self._cache.get(model.table_name, {})
+            ids = None if condition is None else model_indexes.candidates(condition)
+            ids = [id for id in sorted(cached if ids is None else ids) if id in cached]
+
+            if len(self.model_types(model)) < len(self._table_models.get(model.table_name, {})):
+                # The table contains rows of parent models too.
+                ids = [id for id in ids if isinstance(cached[id], model)]
+
+            return [cached[id] for id in ids], model_indexes.saved_values(ids)
+
+    def index_stats(self, model: type["ModelMeta"]) -> List[Dict[str, Any]]:
+        """Returns statistics of in-memory indexes of a fully cached model.
+
+        Every entry has the indexed property, kind of the index, number of
+        entries, number of selections it answered (hits), their share of
+        in-memory selections of the model (hit_rate) and approximate
+        memory overhead in bytes.
+        """
+
+        with self._cache_lock:
+            if model not in self._fully_cached:
+                return []
+
+            return self._fully_cached[model].stats()
+
+    def clear_cache(self):
+        """Removes all objects and cached results from cache."""
+
+        with self._cache_lock:
+            self._cache.clear()
+            self._fully_cached.clear()
+
+        if self._result_cache is not None:
+            self._result_cache.clear()
 
     def migrate(self, model: type["ModelMeta"]):
         """
@@ -94,7 +434,7 @@ class SqlRepository(Repository):
 
             return True
 
-        self._cache[model] = []
+        self._invalidate(model.table_name, *self._list_tables(model))
 
         if is_child_of_another_model(model):
             parent = model.__bases__[0]
@@ -108,8 +448,16 @@ class SqlRepository(Repository):
             for property in new_properties:
                 self._add_new_property(property, model)
 
+            # Selections of subclasses filter rows by their class.
+            self._create_index(model.table_name, DISCRIMINATOR)
+
         # The model is the base class.
         else:
+            with self._cache_lock:
+                self._cache[model.table_name] = {}
+                self._table_models[model.table_name] = {}
+                self._uncache_table(model.table_name)
+
             self._execute_query(f"DROP TABLE IF EXISTS {model.table_name}")
 
             query = f"CREATE TABLE IF NOT EXISTS {model.table_name} ({model.primary_key.name} {model.primary_key.get_type_str()})"
@@ -120,6 +468,11 @@ class SqlRepository(Repository):
             ]:
                 self._add_new_property(property, model)
 
+            self._add_new_property(Discriminator(model), model)
+
+        with self._cache_lock:
+            self._table_models.setdefault(model.table_name, {})[model.__name__] = model
+
     def row_exists(self, model, id):
         """Checks if a row with the given object's id exists in the database.
 
@@ -132,6 +485,7 @@ class SqlRepository(Repository):
 
         table_name = model.table_name
         query = f"SELECT 1 FROM {table_name} WHERE id = {id} LIMIT 1"
+        # Part of the write path, so it must not read from a stale replica.
         result = self._execute_query(query)
         return len(result) > 0
 
@@ -159,12 +513,14 @@ class SqlRepository(Repository):
             obj: Object to be deleted.
         """
 
-        if obj not in self._cache[type(obj)]:
-            return
-
         model = obj.__class__
         table_name = model.table_name
         obj_id = getattr(obj, obj.primary_key.name)
+
+        with self._cache_lock:
+            if obj_id not in self._cache.get(table_name, {}):
+                return
+
         list_properties = [prop for prop in model.properties if isinstance(
             prop, ListProperty)]
         for list_prop in list_properties:
@@ -176,7 +532,13 @@ class SqlRepository(Repository):
 
         query = f'DELETE FROM {table_name} WHERE id = {obj_id}'
         self._execute_query(query)
-        self._cache[model].remove(obj)
+        self._invalidate(table_name, *self._list_tables(model))
+
+        with self._cache_lock:
+            self._cache[table_name].pop(obj_id, None)
+
+            for model_indexes in self._indexes_of(model):
+                model_indexes.remove(obj_id)
 
     def insert_object(self, obj: 'ModelMeta'):
         """Inserts object into database.
@@ -186,48 +548,138 @@ class SqlRepository(Repository):
         """
 
         model = obj.__class__
+        values = self._stored_values(obj)
 
-        properties = [prop for prop in model.properties if not isinstance(
-            prop, ListProperty)]
+        obj_id = getattr(obj, obj.primary_key.name)
+        if str(obj_id) != f"PrimaryKey:{obj.primary_key.name}" and self.row_exists(obj, obj_id):
+            self.update_row(model, obj_id, values)
 
-        values = dict()
+            self._replace_cached(model, obj_id, obj)
+        else:
+            _, last_id = self._insert(model, values)
+            setattr(obj, obj.primary_key.name, last_id)
+
+            self.update_cache([obj])
 
-        for prop in properties:
+        self._save_list_items(obj, self._execute_query)
+        self._invalidate(model.table_name, *self._list_tables(model))
+
+    @staticmethod
+    def _stored_values(obj: "ModelMeta") -> Dict[str, Any]:
+        """Returns values of the object's columns, except the primary key.
+
+        The discriminator column is set to the object's class name.
+        """
+
+        values = {DISCRIMINATOR: obj.__class__.__name__}
+
+        for prop in obj.__class__.properties:
             if isinstance(prop, ForeignKey):
                 values[prop.name] = getattr(
                     getattr(obj, prop.name), getattr(obj, prop.name).primary_key.name)
 
-            elif not isinstance(prop, PrimaryKey):
+            elif not isinstance(prop, (PrimaryKey, ListProperty)):
                 values[prop.name] = getattr(obj, prop.name)
 
-        obj_id = getattr(obj, obj.primary_key.name)
-        if str(obj_id) != f"PrimaryKey:{obj.primary_key.name}" and self.row_exists(obj, obj_id):
-            self.update_row(model, obj_id, values)
-            for i, cached_obj in enumerate(self._cache[model]):
-                if getattr(cached_obj, cached_obj.primary_key.name) == obj_id:
-                    self._cache[model][i] = obj
-                    break
-        else:
-            _, last_id = self._insert(model, values)
-            setattr(obj, obj.primary_key.name, last_id)
+        return values
 
-            self.update_cache([obj])
+    @staticmethod
+    def _save_list_items(obj: "ModelMeta", execute):
+        """Replaces rows of the object's list properties in join tables.
+
+        Args:
+            obj: Saved object.
+            execute: Function executing a modifying query.
+        """
 
-        # Handle ListProperty
+        model = obj.__class__
         obj_id = getattr(obj, obj.primary_key.name)
-        list_properties = [prop for prop in model.properties if isinstance(
-            prop, ListProperty)]
-        for list_prop in list_properties:
-            # Create a new table for the ListProperty
+
+        for list_prop in model.list_properties:
             list_table_name = f"{model.table_name}_{list_prop.name}"
             # Delete old rows
-            self._execute_query(
+            execute(
                 f"DELETE FROM {list_table_name} WHERE {model.table_name}_id = {obj_id}")
             # Insert the primary key of the object and the primary key of each item in the list into the new table
             for item in getattr(obj, list_prop.name):
-                self._execute_query(
+                execute(
                     f"INSERT INTO {list_table_name} ({model.table_name}_id,{list_prop.name}_id)  VALUES ({obj_id}, {getattr(item, item.primary_key.name)})")
 
+    def insert_columns(self, model: type["ModelMeta"], columns: Dict[str, Sequence], cache: bool = False):
+        """Inserts rows given as columns of values in a single transaction.
+
+        Rows are streamed to executemany without creating model instances.
+
+        Args:
+            model: Model of inserted rows.
+            columns: Equally long sequences of values, named after stored
+                properties of the model.
+            cache: Whether to create objects for inserted rows and add them
+                to cache.
+
+        Returns:
+            Number of inserted rows.
+        """
+
+        names = list(columns)
+        props = {prop.name: prop for prop in model.properties}
+        foreign_keys = [i for i, name in enumerate(names) if isinstance(
+            props[name], ForeignKey)]
+        # Fully cached models must see every inserted row.
+        cache = cache or bool(self._indexes_of(model))
+
+        values = [
+            column if isinstance(column, (list, tuple)) or not hasattr(column, "tolist") else column.tolist()
+            for column in columns.values()
+        ]
+
+        rows = zip(*values)
+
+        if foreign_keys:
+            rows = (self._with_foreign_ids(row, foreign_keys) for row in rows)
+
+        query = self._insert_columns_query(model, names)
+
+        with self._write_connection() as connection:
+            with connection as db:
+                count = db.execute_many(query, rows)
+                last_id = db.execute_query("SELECT last_insert_rowid()")[0][0][0]
+
+        self._invalidate(model.table_name)
+
+        if cache:
+            primary_key = model.primary_key.name
+
+            if primary_key not in columns:
+                # Single writer transaction assigns consecutive ids.
+                names.append(primary_key)
+                values.append(range(last_id - count + 1, last_id + 1))
+
+            self.update_cache([model(**dict(zip(names, row)))
+                              for row in zip(*values)])
+
+        return count
+
+    @staticmethod
+    def _insert_columns_query(model: type["ModelMeta"], names: List[str]) -> str:
+        # The discriminator is a constant, rows are passed as they are.
+        placeholders = ", ".join("?" for _ in names)
+
+        return (
+            f'INSERT OR REPLACE INTO {model.table_name} ({", ".join([*names, DISCRIMINATOR])}) '
+            f"VALUES ({placeholders}, '{model.__name__}')"
+        )
+
+    @staticmethod
+    def _with_foreign_ids(row: tuple, foreign_keys: List[int]) -> tuple:
+        row = list(row)
+
+        for i in foreign_keys:
+            if row[i] is not None and not isinstance(row[i], (int, str)):
+                row[i] = getattr(row[i], row[i].primary_key.name)
+
+        return tuple(row)
+
     def update_row(self, model, id, values):
         """
         Updates row in table with given id.
@@ -246,15 +698,57 @@ class SqlRepository(Repository):
 
         query = f'UPDATE {table_name} SET {updates} WHERE id = {id}'
         self._execute_query(query)
+        self._invalidate(table_name)
+
+    def get_listed_objects_ids(self, object: "ModelMeta", list_property: ListProperty, cached: bool = True):
+        """Returns ids of objects listed by the object.
 
-    def get_listed_objects_ids(self, object: "ModelMeta", list_property: ListProperty):
+        Args:
+            cached: Whether the ids may be taken from and stored in result cache.
+        """
 
         list_table_name = f"{object.table_name}_{list_property.name}"
         query = f"SELECT {list_property.name}_id FROM {list_table_name} WHERE {object.table_name}_id = {getattr(object, object.primary_key.name)}"
-        ids = self._execute_query(query)[0]
+        ids = self.get_rows(query, {list_table_name} if cached else ())
 
         return [id[0] for id in ids]
 
+    def get_listed_rows(self, model: type["ModelMeta"], list_property: ListProperty, ids: List[int],
+                        selected: List[Property] | None = None):
+        """Returns rows of objects listed by objects with the given ids, in one query.
+
+        Args:
+            model: Model owning the list property.
+            list_property: List property of the model.
+            ids: Ids of objects of the model.
+            selected: Selected columns of the listed objects, their stored
+                properties by default.
+
+        Returns:
+            Rows of selected columns of the listed objects, each followed
+            by id of the listing object, ordered by that id and then by id
+            of the listed object.
+        """
+
+        list_table_name = f"{model.table_name}_{list_property.name}"
+        listed_model = list_property.contained_type
+        listed_table_name = listed_model.table_name
+
+        if selected is None:
+            selected = [prop for prop in listed_model.properties if not isinstance(prop, ListProperty)]
+
+        fields = ", ".join(f"{listed_table_name}.{prop.name}" for prop in selected)
+        owner_id = f"{list_table_name}.{model.table_name}_id"
+
+        query = (
+            f"SELECT DISTINCT {fields}, {owner_id} FROM {list_table_name} "
+            f"JOIN {listed_table_name} ON {listed_table_name}.{listed_model.primary_key.name} = {list_table_name}.{list_property.name}_id "
+            f"WHERE {owner_id} IN ({', '.join(str(id) for id in ids)}) "
+            f"ORDER BY {owner_id}, {listed_table_name}.{listed_model.primary_key.name}"
+        )
+
+        return self.get_rows(query, {list_table_name, listed_table_name})
+
     def _format_value(self, value):
         """Formats a value for use in an SQL query."""
         if isinstance(value, str):
@@ -276,17 +770,71 @@ class SqlRepository(Repository):
             # Delete table
             self._execute_query(f"DROP TABLE IF EXISTS {list_table_name}")
         self._execute_query(f"DROP TABLE IF EXISTS {table_name}")
-        self._cache.pop(model, None)
+        self._invalidate(table_name, *self._list_tables(model))
+
+        with self._cache_lock:
+            self._cache.pop(table_name, None)
+            self._table_models.pop(table_name, None)
+            self._uncache_table(table_name)
+
+    @staticmethod
+    def _list_tables(model: type["ModelMeta"]) -> List[str]:
+        """Returns names of join tables of the model's list properties."""
+
+        return [f"{model.table_name}_{prop.name}" for prop in model.properties if isinstance(prop, ListProperty)]
+
+    def _uncache_table(self, table_name: str):
+        # Models stored in a dropped table are no longer fully cached.
+        for cached in list(self._fully_cached):
+            if cached.table_name == table_name:
+                del self._fully_cached[cached]
+
+    def _invalidate(self, *tables: str):
+        if self._result_cache is not None:
+            self._result_cache.invalidate(*tables)
 
     def _execute_query(self, query):
         """
         establish a connection with db, execute query and close connection.
         If query gives some results function returns them.
         """
-        with self.connection as db:
-            results = db.execute_query(query)
+        with self._write_connection() as connection:
+            return self._execute_query_on(connection, query)
+
+    def _execute_query_on(self, connection: Connection, query, params=()):
+        with connection as db:
+            return db.execute_query(query, params)
+
+    @contextmanager
+    def _write_connection(self):
+        """
+        Provides connection for queries that modify the database.
+        """
+        yield self.connection
+
+    @contextmanager
+    def _read_connection(self):
+        """
+        Provides connection for queries that don't modify the database.
+        Repositories with dedicated read connections override this.
+        """
+        yield self.connection
 
-        return results
+    def _execute_read_query(self, query, params=()):
+        with self._read_connection() as connection:
+            return self._execute_query_on(connection, query, params)
+
+    def iter_rows(self, query, batch_size: int = 1000):
+        """Yields results of the query in batches, without fetching all rows at once.
+
+        Args:
+            query: Query to be executed.
+            batch_size: Number of rows in a batch.
+        """
+
+        with self._read_connection() as connection:
+            with connection as db:
+                yield from db.fetch_batches(query, batch_size)
 
     def _add_new_property(self, property: Property, model: type["ModelMeta"]):
         """
@@ -302,6 +850,8 @@ class SqlRepository(Repository):
             relation_fields = f"\n{table_name}_id INTEGER,\n{property_key}_id INTEGER,"
             relation_query = f"CREATE TABLE IF NOT EXISTS {relation_table_name} ({relation_fields[:-1]}, FOREIGN KEY({table_name}_id) REFERENCES {table_name}(id), FOREIGN KEY({property_key}_id) REFERENCES {property.contained_type.table_name}(id))"
             self._execute_query(relation_query)
+            # Related objects are always looked up by the owner's id.
+            self._create_index(relation_table_name, f"{table_name}_id")
 
         else:
             query = (
@@ -309,5 +859,729 @@ class SqlRepository(Repository):
             )
             self._execute_query(query)
 
-    def get_rows(self, query):
-        return self._execute_query(query)[0]
+            if property.index:
+                self._create_index(table_name, property_key)
+
+    def _create_index(self, table_name: str, column: str):
+        self._execute_query(
+            f"CREATE INDEX IF NOT EXISTS ix_{table_name}_{column} ON {table_name} ({column})")
+
+    def explain(self, query, params=()) -> List[str]:
+        """Returns details of the query plan of the query.
+
+        Args:
+            query: Query to be explained.
+            params: Parameters bound to the query.
+        """
+
+        rows = self._execute_read_query(f"EXPLAIN QUERY PLAN {query}", params)[0]
+
+        return [row[-1] for row in rows]
+
+    def get_rows(self, query, tables: Iterable[str] = ()):
+        """Returns rows selected by the query.
+
+        Args:
+            query: Query to be executed.
+            tables: Tables the query reads from. If given and the repository
+                has result cache, the rows are cached until one of the
+                tables is modified.
+        """
+
+        if self._result_cache is None or not tables:
+            return self._execute_read_query(query)[0]
+
+        key = (query, ())
+        rows = self._result_cache.get(key)
+
+        if rows is None:
+            versions = self._result_cache.versions(tables)
+            cacheable = self._cacheable(tables)
+            rows = self._execute_read_query(query)[0]
+
+            if cacheable:
+                self._result_cache.put(key, tables, rows, versions)
+
+        return rows
+
+    def _cacheable(self, tables: Iterable[str]) -> bool:
+        """Returns whether rows read from the tables can be stored in result cache.
+
+        Repositories reading from connections which may lag behind override this.
+        """
+
+        return True
+
+
+class _Session:
+    def __init__(self):
+        self.dirty = False
+
+
+class ThreadSafeSqlRepository(SqlRepository):
+    """SqlRepository which can be shared between threads.
+
+    The database is switched to WAL journal mode. All writes are
+    serialized through the single connection passed to the constructor,
+    while reads are spread over a pool of reader connections, so readers
+    neither block each other nor the writer.
+
+    Readers are read-only connections to the same file by default, but
+    can be replicas, e.g. connections to periodically refreshed copies of
+    the database file or MemorySqliteConnections. Replicas may lag behind
+    the primary; use session() to read your own writes.
+    """
+
+    def __init__(self, connection: SqliteConnection, readers: int | List[Connection] = 4,
+                 result_cache: ResultCache | None = None) -> None:
+        """Initializes repository.
+
+        Args:
+            connection: Primary connection used for all writes.
+            readers: Number of read-only connections to the primary database
+                file, or list of connections to replicas.
+            result_cache: Optional cache of selected rows.
+        """
+
+        super().__init__(connection, result_cache)
+        self._write_lock = threading.RLock()
+        self._readers: queue.Queue[Connection] = queue.Queue()
+        self._session: contextvars.ContextVar[_Session | None] = contextvars.ContextVar(
+            f"session_{id(self)}", default=None)
+
+        if isinstance(readers, int):
+            readers = [SqliteConnection(connection.db_path, read_only=True, persistent=True,
+                                        profile=connection.profile) for _ in range(readers)]
+
+        self._reader_count = len(readers)
+        self._reader_paths = {reader.db_path for reader in readers}
+        # Tables written since replicas were last refreshed, their rows read from replicas aren't cached.
+        self._has_replicas = any(isinstance(reader, MemorySqliteConnection) or reader.db_path != connection.db_path
+                                 for reader in readers)
+        self._lagging_tables: Set[str] = set()
+        # Version and profile set by set_profile, applied to readers as they are taken from the pool.
+        self._reader_profile: tuple = (0, None)
+        self._reader_versions: Dict[Connection, int] = dict()
+
+        for reader in readers:
+            self._readers.put(reader)
+
+        self._execute_query("PRAGMA journal_mode=WAL")
+
+    @property
+    def db_paths(self) -> Set[str]:
+        return {self.connection.db_path, *self._reader_paths}
+
+    @contextmanager
+    def session(self):
+        """Provides read-your-writes consistency within the block.
+
+        Once the block writes through the repository, its subsequent reads
+        are routed to the primary connection instead of the replicas.
+        """
+
+        token = self._session.set(_Session())
+
+        try:
+            yield
+
+        finally:
+            self._session.reset(token)
+
+    def refresh_replicas(self):
+        """Copies the primary database into replica files and in-memory replicas.
+
+        Waits for reads in progress, reads are blocked during the refresh.
+        Cached results are dropped once the replicas are replaced.
+        """
+
+        readers = [self._readers.get() for _ in range(self._reader_count)]
+
+        try:
+            # Tables written from now on may be missing in the copies.
+            with self._write_lock:
+                self._lagging_tables = set()
+
+            replica_paths = {
+                reader.db_path for reader in readers
+                if not isinstance(reader, MemorySqliteConnection) and reader.db_path != self.connection.db_path
+            }
+
+            for path in replica_paths:
+                target = sqlite3.connect(f"{path}.tmp")
+
+                try:
+                    with self._write_lock:
+                        self.connection.backup(target)
+
+                    # read-only connections cannot create the WAL index
+                    target.execute("PRAGMA journal_mode=DELETE")
+
+                finally:
+                    target.close()
+
+            memory_readers = [reader for reader in readers if isinstance(reader, MemorySqliteConnection)]
+
+            if memory_readers:
+                snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+
+                try:
+                    with self._write_lock:
+                        self.connection.backup(snapshot)
+
+                    for reader in memory_readers:
+                        reader.restore(snapshot)
+
+                finally:
+                    snapshot.close()
+
+            for reader in readers:
+                if reader.db_path in replica_paths:
+                    reader.dispose()
+
+            for path in replica_paths:
+                os.replace(f"{path}.tmp", path)
+
+            if self._result_cache is not None:
+                self._result_cache.clear()
+
+        finally:
+            for reader in readers:
+                self._readers.put(reader)
+
+    def set_profile(self, profile: str | Dict[str, str | int]):
+        """Switches the profile of the primary connection and all readers.
+
+        Readers switch when they are next taken from the pool, so readers
+        in use by other threads keep the old PRAGMAs only until they are
+        released.
+        """
+
+        with self._write_lock:
+            super().set_profile(profile)
+
+        self._reader_profile = (self._reader_profile[0] + 1, profile)
+
+    def _invalidate(self, *tables: str):
+        if self._has_replicas:
+            with self._write_lock:
+                self._lagging_tables.update(tables)
+
+        super()._invalidate(*tables)
+
+    def _cacheable(self, tables: Iterable[str]) -> bool:
+        session = self._session.get()
+
+        # Reads of a session which wrote are routed to the primary connection.
+        if session is not None and session.dirty:
+            return True
+
+        return self._lagging_tables.isdisjoint(tables)
+
+    @contextmanager
+    def _write_connection(self):
+        session = self._session.get()
+
+        if session is not None:
+            session.dirty = True
+
+        with self._write_lock:
+            yield self.connection
+
+    @contextmanager
+    def _read_connection(self):
+        session = self._session.get()
+
+        if session is not None and session.dirty:
+            with self._write_lock:
+                yield self.connection
+
+            return
+
+        reader = self._readers.get()
+
+        try:
+            version, profile = self._reader_profile
+
+            if self._reader_versions.get(reader, 0) != version:
+                reader.profile = profile
+                self._reader_versions[reader] = version
+
+            yield reader
+
+        finally:
+            self._readers.put(reader)
+
+    def close(self):
+        """Closes all persistent connections of the repository.
+
+        Connections are reopened on next use.
+        """
+
+        for reader in list(self._readers.queue):
+            reader.dispose()
+
+        if isinstance(self.connection, SqliteConnection):
+            self.connection.dispose()
+
+
+class ReplicaRefresher(threading.Thread):
+    """Daemon thread periodically refreshing replicas of a repository."""
+
+    def __init__(self, repository: ThreadSafeSqlRepository, interval: float) -> None:
+        """Initializes refresher, call start() to run it.
+
+        Args:
+            repository: Repository whose replicas are refreshed.
+            interval: Number of seconds between refreshes.
+        """
+
+        super().__init__(daemon=True)
+        self.repository = repository
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.repository.refresh_replicas()
+
+    def stop(self):
+        """Stops refreshing and waits for the thread to finish."""
+
+        self._stopped.set()
+        self.join()
+
+
+_AGGREGATES = {"MIN": min, "MAX": max, "SUM": sum, "COUNT": sum}
+_SQL_AGGREGATES = {"AVG", "COUNT", "GROUP_CONCAT", "MAX", "MIN", "SUM", "TOTAL"}
+
+
+class ShardedRepository(SqlRepository):
+    """Repository partitioning rows of every model across several SQLite files.
+
+    Rows are placed by their primary key, or by the property named by the
+    model's shard_key attribute (e.g. shard_key = "customer" keeps orders
+    of a customer together, along with their list property rows). Ids are
+    allocated from a sequence kept in the first shard, so they are unique
+    across shards.
+
+    Schema changes, updates and deletes are applied to all shards, and
+    selections are executed on all shards in parallel, with their results
+    merged. Rows of a LIMIT without ORDER BY come from any shard, as they
+    would come in any order from a single database. Queries whose results
+    can't be merged (GROUP BY, aggregates such as AVG) raise ValueError.
+    """
+
+    def __init__(self, shards: List[SqliteConnection], id_block: int = 1000,
+                 result_cache: ResultCache | None = None) -> None:
+        """Initializes repository.
+
+        Args:
+            shards: Connections to the shard databases. Rows are placed by
+                the position of the connection, so the order must not change.
+            id_block: Number of ids reserved from the sequence at once.
+            result_cache: Optional cache of selected rows.
+        """
+
+        if not shards:
+            raise ValueError("ShardedRepository requires at least one shard!")
+
+        super().__init__(None, result_cache)
+        self._shards = list(shards)
+        self._shard_locks = [threading.RLock() for _ in self._shards]
+        self._pool = ThreadPoolExecutor(len(self._shards))
+        self._id_block = id_block
+        self._ids: Dict[str, Sequence[int]] = dict()
+        self._ids_lock = threading.Lock()
+
+        self._execute_on_shard(
+            0, "CREATE TABLE IF NOT EXISTS shard_sequence (name TEXT PRIMARY KEY, next_id INTEGER)")
+
+    @property
+    def shards(self) -> List[SqliteConnection]:
+        return self._shards
+
+    @property
+    def partitioned(self) -> bool:
+        return len(self._shards) > 1
+
+    @property
+    def db_paths(self) -> Set[str]:
+        return {shard.db_path for shard in self._shards}
+
+    def set_profile(self, profile: str | Dict[str, str | int]):
+        for shard in self._shards:
+            shard.profile = profile
+
+    def shard_index(self, value) -> int:
+        """Returns index of the shard storing rows with the given shard key value.
+
+        Args:
+            value: Primary key, or value of the model's shard key property.
+        """
+
+        if type(value) is int:
+            return value % len(self._shards)
+
+        if value is not None and not isinstance(value, (int, str)):
+            value = getattr(value, value.primary_key.name)
+
+        if value is None:
+            return 0
+
+        if isinstance(value, str):
+            value = zlib.crc32(value.encode())
+
+        return int(value) % len(self._shards)
+
+    def migrate(self, model: type["ModelMeta"]):
+        super().migrate(model)
+
+        with self._ids_lock:
+            self._ids.pop(model.table_name, None)
+
+        self._execute_on_shard(
+            0, f"DELETE FROM shard_sequence WHERE name = '{model.table_name}'")
+
+    def row_exists(self, model, id):
+        query = f"SELECT 1 FROM {model.table_name} WHERE id = {id} LIMIT 1"
+
+        return any(rows for rows, _ in self._fan_out(query))
+
+    def insert_object(self, obj: "ModelMeta"):
+        """Inserts object into the shard selected by its shard key.
+
+        Args:
+            obj: Object to be inserted.
+        """
+
+        model = obj.__class__
+        primary_key = model.primary_key.name
+        obj_id = getattr(obj, primary_key)
+        exists = str(obj_id) != f"PrimaryKey:{primary_key}" and self.row_exists(model, obj_id)
+
+        if str(obj_id) == f"PrimaryKey:{primary_key}":
+            obj_id = self._allocate_ids(model, 1)[0]
+            setattr(obj, primary_key, obj_id)
+
+        values = {primary_key: obj_id, **self._stored_values(obj)}
+        shard = self._shard_of(model, values)
+
+        if exists:
+            # The row moves if its shard key has changed.
+            self._execute_query(f"DELETE FROM {model.table_name} WHERE id = {obj_id}")
+
+            for list_table_name in self._list_tables(model):
+                self._execute_query(
+                    f"DELETE FROM {list_table_name} WHERE {model.table_name}_id = {obj_id}")
+
+        placeholders = ", ".join("?" for _ in values)
+        self._execute_on_shard(
+            shard,
+            f'INSERT OR REPLACE INTO {model.table_name} ({", ".join(values)}) VALUES ({placeholders})',
+            tuple(values.values()))
+
+        if exists:
+            self._replace_cached(model, obj_id, obj)
+
+        else:
+            self.update_cache([obj])
+
+        self._save_list_items(obj, lambda query: self._execute_on_shard(shard, query))
+        self._invalidate(model.table_name, *self._list_tables(model))
+
+    def insert_columns(self, model: type["ModelMeta"], columns: Dict[str, Sequence], cache: bool = False):
+        """Inserts rows given as columns of values, grouped by shard.
+
+        Shards are written in parallel, each in a single transaction.
+
+        Args:
+            model: Model of inserted rows.
+            columns: Equally long sequences of values, named after stored
+                properties of the model.
+            cache: Whether to create objects for inserted rows and add them
+                to cache.
+
+        Returns:
+            Number of inserted rows.
+        """
+
+        names = list(columns)
+        values = [
+            column if isinstance(column, (list, tuple)) or not hasattr(column, "tolist") else column.tolist()
+            for column in columns.values()
+        ]
+        primary_key = model.primary_key.name
+
+        cache = cache or bool(self._indexes_of(model))
+
+        if primary_key not in columns:
+            names.append(primary_key)
+            values.append(self._allocate_ids(model, len(values[0])))
+
+        props = {prop.name: prop for prop in model.properties}
+        foreign_keys = [i for i, name in enumerate(names) if isinstance(
+            props[name], ForeignKey)]
+
+        rows = list(zip(*values))
+
+        if foreign_keys:
+            rows = [self._with_foreign_ids(row, foreign_keys) for row in rows]
+
+        key = names.index(getattr(model, "shard_key", None) or primary_key)
+        by_shard: Dict[int, List[tuple]] = dict()
+
+        for row in rows:
+            by_shard.setdefault(self.shard_index(row[key]), []).append(row)
+
+        query = self._insert_columns_query(model, names)
+
+        def insert(shard: int, shard_rows: List[tuple]):
+            with self._shard_locks[shard], self._shards[shard] as db:
+                return db.execute_many(query, shard_rows)
+
+        futures = [self._submit(insert, shard, shard_rows) for shard, shard_rows in by_shard.items()]
+        count = sum(future.result() for future in futures)
+
+        self._invalidate(model.table_name)
+
+        if cache:
+            self.update_cache([model(**dict(zip(names, row)))
+                              for row in zip(*values)])
+
+        return count
+
+    def get_listed_rows(self, model: type["ModelMeta"], list_property: ListProperty, ids: List[int],
+                        selected: List[Property] | None = None):
+        """Returns rows of objects listed by objects with the given ids.
+
+        Link rows are stored with the listing object, while listed objects
+        may live on other shards, so instead of joining them the link rows
+        and then the listed objects are selected, both from all shards.
+        """
+
+        list_table_name = f"{model.table_name}_{list_property.name}"
+        listed_model = list_property.contained_type
+        listed_table_name = listed_model.table_name
+        primary_key = listed_model.primary_key.name
+        owner_id = f"{model.table_name}_id"
+
+        if selected is None:
+            selected = [prop for prop in listed_model.properties if not isinstance(prop, ListProperty)]
+
+        links = sorted(set(self.get_rows(
+            f"SELECT {owner_id}, {list_property.name}_id FROM {list_table_name} "
+            f"WHERE {owner_id} IN ({', '.join(str(id) for id in ids)})", {list_table_name})))
+
+        listed_ids = {listed_id for _, listed_id in links}
+
+        if not listed_ids:
+            return []
+
+        fields = ", ".join(f"{listed_table_name}.{prop.name}" for prop in selected)
+        rows = self.get_rows(
+            f"SELECT {fields}, {listed_table_name}.{primary_key} FROM {listed_table_name} "
+            f"WHERE {listed_table_name}.{primary_key} IN ({', '.join(str(id) for id in listed_ids)})",
+            {listed_table_name})
+        rows_by_id = {row[-1]: row[:-1] for row in rows}
+
+        return [(*rows_by_id[listed_id], owner) for owner, listed_id in links if listed_id in rows_by_id]
+
+    def explain(self, query, params=()) -> List[str]:
+        # All shards share the schema, so their plans are the same.
+        rows = self._execute_on_shard(0, f"EXPLAIN QUERY PLAN {query}", params)[0]
+
+        return [row[-1] for row in rows]
+
+    def iter_rows(self, query, batch_size: int = 1000):
+        """Yields results of the query in batches, shard by shard.
+
+        Ordered and limited queries are merged first.
+        """
+
+        if re.search(r"\b(ORDER BY|LIMIT)\b", query):
+            rows = self._execute_read_query(query)[0]
+
+            for start in range(0, len(rows), batch_size):
+                yield rows[start:start + batch_size]
+
+            return
+
+        for shard, connection in enumerate(self._shards):
+            with self._shard_locks[shard], connection as db:
+                yield from db.fetch_batches(query, batch_size)
+
+    def close(self):
+        """Closes persistent connections of the shards and the thread pool."""
+
+        self._pool.shutdown()
+
+        for shard in self._shards:
+            shard.dispose()
+
+    def _allocate_ids(self, model: type["ModelMeta"], count: int) -> List[int]:
+        table_name = model.table_name
+
+        with self._ids_lock:
+            ids = self._ids.get(table_name, range(0))
+
+            if len(ids) < count:
+                reserved = max(count - len(ids), self._id_block)
+                shard = self._shards[0]
+
+                with self._shard_locks[0], shard as db:
+                    db.execute_query(
+                        "INSERT OR IGNORE INTO shard_sequence (name, next_id) VALUES (?, 1)", (table_name,))
+                    db.execute_query(
+                        "UPDATE shard_sequence SET next_id = next_id + ? WHERE name = ?", (reserved, table_name))
+                    next_id = db.execute_query(
+                        "SELECT next_id FROM shard_sequence WHERE name = ?", (table_name,))[0][0][0]
+
+                reserved_ids = range(next_id - reserved, next_id)
+                ids = [*ids, *reserved_ids] if ids else reserved_ids
+
+            self._ids[table_name] = ids[count:]
+
+            return list(ids[:count])
+
+    def _shard_of(self, model: type["ModelMeta"], values: Dict[str, Any]) -> int:
+        shard_key = getattr(model, "shard_key", None) or model.primary_key.name
+
+        return self.shard_index(values[shard_key])
+
+    def _submit(self, function, *args):
+        # Instrumentation scopes are context variables, pass them to workers.
+        return self._pool.submit(contextvars.copy_context().run, function, *args)
+
+    def _execute_on_shard(self, shard: int, query, params=()):
+        with self._shard_locks[shard]:
+            return self._execute_query_on(self._shards[shard], query, params)
+
+    def _fan_out(self, query, params=()) -> List[tuple]:
+        if len(self._shards) == 1:
+            return [self._execute_on_shard(0, query, params)]
+
+        futures = [self._submit(self._execute_on_shard, shard, query, params)
+                   for shard in range(len(self._shards))]
+
+        return [future.result() for future in futures]
+
+    def _execute_query(self, query):
+        return self._fan_out(query)[0]
+
+    def _execute_read_query(self, query, params=()):
+        results = [rows for rows, _ in self._fan_out(query, params)]
+
+        return _merge_rows(query, results), None
+
+
+def _merge_rows(query: str, results: List[List[tuple]]) -> List[tuple]:
+    """Merges rows selected by the query from several shards.
+
+    Aggregates (MIN, MAX, SUM, COUNT) are combined, other rows are
+    concatenated, then DISTINCT, ORDER BY and LIMIT of the query are
+    applied again.
+
+    Raises:
+        ValueError: If rows of the shards can't be merged into the result
+            of the query on a single database: it groups rows, uses other
+            aggregates (e.g. AVG) or orders by columns it doesn't select.
+    """
+
+    if len(results) == 1:
+        return results[0]
+
+    if re.search(r"\bGROUP BY\b", query, re.IGNORECASE):
+        raise ValueError(f"Groups of '{query.strip()}' can't be merged across shards!")
+
+    select = re.match(r"\s*SELECT\s+(DISTINCT\s+)?(.*?)\s+FROM\s", query, re.IGNORECASE | re.DOTALL)
+    fields = [] if select is None else _split_fields(select.group(2))
+    functions = [re.match(r"(\w+)\s*\((.*)\)$", field, re.DOTALL) for field in fields]
+    aggregates = [function.group(1).upper() if function and function.group(1).upper() in _SQL_AGGREGATES else None
+                  for function in functions]
+
+    if any(aggregates):
+        # Combining e.g. averages or distinct counts of shards would give wrong values.
+        if not all(aggregate in _AGGREGATES and not re.match(r"DISTINCT\b", function.group(2).strip(), re.IGNORECASE)
+                   for aggregate, function in zip(aggregates, functions)):
+            raise ValueError(f"Aggregates of '{query.strip()}' can't be merged across shards!")
+
+        merged = []
+
+        for aggregate, values in zip(aggregates, zip(*[row for rows in results for row in rows])):
+            values = [value for value in values if value is not None]
+            merged.append(_AGGREGATES[aggregate](values) if values else None)
+
+        return [tuple(merged)]
+
+    rows = [row for rows in results for row in rows]
+
+    if select is not None and select.group(1):
+        rows = list(dict.fromkeys(rows))
+
+    order = re.search(r"\bORDER BY\s+(.*?)(?:\s+LIMIT\s+\d+)?\s*$", query, re.IGNORECASE | re.DOTALL)
+
+    if order is not None:
+        names = [field.split(".")[-1] for field in fields]
+        keys = []
+
+        for key in _split_fields(order.group(1)):
+            column, direction = re.match(r"(.*?)(?:\s+(ASC|DESC))?$", key, re.IGNORECASE | re.DOTALL).groups()
+
+            if column in fields:
+                index = fields.index(column)
+
+            elif column.split(".")[-1] in names:
+                index = names.index(column.split(".")[-1])
+
+            else:
+                raise ValueError(f"Rows of shards can't be ordered by '{column}', which isn't selected!")
+
+            keys.append((index, direction is not None and direction.upper() == "DESC"))
+
+        # Stable sorts from the last key to the first one order rows by all keys.
+        for index, descending in reversed(keys):
+            rows.sort(key=lambda row: _sort_key(row[index]), reverse=descending)
+
+    limit = re.search(r"LIMIT\s+(\d+)\s*$", query, re.IGNORECASE)
+
+    if limit is not None:
+        rows = rows[:int(limit.group(1))]
+
+    return rows
+
+
+def _split_fields(text: str) -> List[str]:
+    """Splits a list of SQL expressions on commas outside of parentheses."""
+
+    fields, depth, start = [], 0, 0
+
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+
+        elif char == ")":
+            depth -= 1
+
+        elif char == "," and depth == 0:
+            fields.append(text[start:i].strip())
+            start = i + 1
+
+    fields.append(text[start:].strip())
+
+    return fields
+
+
+def _sort_key(value) -> tuple:
+    """Returns key ordering values like SQLite: NULLs, numbers, text, then blobs."""
+
+    if value is None:
+        return 0, 0
+
+    if isinstance(value, (int, float)):
+        return 1, value
+
+    if isinstance(value, str):
+        return 2, value
+
+    return 3, bytes(value)
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Set, Tuple
+
+
+class ResultCache:
+    """Cache of query results with table-level invalidation.
+
+    Every entry remembers tables its query reads from. Writing to any
+    of these tables drops the entry. Results of queries that were running
+    while one of their tables was modified are not stored.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        """Initializes cache.
+
+        Args:
+            max_entries: Number of entries kept, least recently used
+                entries are dropped first.
+        """
+
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, Tuple[Set[str], Any]] = OrderedDict()
+        self._keys_by_table: Dict[str, Set[Hashable]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def versions(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """Returns current versions of the tables, to be passed to put."""
+
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in sorted(tables))
+
+    def get(self, key: Hashable, default=None):
+        """Returns cached result for the key."""
+
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+            return self._entries[key][1]
+
+    def put(self, key: Hashable, tables: Iterable[str], value, versions: Tuple[int, ...]):
+        """Stores the result, unless one of the tables changed since versions were taken.
+
+        Args:
+            key: Key of the result, e.g. SQL and its parameters.
+            tables: Tables the query reads from.
+            value: Result to be stored.
+            versions: Versions of the tables taken before running the query.
+        """
+
+        tables = set(tables)
+
+        with self._lock:
+            if versions != tuple(self._versions.get(table, 0) for table in sorted(tables)):
+                return
+
+            self._discard(key)
+            self._entries[key] = (tables, value)
+
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate(self, *tables: str):
+        """Drops all results read from any of the tables."""
+
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+                for key in self._keys_by_table.pop(table, set()):
+                    self._discard(key)
+
+    def clear(self):
+        """Drops all results."""
+
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+
+    def _discard(self, key: Hashable):
+        if key not in self._entries:
+            return
+
+        tables, _ = self._entries.pop(key)
+
+        for table in tables:
+            keys = self._keys_by_table.get(table)
+
+            if keys is not None:
+                keys.discard(key)
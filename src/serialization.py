@@ -0,0 +1,173 @@
+import json
+from typing import Any, Dict, Iterable, List, TextIO
+
+from src import properties
+
+
+class Serializer:
+    """Converts objects and their related objects to dicts of JSON values.
+
+    Every object is serialized once per call of to_dict. Objects met again
+    (shared or cyclic references) are replaced by references, e.g.
+    {"$ref": "Person", "id": 1}.
+    """
+
+    def __init__(self, depth: int | None = None, fields: Iterable[str] | None = None) -> None:
+        """Initializes serializer.
+
+        Args:
+            depth: Number of levels of related objects serialized as dicts,
+                deeper related objects are replaced by their primary keys.
+                Unlimited by default.
+            fields: Names of serialized properties, nested ones separated
+                by "__", e.g. ["name", "class___name"]. A related object
+                without nested names has all its properties serialized.
+                Primary keys are always serialized. All properties by
+                default.
+        """
+
+        self.depth = depth
+        self.fields = None if fields is None else list(fields)
+        self._trees: Dict[type["ModelMeta"], Dict[str, dict]] = dict()
+        self._properties: Dict[tuple, List[properties.Property]] = dict()
+
+    def to_dict(self, obj: "ModelMeta") -> Dict[str, Any]:
+        """Returns values of the object's properties by their names."""
+
+        tree = None
+
+        if self.fields is not None:
+            model = type(obj)
+
+            if model not in self._trees:
+                self._trees[model] = _field_tree(model, self.fields)
+
+            tree = self._trees[model]
+
+        return self._to_dict(obj, tree, self.depth, set())
+
+    def _to_dict(self, obj: "ModelMeta", tree: Dict[str, dict] | None, depth: int | None, memo: set) -> Dict[str, Any]:
+        memo.add(id(obj))
+        values = dict()
+        nested_depth = None if depth is None else depth - 1
+
+        for prop in self._selected(type(obj), tree):
+            value = obj.__dict__.get(prop.name, prop.get_default())
+            subtree = (tree.get(prop.name) or None) if tree else None
+
+            if isinstance(prop, properties.ForeignKey):
+                value = self._related(value, subtree, nested_depth, memo)
+
+            elif isinstance(prop, properties.ListProperty):
+                value = [self._related(item, subtree, nested_depth, memo) for item in value]
+
+            values[prop.name] = value
+
+        return values
+
+    def _related(self, obj, tree: Dict[str, dict] | None, depth: int | None, memo: set):
+        if obj is None or isinstance(obj, (int, str)):
+            # Not loaded, only the id is known.
+            return obj
+
+        key = obj.primary_key.name
+
+        if depth is not None and depth < 0:
+            return obj.__dict__.get(key)
+
+        if id(obj) in memo:
+            return {"$ref": type(obj).__name__, key: obj.__dict__.get(key)}
+
+        return self._to_dict(obj, tree, depth, memo)
+
+    def _selected(self, model: type["ModelMeta"], tree: Dict[str, dict] | None) -> List[properties.Property]:
+        cache_key = (model, None if not tree else tuple(tree))
+        selected = self._properties.get(cache_key)
+
+        if selected is None:
+            selected = [prop for prop in model.properties
+                        if not tree or prop.name in tree or isinstance(prop, properties.PrimaryKey)]
+            self._properties[cache_key] = selected
+
+        return selected
+
+
+def write_json(objects: Iterable["ModelMeta"], file: TextIO, depth: int | None = None,
+               fields: Iterable[str] | None = None, chunk_size: int = 1000) -> int:
+    """Writes objects to the file as a JSON array, one object at a time.
+
+    Objects are serialized independently (see Serializer), so only a
+    chunk of serialized objects is kept in memory.
+
+    Args:
+        objects: Objects to be written, e.g. QueryBuilder.iterate().
+        file: Text file the array is written to.
+        depth: See Serializer.
+        fields: See Serializer.
+        chunk_size: Number of objects written at once.
+
+    Returns:
+        Number of written objects.
+    """
+
+    serializer = Serializer(depth, fields)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    chunk: List[str] = []
+    count = 0
+
+    file.write("[")
+
+    for obj in objects:
+        chunk.append(encode(serializer.to_dict(obj)))
+        count += 1
+
+        if len(chunk) >= chunk_size:
+            file.write(("," if count > len(chunk) else "") + ",".join(chunk))
+            chunk = []
+
+    if chunk:
+        file.write(("," if count > len(chunk) else "") + ",".join(chunk))
+
+    file.write("]")
+
+    return count
+
+
+def _field_tree(model: type["ModelMeta"], fields: Iterable[str]) -> Dict[str, dict]:
+    """Returns tree of property names, e.g. {"name": {}, "class_": {"name": {}}}.
+
+    Raises:
+        ValueError: If a property along a path doesn't exist, or isn't a
+            relation but is followed by nested names.
+    """
+
+    tree: Dict[str, dict] = dict()
+
+    for path in fields:
+        node, current = tree, model
+
+        while path:
+            if current is None:
+                raise ValueError(f"Path '{path}' follows a property which isn't a relation!")
+
+            # Names may end with underscores (e.g. "class_"), match the longest one.
+            matching = [prop for prop in current.properties
+                        if path == prop.name or path.startswith(f"{prop.name}__")]
+
+            if not matching:
+                raise ValueError(f"Class '{current.__name__}' has no property for path '{path}'!")
+
+            prop = max(matching, key=lambda prop: len(prop.name))
+            node = node.setdefault(prop.name, {})
+            path = path[len(prop.name) + 2:]
+
+            if isinstance(prop, properties.ForeignKey):
+                current = prop.referenced_type
+
+            elif isinstance(prop, properties.ListProperty):
+                current = prop.contained_type
+
+            else:
+                current = None
+
+    return tree
@@ -0,0 +1,156 @@
+"""Binary columnar files with rows of tables.
+
+A snapshot consists of column blocks followed by a JSON header describing
+the tables and the positions of their blocks:
+
+    MAGIC | blocks... | header | header length (8 bytes) | MAGIC
+
+Integer and float columns are stored as native arrays (readable without
+copying from a memory-mapped file), strings as an array of lengths and
+UTF-8 data, NULLs in a separate mask. Columns of other values fall back to
+JSON.
+"""
+
+import array
+import json
+import mmap
+import struct
+import sys
+from typing import Any, Dict, List, Sequence
+
+MAGIC = b"ORMSNAP1"
+_LENGTH = struct.Struct("<Q")
+
+
+def write(path: str, tables: List[Dict[str, Any]]):
+    """Writes tables to a snapshot file.
+
+    Args:
+        path: Path of the file.
+        tables: Tables as dicts with "columns", equally long sequences of
+            values by column name, and any other JSON values describing
+            the table (stored in the header).
+    """
+
+    header = {"byteorder": sys.byteorder, "tables": []}
+
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+
+        for table in tables:
+            columns = []
+
+            for name, values in table["columns"].items():
+                values = values.tolist() if hasattr(values, "tolist") else values
+                kind, blocks = _encode(values)
+                column = {"name": name, "kind": kind, "rows": len(values)}
+
+                for block_name, data in blocks.items():
+                    # Arrays are aligned, so that they can be cast in place.
+                    file.write(b"\0" * (-file.tell() % 8))
+                    column[block_name] = [file.tell(), len(data)]
+                    file.write(data)
+
+                columns.append(column)
+
+            header["tables"].append({**{k: v for k, v in table.items() if k != "columns"}, "columns": columns})
+
+        data = json.dumps(header).encode()
+        file.write(data)
+        file.write(_LENGTH.pack(len(data)))
+        file.write(MAGIC)
+
+
+def read(path: str, memory_map: bool = False) -> List[Dict[str, Any]]:
+    """Reads tables written by write().
+
+    Args:
+        path: Path of the file.
+        memory_map: Whether to map the file into memory instead of reading
+            it. Integer and float columns are then views of the mapping.
+
+    Returns:
+        Tables as written, with columns as sequences of values.
+
+    Raises:
+        ValueError: If the file isn't a snapshot, or was written on a
+            machine with different byte order.
+    """
+
+    with open(path, "rb") as file:
+        if memory_map:
+            buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+        else:
+            buffer = memoryview(file.read())
+
+    if bytes(buffer[:len(MAGIC)]) != MAGIC or bytes(buffer[-len(MAGIC):]) != MAGIC:
+        raise ValueError(f"'{path}' isn't a snapshot!")
+
+    end = len(buffer) - len(MAGIC) - _LENGTH.size
+    header_length = _LENGTH.unpack(buffer[end:end + _LENGTH.size])[0]
+    header = json.loads(bytes(buffer[end - header_length:end]))
+
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"Snapshot '{path}' was written with {header['byteorder']} byte order!")
+
+    tables = header["tables"]
+
+    for table in tables:
+        table["columns"] = {
+            column["name"]: _decode(column, buffer) for column in table["columns"]
+        }
+
+    return tables
+
+
+def _encode(values: Sequence) -> tuple:
+    """Returns kind of the column and its blocks of bytes by name."""
+
+    present = [value for value in values if value is not None]
+    nulls = bytes(value is None for value in values) if len(present) < len(values) else None
+
+    if all(type(value) is int for value in present) and all(-2 ** 63 <= value < 2 ** 63 for value in present):
+        kind, blocks = "int", {"data": array.array("q", [0 if value is None else value for value in values]).tobytes()}
+
+    elif all(type(value) is float for value in present):
+        kind, blocks = "float", {"data": array.array("d", [0.0 if value is None else value for value in values]).tobytes()}
+
+    elif all(type(value) is str for value in present):
+        encoded = [b"" if value is None else value.encode() for value in values]
+        kind, blocks = "text", {"lengths": array.array("q", map(len, encoded)).tobytes(), "data": b"".join(encoded)}
+
+    else:
+        return "json", {"data": json.dumps(values).encode()}
+
+    if nulls is not None:
+        blocks["nulls"] = nulls
+
+    return kind, blocks
+
+
+def _decode(column: Dict[str, Any], buffer: memoryview) -> Sequence:
+    def block(name: str) -> memoryview:
+        offset, length = column[name]
+        return buffer[offset:offset + length]
+
+    kind = column["kind"]
+
+    if kind == "json":
+        return json.loads(bytes(block("data")))
+
+    if kind == "text":
+        data = bytes(block("data"))
+        values, position = [], 0
+
+        for length in block("lengths").cast("q"):
+            values.append(data[position:position + length].decode())
+            position += length
+
+    else:
+        values = block("data").cast("q" if kind == "int" else "d")
+
+    if "nulls" in column:
+        values = [None if null else value for value, null in zip(values, block("nulls"))]
+
+    return values
@@ -1,21 +1,46 @@
-from typing import List, Type
+from typing import Dict, List, Type
 
 
 class StaticStorage:
-    """Class for storing static data."""
+    """Class for storing static data.
 
-    _declared_models: List[Type['ModelMeta']] = []
+    Models are registered by name in a namespace of their repository.
+    Registering a model again (e.g. when init_class is rerun, or a model is
+    redeclared) replaces the model registered under its name.
+    """
+
+    _namespaces: Dict["Repository", Dict[str, Type['ModelMeta']]] = dict()
+    # Last registered model of every name, in any namespace.
+    _models_by_name: Dict[str, Type['ModelMeta']] = dict()
 
     @classmethod
     def add_model(cls, model: Type['ModelMeta']):
         """Adds a model to the storage."""
 
-        cls._declared_models.append(model)
+        cls._namespaces.setdefault(model.repository, {})[model.__name__] = model
+        cls._models_by_name[model.__name__] = model
+
+    @classmethod
+    def get_model_by_name(cls, name: str, repository: "Repository | None" = None) -> Type['ModelMeta'] | None:
+        """Returns a model by its name.
+
+        Args:
+            name: Name of the model's class.
+            repository: Repository whose models are searched first.
+
+        Returns:
+            The model, or None if no model with the name is registered.
+        """
+
+        model = cls._namespaces.get(repository, {}).get(name)
+
+        return model if model is not None else cls._models_by_name.get(name)
 
     @classmethod
-    def get_model_by_name(cls, name: str) -> Type['ModelMeta']:
-        """Returns a model by its name."""
+    def get_models(cls, repository: "Repository | None" = None) -> List[Type['ModelMeta']]:
+        """Returns all declared models, or only models of the repository."""
+
+        if repository is not None:
+            return list(cls._namespaces.get(repository, {}).values())
 
-        for model in cls._declared_models:
-            if model.__name__ == name:
-                return model
\ No newline at end of file
+        return [model for models in cls._namespaces.values() for model in models.values()]
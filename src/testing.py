@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from typing import List
+
+from src import instrumentation
+
+
+class CapturedQueries:
+    """Statements captured within a block."""
+
+    def __init__(self, events: List[instrumentation.QueryEvent]):
+        self.events = events
+
+    @property
+    def statements(self) -> List[str]:
+        return [event.statement for event in self.events]
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __repr__(self):
+        return "\n".join(f"{i}. [{event.origin}] {event.statement.strip()}"
+                         for i, event in enumerate(self.events, 1))
+
+
+@contextmanager
+def capture_queries():
+    """Captures statements issued through connections within the block.
+
+    Only statements executed by the current thread are captured.
+
+    Example:
+        with capture_queries() as queries:
+            Person.selection.evaluate()
+        print(len(queries), queries.statements)
+    """
+
+    with instrumentation.capture() as events:
+        yield CapturedQueries(events)
+
+
+class QueryCountAssertions:
+    """Mixin for unittest.TestCase asserting numbers of issued statements."""
+
+    @contextmanager
+    def assertNumQueries(self, expected: int, msg: str | None = None):
+        """Asserts that the block issues exactly `expected` statements."""
+
+        with capture_queries() as queries:
+            yield queries
+
+        self.assertEqual(len(queries), expected, msg or
+                         f"{len(queries)} queries executed, {expected} expected:\n{queries!r}")
+
+    @contextmanager
+    def assertMaxQueries(self, maximum: int, msg: str | None = None):
+        """Asserts that the block issues at most `maximum` statements."""
+
+        with capture_queries() as queries:
+            yield queries
+
+        self.assertLessEqual(len(queries), maximum, msg or
+                             f"{len(queries)} queries executed, at most {maximum} expected:\n{queries!r}")
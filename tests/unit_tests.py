@@ -4,8 +4,22 @@ from src import properties
 from src.query_builder import *
 from src.model_meta import ModelMeta
 from src.properties import *
-from src.repository import SqlRepository
-from src.connection import SqliteConnection
+from src.repository import ShardedRepository, SqlRepository, ThreadSafeSqlRepository
+from src.connection import MemorySqliteConnection, SqliteConnection
+from src.result_cache import ResultCache
+from src import instrumentation
+from src.explain import FullScanChecker, FullScanError
+from src.memory_index import HashIndex, SortedIndex
+from src.static_storage import StaticStorage
+from src import snapshot
+from benchmarks import import_time, suite
+from src.testing import QueryCountAssertions, capture_queries
+from concurrent.futures import ThreadPoolExecutor
+import array
+import gzip
+import io
+import json
+import logging
 import sqlite3
 
 
@@ -43,7 +57,7 @@ class Tests(unittest.TestCase):
         # Sprawdź kolumny w tabeli Student
         self.cursor.execute("PRAGMA table_info(Person);")
         columns = [column[1] for column in self.cursor.fetchall()]
-        expected_columns = ['id', 'name', 'age', 'indexx']
+        expected_columns = ['id', 'name', 'age', 'model_type', 'indexx']
         self.assertListEqual(columns, expected_columns,
                              "Kolumny tabeli Person są nieprawidłowe")
 
@@ -62,6 +76,116 @@ class Tests(unittest.TestCase):
         # print(rows)
         self.assertEqual(len(rows), 1, "Niepoprawna liczba wyników")
 
+    def test_repr(self):
+        class Team(BaseModel):
+            id = properties.PrimaryKey()
+            leader = properties.ForeignKey(Person)
+            members = properties.ListProperty(Person)
+        Team.init_class()
+        person = Person(name="Ann", age=30)
+        person.save()
+        team = Team(leader=person, members=[person])
+        team.save()
+
+        self.assertEqual(repr(person), "Person(id=1, name=Ann, age=30)")
+        self.assertEqual(repr(team), "Team(id=1, leader=Person(id=1, name=Ann, age=30), members=[Person(id=1)])")
+
+    def test_to_dict(self):
+        class Team(BaseModel):
+            id = properties.PrimaryKey()
+            leader = properties.ForeignKey(Person)
+            members = properties.ListProperty(Person)
+        Team.init_class()
+        ann = Person(name="Ann", age=30)
+        ann.save()
+        team = Team(leader=ann, members=[ann])
+        team.save()
+
+        self.assertEqual(team.to_dict(), {"id": 1, "leader": {"id": 1, "name": "Ann", "age": 30},
+                                          "members": [{"$ref": "Person", "id": 1}]})
+        self.assertEqual(team.to_dict(depth=0), {"id": 1, "leader": 1, "members": [1]})
+        self.assertEqual(json.loads(team.to_json(fields=["leader__name"])), {"id": 1, "leader": {"id": 1, "name": "Ann"}})
+
+        class Node(BaseModel):
+            id = properties.PrimaryKey()
+            next = properties.ForeignKey("Node")
+        Node.init_class()
+        first = Node(id=1)
+        first.next = Node(id=2, next=first)
+        self.assertEqual(first.to_dict(), {"id": 1, "next": {"id": 2, "next": {"$ref": "Node", "id": 1}}})
+
+    def test_write_json(self):
+        Person.save_columns(name=["a", "b", "c"], age=[1, 2, 3])
+        file = io.StringIO()
+
+        self.assertEqual(Person.selection.write_json(file, fields=["name"], batch_size=2), 3)
+        self.assertEqual(json.loads(file.getvalue()), [
+            {"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 3, "name": "c"}])
+
+    def test_snapshot(self):
+        class Team(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            leader = properties.ForeignKey(Person)
+            members = properties.ListProperty(Person)
+        Team.init_class()
+        Person.save_columns(name=["Ann", None, "Éva"], age=[30, None, 25])
+        ann, nobody, eva = Person.selection.evaluate()
+        Team(name="A", leader=ann, members=[eva, ann]).save()
+        repository = BaseModel.repository
+        path = "databases/test_snapshot.bin"
+
+        self.assertEqual(repository.export_snapshot([Person, Team], path), 4)
+        repository.clear_cache()
+
+        for memory_map in (False, True):
+            with capture_queries() as queries:
+                self.assertEqual(repository.import_snapshot(path, memory_map=memory_map, cache_models=True), 4)
+                people = Person.selection.where(GreaterThan(Person.id, 1)).evaluate()
+            self.assertEqual(len(queries), 0)
+            self.assertEqual([(p.name, p.age) for p in people], [(None, None), ("Éva", 25)])
+            team = repository.cached_objects(Team)[0]
+            self.assertEqual(team.members, [people[1], team.leader])
+            repository.clear_cache()
+
+        # without cache_models selections still see rows written outside the repository
+        repository.import_snapshot(path)
+        self.cursor.execute("INSERT INTO Person (name, age, model_type) VALUES ('Bob', 41, 'Person')")
+        self.conn.commit()
+        self.assertIsNone(repository.cached_objects(Person))
+        self.assertEqual([p.name for p in Person.selection.evaluate()], ["Ann", None, "Éva", "Bob"])
+
+        # lists of cached owners missing in the snapshot are kept
+        other = Team(name="B", leader=eva, members=[eva])
+        other.save()
+        repository.import_snapshot(path)
+        self.assertEqual(other.members, [eva])
+        other.save()
+        self.cursor.execute("SELECT members_id FROM Team_members WHERE Team_id = ?", (other.id,))
+        self.assertEqual(self.cursor.fetchall(), [(eva.id,)])
+
+    def test_foreign_key_by_name(self):
+        class Pet(BaseModel):
+            id = properties.PrimaryKey()
+            owner = properties.ForeignKey("Owner")
+
+        class Owner(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+        Owner.init_class()
+        Owner.init_class()
+        Pet.init_class()
+
+        self.assertIs(StaticStorage.get_model_by_name("Owner", BaseModel.repository), Owner)
+        self.assertEqual([model for model in StaticStorage.get_models() if model.__name__ == "Owner"], [Owner])
+        owner = Owner(name="Ann")
+        owner.save()
+        Pet(owner=owner).save()
+        self.assertIs(Pet.selection.evaluate()[0].owner, owner)
+
+        with self.assertRaises(ValueError):
+            properties.ForeignKey("Missing").referenced_type
+
     def test_table_creation_with_list_properties(self):
         class Class(BaseModel):
             id = properties.PrimaryKey()
@@ -333,6 +457,986 @@ class Tests(unittest.TestCase):
         obj = res[0]
         self.assertAlmostEqual(obj.num, 0.4)
 
+    def test_evaluate_foreign(self):
+        class Team(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+        Team.init_class()
+
+        class Player(BaseModel):
+            id = properties.PrimaryKey()
+            team = properties.ForeignKey(Team)
+            name = properties.StringProperty()
+        Player.init_class()
+        red, blue = Team(name="red"), Team(name="blue")
+        red.save()
+        blue.save()
+        Player(name="a", team=blue).save()
+        Player(name="b", team=red).save()
+        BaseModel.repository.clear_cache()
+
+        players = Player.selection.evaluate()
+        self.assertEqual([p.name for p in players], ["a", "b"])
+        self.assertEqual([p.team.name for p in players], ["blue", "red"])
+
+    def test_iterate_parallel(self):
+        for i in range(30):
+            Person(name=f"p{i}", age=i).save()
+        BaseModel.repository.clear_cache()
+
+        serial = list(Person.selection.where(
+            LessThan(Person.age, 20)).iterate(batch_size=7))
+        BaseModel.repository.clear_cache()
+        parallel = list(Person.selection.where(
+            LessThan(Person.age, 20)).parallel(2).iterate(batch_size=7))
+
+        self.assertEqual([p.age for p in serial], list(range(20)))
+        self.assertEqual([p.age for p in parallel], list(range(20)))
+        self.assertEqual(
+            len(Person.selection.limit(5).parallel(2).evaluate()), 5)
+
+    def test_iterate_sparse_ids(self):
+        Person.save_columns(id=[1, 2, 100_000_000], name=["a", "b", "c"], age=[1, 2, 3])
+        BaseModel.repository.clear_cache()
+
+        with capture_queries() as queries:
+            serial = list(Person.selection.iterate(batch_size=2))
+        self.assertEqual([p.name for p in serial], ["a", "b", "c"])
+        self.assertEqual(len(queries), 2)
+
+        BaseModel.repository.clear_cache()
+        with capture_queries() as queries:
+            parallel = list(Person.selection.parallel(2).iterate(batch_size=2))
+        self.assertEqual([p.name for p in parallel], ["a", "b", "c"])
+        # boundaries of both ranges, rows are selected by the workers
+        self.assertEqual(len(queries), 2)
+
+    def test_columns(self):
+        class Sample(BaseModel):
+            id = properties.PrimaryKey()
+            label = properties.StringProperty()
+            count = properties.IntProperty()
+            weight = properties.FloatProperty()
+        Sample.init_class()
+        for i in range(5):
+            Sample(label=f"s{i}", count=i, weight=i / 2).save()
+
+        columns = Sample.selection.where(
+            GreaterThan(Sample.count, 1)).columns(batch_size=2)
+        self.assertEqual(list(columns["count"]), [2, 3, 4])
+        self.assertEqual(list(columns["weight"]), [1.0, 1.5, 2.0])
+        self.assertEqual(columns["label"], ["s2", "s3", "s4"])
+
+        Person.save_columns(name=["a", "b", "c"], age=[30, None, 10])
+        with capture_queries() as queries:
+            columns = Person.selection.columns(Person.age, Person.name)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(list(columns), ["age", "name"])
+        self.assertEqual(columns["age"], [30, None, 10])
+        self.assertEqual(columns["name"], ["a", "b", "c"])
+        # no objects were created
+        self.assertEqual(BaseModel.repository.get_objects(Person, [1, 2, 3]), [])
+
+    def test_save_columns(self):
+        count = Person.save_columns(
+            name=["a", "b", "c"], age=array.array("q", [1, 2, 3]))
+        self.assertEqual(count, 3)
+        rows = self.cursor.execute("SELECT id, name, age FROM Person;").fetchall()
+        self.assertEqual(rows, [(1, "a", 1), (2, "b", 2), (3, "c", 3)])
+        self.assertEqual(BaseModel.repository.get_objects(Person, [1, 2, 3]), [])
+
+        Person.save_columns(cache=True, name=["d"], age=[4])
+        cached = BaseModel.repository.get_objects(Person, [4])
+        self.assertEqual([(p.name, p.age) for p in cached], [("d", 4)])
+
+        with self.assertRaises(ValueError):
+            Person.save_columns(name=["a", "b"], age=[1])
+        with self.assertRaises(ValueError):
+            Person.save_columns(height=[1])
+
+    def test_load_csv_and_jsonl(self):
+        class Pet(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            owner = properties.ForeignKey(Person)
+        Pet.init_class()
+        Person.save_columns(name=["Ann"], age=[30])
+
+        with open("databases/test_people.csv", "w") as file:
+            file.write("name,age\nBob,41\nCid,\nDan,old\n")
+        report = Person.load_csv("databases/test_people.csv", chunk_size=1)
+        self.assertEqual((report.rows, report.rejected), (2, 1))
+        self.assertEqual(report.errors[0][0], 4)
+        rows = self.cursor.execute("SELECT name, age FROM Person;").fetchall()
+        self.assertEqual(rows, [("Ann", 30), ("Bob", 41), ("Cid", None)])
+
+        with open("databases/test_pets.jsonl", "w") as file:
+            file.write('{"name": "Rex", "owner": 1}\n{"name": "Tom", "owner": 9}\n\n{"name": "Kit"}\nnot json\n')
+        report = Pet.load_jsonl("databases/test_pets.jsonl")
+        self.assertEqual((report.rows, report.rejected), (2, 2))
+        self.assertEqual(sorted(line for line, _ in report.errors), [2, 5])
+        self.assertEqual([(p.name, p.owner and p.owner.name) for p in Pet.selection.evaluate()],
+                         [("Rex", "Ann"), ("Kit", None)])
+
+        with self.assertRaises(ValueError):
+            Pet.load_csv("databases/test_people.csv")
+
+    def test_export(self):
+        class Pet(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            owner = properties.ForeignKey(Person)
+        Pet.init_class()
+        Person.save_columns(name=["Ann", "Bob", None], age=[30, 41, 5])
+        Pet.save_columns(name=["Rex"], owner=[2])
+        adults = Person.selection.where(GreaterThan(Person.age, 18))
+
+        with capture_queries() as queries:
+            self.assertEqual(adults.export("databases/test_export.csv", fields=["name", "age"]), 2)
+        self.assertEqual(len(queries), 1)
+        with open("databases/test_export.csv", newline="") as file:
+            self.assertEqual(file.read(), "name,age\r\nAnn,30\r\nBob,41\r\n")
+
+        self.assertEqual(Person.selection.export("databases/test_export.jsonl.gz", "jsonl", compression="gzip"), 3)
+        with gzip.open("databases/test_export.jsonl.gz", "rt") as file:
+            self.assertEqual([json.loads(line) for line in file][2], {"id": 3, "name": None, "age": 5})
+
+        self.assertEqual(Person.selection.export("databases/test_export.bin", "columnar", batch_size=2), 3)
+        groups = snapshot.read("databases/test_export.bin")
+        self.assertEqual([list(group["columns"]["age"]) for group in groups], [[30, 41], [5]])
+
+        Pet.selection.export("databases/test_export.json", "json", fields=["owner__name"], depth=1)
+        with open("databases/test_export.json") as file:
+            self.assertEqual(json.load(file), [{"id": 1, "owner": {"id": 2, "name": "Bob"}}])
+
+        with self.assertRaises(ValueError):
+            Pet.selection.export("databases/test_export.csv", depth=1)
+
+
+class ThreadSafeBaseModel(ModelMeta):
+    repository = ThreadSafeSqlRepository(
+        SqliteConnection("databases/test_threads.db", persistent=True), readers=4)
+
+
+class Reading(ThreadSafeBaseModel):
+    id = properties.PrimaryKey()
+    value = properties.IntProperty()
+
+
+class ThreadSafeRepositoryTests(unittest.TestCase):
+    def setUp(self):
+        Reading.init_class()
+
+    def test_wal_mode(self):
+        conn = sqlite3.connect("databases/test_threads.db")
+        mode = conn.execute("PRAGMA journal_mode;").fetchone()[0]
+        conn.close()
+        self.assertEqual(mode, "wal")
+
+    def test_concurrent_evaluate_and_save(self):
+        for i in range(50):
+            Reading(value=i).save()
+
+        def work(i):
+            Reading(value=100 + i).save()
+            return Reading.selection.where(LessThan(Reading.value, 50)).evaluate()
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(work, range(32)))
+
+        for result in results:
+            self.assertEqual(len(result), 50)
+
+        # every row resolves to a single cached instance
+        self.assertEqual(
+            len({id(obj) for result in results for obj in result}), 50)
+        self.assertEqual(len(Reading.selection.evaluate()), 82)
+
+
+class ReplicaTests(unittest.TestCase):
+    def setUp(self):
+        self.create_repository()
+
+    def create_repository(self, result_cache=None):
+        self.repository = ThreadSafeSqlRepository(
+            SqliteConnection("databases/test_primary.db", persistent=True),
+            readers=[SqliteConnection("databases/test_replica.db", read_only=True, persistent=True),
+                     MemorySqliteConnection()],
+            result_cache=result_cache)
+
+        class ReplicaBaseModel(ModelMeta):
+            repository = self.repository
+
+        class Sensor(ReplicaBaseModel):
+            id = properties.PrimaryKey()
+            value = properties.IntProperty()
+        Sensor.init_class()
+
+        self.repository.refresh_replicas()
+        self.Sensor = Sensor
+
+    def tearDown(self):
+        self.repository.close()
+
+    def test_replica_lag(self):
+        for result_cache in (None, ResultCache()):
+            if result_cache is not None:
+                self.repository.close()
+                self.create_repository(result_cache)
+
+            self.Sensor(value=1).save()
+            # both replicas are still empty, rows read from them aren't cached
+            self.assertEqual(self.Sensor.selection.evaluate(), [])
+            self.assertEqual(self.Sensor.selection.evaluate(), [])
+
+            self.repository.refresh_replicas()
+            self.assertEqual([s.value for s in self.Sensor.selection.evaluate()], [1])
+            self.assertEqual([s.value for s in self.Sensor.selection.evaluate()], [1])
+
+        self.assertEqual(result_cache.hits, 1)
+
+    def test_read_your_writes(self):
+        with self.repository.session():
+            self.assertEqual(self.Sensor.selection.evaluate(), [])
+            self.Sensor(value=2).save()
+            self.assertEqual([s.value for s in self.Sensor.selection.evaluate()], [2])
+
+        self.assertEqual(self.Sensor.selection.evaluate(), [])
+
+    def test_full_scan_checker(self):
+        self.Sensor.save_columns(value=list(range(10)))
+        self.repository.refresh_replicas()
+        checker = FullScanChecker(self.repository, threshold=3, strict=True)
+        checker.attach()
+        try:
+            # readers are taken in turn, the file replica and then the in-memory one
+            for _ in range(2):
+                with self.assertRaises(FullScanError):
+                    self.Sensor.selection.where(Equals(self.Sensor.value, 1)).evaluate()
+        finally:
+            checker.detach()
+
+
+class ShardedRepositoryTests(QueryCountAssertions, unittest.TestCase):
+    def setUp(self):
+        self.repository = ShardedRepository(
+            [SqliteConnection(f"databases/test_shard{i}.db") for i in range(3)], id_block=4)
+
+        class ShardedBaseModel(ModelMeta):
+            repository = self.repository
+
+        class Customer(ShardedBaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+        Customer.init_class()
+
+        class Purchase(ShardedBaseModel):
+            shard_key = "customer"
+            id = properties.PrimaryKey()
+            total = properties.IntProperty()
+            customer = properties.ForeignKey(Customer)
+        Purchase.init_class()
+
+        self.BaseModel, self.Customer, self.Purchase = ShardedBaseModel, Customer, Purchase
+
+    def tearDown(self):
+        self.repository.close()
+
+    def shard_rows(self, table):
+        counts = []
+        for i in range(3):
+            conn = sqlite3.connect(f"databases/test_shard{i}.db")
+            counts.append(conn.execute(f"SELECT id FROM {table}").fetchall())
+            conn.close()
+        return counts
+
+    def test_routing(self):
+        customers = [self.Customer(name=f"c{i}") for i in range(6)]
+        for customer in customers:
+            customer.save()
+        self.assertEqual([c.id for c in customers], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(self.shard_rows("Customer"), [[(3,), (6,)], [(1,), (4,)], [(2,), (5,)]])
+
+        self.Purchase.save_columns(total=list(range(12)), customer=customers * 2)
+        for shard, rows in enumerate(self.shard_rows("Purchase")):
+            for (id,) in rows:
+                purchase = self.Purchase.selection.where(Equals(self.Purchase.id, id)).evaluate()[0]
+                self.assertEqual(purchase.customer.id % 3, shard)
+
+    def test_evaluate(self):
+        self.Customer.save_columns(name=[f"c{i}" for i in range(10)])
+        self.assertEqual(len(self.Customer.selection.evaluate()), 10)
+        self.assertEqual(len(self.Customer.selection.limit(4).evaluate()), 4)
+        names = [c.name for c in self.Customer.selection.where(GreaterThan(self.Customer.id, 5)).evaluate()]
+        self.assertEqual(sorted(names), ["c5", "c6", "c7", "c8", "c9"])
+        self.assertEqual([c.id for c in self.Customer.selection.iterate(batch_size=3)], list(range(1, 11)))
+
+        # one statement per query, executed on every shard
+        self.repository.clear_cache()
+        with self.assertNumQueries(6):
+            self.Customer.selection.evaluate()
+
+    def test_select_related_across_shards(self):
+        class Coupon(self.BaseModel):
+            id = properties.PrimaryKey()
+            customer = properties.ForeignKey(self.Customer)
+        Coupon.init_class()
+        customer = self.Customer(name="a")
+        customer.save()
+        # coupons 1 and 2 are stored in shards 1 and 2, the customer in shard 1
+        Coupon.save_columns(customer=[customer, customer])
+        self.repository.clear_cache()
+
+        coupons = Coupon.selection.select_related("customer").evaluate()
+        self.assertEqual(sorted((c.id, c.customer and c.customer.name) for c in coupons), [(1, "a"), (2, "a")])
+
+    def test_prefetch_related_across_shards(self):
+        class Team(self.BaseModel):
+            id = properties.PrimaryKey()
+            members = properties.ListProperty(self.Customer)
+        Team.init_class()
+        members = [self.Customer(name=f"t{i}") for i in range(3)]
+        for member in members:
+            member.save()
+        Team(members=members).save()
+        self.repository.clear_cache()
+
+        team = Team.selection.prefetch_related("members").evaluate()[0]
+        self.assertEqual([member.name for member in team.members], ["t0", "t1", "t2"])
+
+    def test_merged_rows(self):
+        self.Customer.save_columns(name=["b", "a", "b", "a", "b", "a"])
+
+        rows = self.repository.get_rows("SELECT name, id FROM Customer ORDER BY name, id DESC")
+        self.assertEqual(rows, [("a", 6), ("a", 4), ("a", 2), ("b", 5), ("b", 3), ("b", 1)])
+        rows = self.repository.get_rows("SELECT name, id FROM Customer ORDER BY name, id LIMIT 4")
+        self.assertEqual(rows, [("a", 2), ("a", 4), ("a", 6), ("b", 1)])
+        self.assertEqual(sorted(self.repository.get_rows("SELECT DISTINCT name FROM Customer")), [("a",), ("b",)])
+        self.assertEqual(self.repository.get_rows("SELECT COUNT(*), MAX(id) FROM Customer"), [(6, 6)])
+
+        for query in ("SELECT AVG(id) FROM Customer", "SELECT COUNT(DISTINCT name) FROM Customer",
+                      "SELECT name, COUNT(*) FROM Customer GROUP BY name", "SELECT name FROM Customer ORDER BY id"):
+            with self.assertRaises(ValueError):
+                self.repository.get_rows(query)
+
+    def test_subqueries_are_rejected(self):
+        # shards would evaluate subqueries over their own rows only
+        with self.assertRaises(ValueError):
+            Has(self.Purchase.customer, Equals(self.Customer.name, "a"))
+        with self.assertRaises(ValueError):
+            HasNo(self.Purchase.customer)
+        with self.assertRaises(ValueError):
+            IsIn(self.Purchase.customer, self.Customer.selection.subquery())
+
+    def test_full_scan_checker(self):
+        self.Customer.save_columns(name=[f"c{i}" for i in range(30)])
+        self.repository.clear_cache()
+        checker = FullScanChecker(self.repository, threshold=3, strict=True)
+        checker.attach()
+        try:
+            with self.assertRaises(FullScanError):
+                self.Customer.selection.where(Equals(self.Customer.name, "c1")).evaluate()
+            self.assertEqual(len(self.Customer.selection.where(IsIn(self.Customer.id, [1, 2, 3])).evaluate()), 3)
+        finally:
+            checker.detach()
+
+
+class ConnectionProfileTests(unittest.TestCase):
+    def pragma(self, connection, name):
+        with connection as db:
+            return db.execute_query(f"PRAGMA {name}")[0][0][0]
+
+    def test_profiles(self):
+        connection = SqliteConnection(
+            "databases/test_profiles.db", persistent=True, profile="read-heavy")
+        self.assertEqual(self.pragma(connection, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(connection, "mmap_size"), 268435456)
+
+        connection.profile = {"cache_size": -1024, "synchronous": "OFF"}
+        self.assertEqual(self.pragma(connection, "cache_size"), -1024)
+        self.assertEqual(self.pragma(connection, "synchronous"), 0)
+        connection.dispose()
+
+        with self.assertRaises(ValueError):
+            SqliteConnection("databases/test_profiles.db", profile="fast")
+
+    def test_repository_profile(self):
+        ThreadSafeBaseModel.repository.set_profile("durable")
+        try:
+            Reading.init_class()
+            Reading(value=1).save()
+            self.assertEqual(len(Reading.selection.evaluate()), 1)
+            self.assertEqual(self.pragma(
+                ThreadSafeBaseModel.repository.connection, "synchronous"), 2)
+        finally:
+            ThreadSafeBaseModel.repository.set_profile("default")
+
+    def test_repository_profile_of_busy_reader(self):
+        repository = ThreadSafeBaseModel.repository
+        Reading.init_class()
+        try:
+            # the reader is in use by another thread while the profile changes
+            with repository._read_connection() as busy, busy:
+                repository.set_profile({"cache_size": -1234})
+
+            cache_sizes = []
+            for _ in range(4):
+                with repository._read_connection() as reader:
+                    cache_sizes.append(self.pragma(reader, "cache_size"))
+            self.assertEqual(cache_sizes, [-1234] * 4)
+        finally:
+            repository.set_profile("default")
+
+
+class MemoryBaseModel(ModelMeta):
+    repository = SqlRepository(MemorySqliteConnection())
+
+
+class Note(MemoryBaseModel):
+    id = properties.PrimaryKey()
+    text = properties.StringProperty()
+
+
+class MemoryConnectionTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Note.init_class()
+        for i in range(3):
+            Note(text=f"n{i}").save()
+        cls.seeded = MemoryBaseModel.repository.connection.snapshot()
+
+    def setUp(self):
+        MemoryBaseModel.repository.connection.restore(self.seeded)
+        MemoryBaseModel.repository.clear_cache()
+
+    def test_operations(self):
+        Note(text="n3").save()
+        notes = Note.selection.where(NotEquals(Note.text, "n0")).evaluate()
+        self.assertEqual([n.text for n in notes], ["n1", "n2", "n3"])
+        notes[0].delete_object()
+        self.assertEqual(len(Note.selection.evaluate()), 3)
+
+    def test_restored_per_test(self):
+        self.assertEqual(len(Note.selection.evaluate()), 3)
+        Note.save_columns(text=["x"] * 10)
+        self.assertEqual(len(Note.selection.evaluate()), 13)
+
+    def test_parallel_is_rejected(self):
+        # worker processes can't open the in-memory database
+        with self.assertRaises(ValueError):
+            Note.selection.parallel(2)
+
+    def test_shared_between_connections(self):
+        connection = MemoryBaseModel.repository.connection
+        other = sqlite3.connect(connection.db_path, uri=True)
+        self.assertEqual(other.execute(
+            "SELECT COUNT(*) FROM Note").fetchone()[0], 3)
+        other.close()
+
+    def test_load_from_file(self):
+        connection = MemoryBaseModel.repository.connection
+        connection.save("databases/test_memory.db")
+        replica = MemorySqliteConnection.from_file("databases/test_memory.db")
+        with replica as db:
+            self.assertEqual(db.execute_query(
+                "SELECT COUNT(*) FROM Note")[0][0][0], 3)
+        replica.close()
+
+
+class InstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        Person.init_class()
+
+    def test_query_events(self):
+        events = []
+        with instrumentation.subscribed(instrumentation.QUERY, events.append):
+            Person(name="a", age=1).save()
+            Person.selection.where(Equals(Person.age, 1)).evaluate()
+
+        self.assertEqual([e.origin for e in events], ["save", "evaluate"])
+        self.assertIn("INSERT", events[0].statement)
+        self.assertEqual(events[1].rows, 1)
+        self.assertGreaterEqual(events[1].duration, 0)
+
+    def test_metrics_and_evaluate_events(self):
+        class Team(BaseModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            members = properties.ListProperty(Person)
+        Team.init_class()
+        people = [Person(name=f"p{i}", age=i) for i in range(3)]
+        for person in people:
+            person.save()
+        for i in range(3):
+            Team(name=f"t{i}", members=people).save()
+        BaseModel.repository.clear_cache()
+
+        metrics = instrumentation.MetricsRegistry()
+        evaluations = []
+        metrics.attach()
+        try:
+            with instrumentation.subscribed(instrumentation.EVALUATE, evaluations.append):
+                Team.selection.evaluate()
+        finally:
+            metrics.detach()
+
+        self.assertEqual(len(evaluations), 1)
+        self.assertEqual(evaluations[0].objects, 3)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["queries"], evaluations[0].statements)
+        self.assertGreater(snapshot["counters"]["queries.relation load"], 0)
+        self.assertIn("evaluate_statements.Team", snapshot["histograms"])
+
+    def test_slow_query_log(self):
+        with self.assertLogs("src.slow_queries", logging.WARNING) as logs:
+            with instrumentation.subscribed(instrumentation.QUERY, instrumentation.SlowQueryLog(0)):
+                Person.selection.evaluate()
+        self.assertIn("SELECT", logs.output[0])
+
+
+class ExplainTests(unittest.TestCase):
+    def setUp(self):
+        Person.init_class()
+        for i in range(5):
+            Person(name=f"p{i}", age=i).save()
+        BaseModel.repository.clear_cache()
+
+    def test_explain(self):
+        plans = Person.selection.where(Equals(Person.age, 1)).explain()
+        self.assertEqual(len(plans), 2)
+        self.assertEqual(plans[0].full_scans, ["Person"])
+        self.assertIn("CREATE INDEX ix_Person_age ON Person (age)",
+                      plans[0].suggest_indexes())
+
+    def test_explain_ignores_cache(self):
+        def statements():
+            return [plan.statement for plan in Person.selection.where(Equals(Person.age, 1)).explain()]
+
+        cold = statements()
+        self.assertEqual(len(cold), 2)
+        # the remainder query isn't skipped for cached objects, nor are fully cached models selected in memory
+        self.assertEqual(statements(), cold)
+        BaseModel.repository.cache_model(Person)
+        try:
+            self.assertEqual(statements(), cold)
+        finally:
+            BaseModel.repository.clear_cache()
+
+    def test_full_scan_checker(self):
+        checker = FullScanChecker(BaseModel.repository, threshold=3, strict=True)
+        checker.attach()
+        try:
+            with self.assertRaises(FullScanError) as error:
+                Person.selection.where(Equals(Person.age, 1)).evaluate()
+            self.assertIn("ix_Person_age", str(error.exception))
+            Person.selection.where(IsIn(Person.id, [1, 2])).evaluate()
+        finally:
+            checker.detach()
+
+    def test_indexed_property(self):
+        class Indexed(BaseModel):
+            id = properties.PrimaryKey()
+            code = properties.IntProperty(index=True)
+        Indexed.init_class()
+        Indexed(code=1).save()
+        plans = Indexed.selection.where(Equals(Indexed.code, 1)).explain()
+        self.assertEqual(plans[0].full_scans, [])
+
+    def test_limit_with_indexed_condition(self):
+        class Indexed(BaseModel):
+            id = properties.PrimaryKey()
+            code = properties.IntProperty(index=True)
+        Indexed.init_class()
+        Indexed.save_columns(code=[50, 1, 3, 40, 2])
+        BaseModel.repository.clear_cache()
+
+        # the index on code would order the rows differently from their ids
+        selected = Indexed.selection.where(GreaterThan(Indexed.code, 0)).limit(2).evaluate()
+        self.assertEqual([(obj.id, obj.code) for obj in selected], [(1, 50), (2, 1)])
+
+
+class BenchmarkSuiteTests(unittest.TestCase):
+    def test_compare_flags_regressions(self):
+        baseline = {"a[10]": {"ops_per_sec": 100.0},
+                    "b[10]": {"ops_per_sec": 100.0}}
+        results = {"a[10]": {"ops_per_sec": 90.0},
+                   "b[10]": {"ops_per_sec": 50.0},
+                   "c[10]": {"ops_per_sec": 1.0}}
+        regressions = suite.compare(results, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("b[10]"))
+
+    def test_import_is_lazy(self):
+        modules = import_time.measure("src.model_meta")
+        self.assertIn("src.repository", modules)
+
+        for module in ("yaml", "numpy", "multiprocessing"):
+            self.assertNotIn(module, modules)
+
+
+class QueryCountTests(QueryCountAssertions, unittest.TestCase):
+    def setUp(self):
+        class ReadmeModel(ModelMeta):
+            repository = SqlRepository(SqliteConnection("databases/test_queries.db"))
+
+        class StudentsClass(ReadmeModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+        StudentsClass.init_class()
+
+        class Person(ReadmeModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            age = properties.IntProperty()
+        Person.init_class()
+
+        class Student(Person):
+            indexx = properties.IntProperty()
+            class_ = properties.ForeignKey(StudentsClass)
+        Student.init_class()
+
+        self.repository = ReadmeModel.repository
+        self.ReadmeModel, self.StudentsClass, self.Student = ReadmeModel, StudentsClass, Student
+        self.Person = Person
+
+    def test_save(self):
+        class_ = self.StudentsClass(name="3A")
+        with self.assertNumQueries(1):
+            class_.save()
+        student = self.Student(name="John", age=20, indexx=123, class_=class_)
+        with self.assertNumQueries(1):
+            student.save()
+        student.age += 1
+        with self.assertNumQueries(2):
+            student.save()
+
+    def test_single_table_inheritance(self):
+        class_ = self.StudentsClass(name="3A")
+        class_.save()
+        self.Person(name="Ann", age=40).save()
+        self.Student(name="John", age=20, indexx=1, class_=class_).save()
+        self.Person.save_columns(name=["Bob"], age=[50])
+        self.Student.save_columns(name=["Tom"], age=[21], indexx=[2], class_=[class_])
+        self.repository.clear_cache()
+
+        with self.assertNumQueries(4):
+            people = self.Person.selection.evaluate()
+        self.assertEqual([type(p).__name__ for p in people], ["Person", "Student", "Person", "Student"])
+        self.assertEqual(people[1].class_.name, "3A")
+        self.assertEqual(people[3].indexx, 2)
+
+        with self.assertNumQueries(2) as queries:
+            students = self.Student.selection.where(GreaterThan(self.Student.age, 0)).evaluate()
+        self.assertEqual(students, [people[1], people[3]])
+        self.assertIn("model_type IN ('Student')", list(queries)[0].statement)
+        self.assertIn("USING INDEX ix_Person_model_type",
+                      " ".join(self.repository.explain(self.Student.selection.serialize())))
+
+    def test_evaluate(self):
+        class_ = self.StudentsClass(name="3A")
+        class_.save()
+        for i in range(10):
+            self.Student(name=f"s{i}", age=20, indexx=i, class_=class_).save()
+        self.repository.clear_cache()
+
+        with self.assertNumQueries(4) as queries:
+            students = self.Student.selection.evaluate()
+        self.assertEqual(len(students), 10)
+        self.assertEqual(
+            [event.origin for event in queries],
+            ["evaluate", "evaluate", "relation load", "relation load"])
+
+        with self.assertNumQueries(2):
+            self.Student.selection.evaluate()
+
+    def test_select_related(self):
+        class_ = self.StudentsClass(name="3A")
+        class_.save()
+        for i in range(3):
+            self.Student(name=f"s{i}", age=20, indexx=i, class_=class_).save()
+        self.Student.save_columns(name=["no class"], class_=[None])
+        self.repository.clear_cache()
+
+        with self.assertNumQueries(1):
+            students = self.Student.selection.select_related("class_").evaluate()
+        self.assertEqual([s.class_.name for s in students[:3]], ["3A"] * 3)
+        self.assertIs(students[0].class_, students[2].class_)
+        self.assertIsNone(students[3].class_)
+
+        with self.assertRaises(ValueError):
+            self.Student.selection.select_related("name")
+
+    def test_select_related_nested(self):
+        class Pupil(self.ReadmeModel):
+            id = properties.PrimaryKey()
+            mentor = properties.ForeignKey(self.Student)
+        Pupil.init_class()
+
+        class_ = self.StudentsClass(name="3A")
+        class_.save()
+        mentor = self.Student(name="m", age=30, indexx=1, class_=class_)
+        mentor.save()
+        Pupil(mentor=mentor).save()
+        self.repository.clear_cache()
+
+        with self.assertNumQueries(1):
+            pupil = Pupil.selection.select_related("mentor__class_").evaluate()[0]
+        self.assertEqual(pupil.mentor.name, "m")
+        self.assertEqual(pupil.mentor.class_.name, "3A")
+
+    def test_prefetch_related(self):
+        class ServiceInfo(self.ReadmeModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+        ServiceInfo.init_class()
+
+        class Service(self.ReadmeModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            info = properties.ListProperty(ServiceInfo)
+        Service.init_class()
+
+        class Account(self.ReadmeModel):
+            id = properties.PrimaryKey()
+            name = properties.StringProperty()
+            services = properties.ListProperty(Service)
+        Account.init_class()
+
+        infos = [ServiceInfo(name=f"i{i}") for i in range(4)]
+        for info in infos:
+            info.save()
+        services = [Service(name=f"s{i}", info=infos[i:]) for i in range(4)]
+        for service in services:
+            service.save()
+        for i in range(5):
+            Account(name=f"a{i}", services=services[:i]).save()
+
+        def load(selection):
+            self.repository.clear_cache()
+            return [(a.name, [(s.name, [i.name for i in s.info]) for s in a.services])
+                    for a in selection.evaluate()]
+
+        expected = load(Account.selection)
+        with self.assertNumQueries(4):
+            self.assertEqual(load(Account.selection.prefetch_related("services__info")), expected)
+
+        with self.assertRaises(ValueError):
+            Account.selection.prefetch_related("name")
+
+    def test_has_foreign_key(self):
+        for name in ("3A", "3B"):
+            class_ = self.StudentsClass(name=name)
+            class_.save()
+            self.Student(name=f"in {name}", age=20, indexx=1, class_=class_).save()
+
+        students = self.Student.selection.where(
+            Has(self.Student.class_, Equals(self.StudentsClass.name, "3B"))).evaluate()
+        self.assertEqual([s.name for s in students], ["in 3B"])
+
+    def test_capture_is_per_thread(self):
+        with capture_queries() as queries:
+            with ThreadPoolExecutor(1) as pool:
+                pool.submit(lambda: self.Student.selection.evaluate()).result()
+        self.assertEqual(len(queries), 0)
+
+        with self.assertRaises(AssertionError):
+            with self.assertMaxQueries(0):
+                self.Student.selection.evaluate()
+
+
+class CachedBaseModel(ModelMeta):
+    repository = SqlRepository(SqliteConnection(
+        "databases/test_result_cache.db"), result_cache=ResultCache())
+
+
+class Tag(CachedBaseModel):
+    id = properties.PrimaryKey()
+    name = properties.StringProperty()
+
+
+class Post(CachedBaseModel):
+    id = properties.PrimaryKey()
+    title = properties.StringProperty()
+    tags = properties.ListProperty(Tag)
+
+
+class ResultCacheTests(QueryCountAssertions, unittest.TestCase):
+    def setUp(self):
+        Tag.init_class()
+        Post.init_class()
+        tags = [Tag(name="a"), Tag(name="b")]
+        for tag in tags:
+            tag.save()
+        Post(title="first", tags=tags).save()
+
+    def test_repeated_selection_costs_no_sql(self):
+        condition = Equals(Post.title, "first")
+        first = Post.selection.where(condition).evaluate()
+        with self.assertNumQueries(0):
+            second = Post.selection.where(condition).evaluate()
+
+        self.assertIs(first[0], second[0])
+        self.assertGreater(CachedBaseModel.repository.result_cache.hits, 0)
+
+    def test_explain_ignores_cached_results(self):
+        def statements():
+            return [plan.statement for plan in Post.selection.where(Equals(Post.title, "first")).explain()]
+
+        cold = statements()
+        Post.selection.where(Equals(Post.title, "first")).evaluate()
+        self.assertEqual(statements(), cold)
+
+    def test_invalidation(self):
+        Post.selection.evaluate()
+        Post(title="second", tags=[]).save()
+        self.assertEqual(len(Post.selection.evaluate()), 2)
+
+        post = Post.selection.where(Equals(Post.title, "first")).evaluate()[0]
+        post.tags = post.tags[:1]
+        post.save()
+        post = Post.selection.where(Equals(Post.title, "first")).evaluate()[0]
+        self.assertEqual(len(post.tags), 1)
+
+        post.delete_object()
+        self.assertEqual(len(Post.selection.evaluate()), 1)
+
+    def test_relation_filters(self):
+        def titles(condition):
+            return [p.title for p in Post.selection.where(condition).evaluate()]
+
+        self.assertEqual(titles(Has(Post.tags, Equals(Tag.name, "a"))), ["first"])
+        self.assertEqual(titles(HasNo(Post.tags)), [])
+
+        # cached results are invalidated by writes to the link table
+        Post(title="second", tags=[]).save()
+        self.assertEqual(titles(HasNo(Post.tags)), ["second"])
+        post = Post.selection.where(Equals(Post.title, "second")).evaluate()[0]
+        post.tags = Tag.selection.where(Equals(Tag.name, "b")).evaluate()
+        post.save()
+        self.assertEqual(titles(HasNo(Post.tags)), [])
+        self.assertEqual(titles(Has(Post.tags, Equals(Tag.name, "b"))), ["first", "second"])
+        self.assertEqual(titles(HasNo(Post.tags, Equals(Tag.name, "a"))), ["second"])
+
+        tags = Tag.selection.where(Equals(Tag.name, "a")).subquery()
+        self.assertEqual([t.name for t in Tag.selection.where(NotIn(Tag.id, tags)).evaluate()], ["b"])
+
+    def test_put_skipped_after_concurrent_write(self):
+        cache = ResultCache()
+        versions = cache.versions(["Post"])
+        cache.invalidate("Post")
+        cache.put(("q", ()), ["Post"], [(1,)], versions)
+        self.assertEqual(len(cache), 0)
+        cache.put(("q", ()), ["Post"], [(1,)], cache.versions(["Post"]))
+        self.assertEqual(cache.get(("q", ())), [(1,)])
+
+
+class LookupBaseModel(ModelMeta):
+    repository = SqlRepository(SqliteConnection("databases/test_lookup.db"))
+
+
+class Country(LookupBaseModel):
+    id = properties.PrimaryKey()
+    code = properties.StringProperty()
+    population = properties.IntProperty()
+    area = properties.FloatProperty()
+
+
+class MemoryQueryTests(QueryCountAssertions, unittest.TestCase):
+    conditions = [
+        Equals(Country.code, "PL"),
+        NotEquals(Country.code, "PL"),
+        GreaterThan(Country.population, 30),
+        LessThan(Divide(Country.population, 7), 5),
+        Or(LessThan(Country.population, 10), GreaterThan(Country.area, 300.0)),
+        And(NotEquals(Country.population, 38), LessThan(Country.area, 400.0)),
+        IsIn(Country.code, ["DE", "FR", "XX"]),
+        NotIn(Country.population, [38, 83]),
+        IsIn(Country.id, []),
+        GreaterThan(Subtract(Multiply(Country.population, 10), 60), Country.area),
+    ]
+
+    def setUp(self):
+        Country.init_class()
+        Country.save_columns(
+            code=["PL", "DE", "FR", "LU", "VA"],
+            population=[38, 83, 68, 1, None],
+            area=[312.7, 357.6, 551.7, 2.6, 0.44])
+        LookupBaseModel.repository.clear_cache()
+
+    def select(self, condition):
+        return [c.id for c in Country.selection.where(condition).evaluate()]
+
+    def test_same_results_as_sql(self):
+        expected = [self.select(condition) for condition in self.conditions]
+        LookupBaseModel.repository.cache_model(Country)
+
+        with self.assertNumQueries(0):
+            results = [self.select(condition) for condition in self.conditions]
+            limited = [c.id for c in Country.selection.limit(2).evaluate()]
+
+        self.assertEqual(results, expected)
+        self.assertEqual(limited, [1, 2])
+
+    def test_writes_keep_cache_consistent(self):
+        repository = LookupBaseModel.repository
+        repository.cache_model(Country)
+        Country(code="CZ", population=10, area=78.9).save()
+        Country.save_columns(code=["SK"], population=[5], area=[49.0])
+        Country.selection.where(Equals(Country.code, "PL")).evaluate()[0].delete_object()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.select(LessThan(Country.population, 11)), [4, 6, 7])
+            self.assertEqual(self.select(Equals(Country.code, "PL")), [])
+
+        # rows of subclasses share the identity map of the table
+        class Province(Country):
+            capital = properties.StringProperty()
+        Province.init_class()
+        Province(code="BY", population=13, area=70.5, capital="Munich").save()
+
+        with self.assertNumQueries(0):
+            provinces = Country.selection.where(GreaterThan(Country.population, 11)).evaluate()
+        self.assertEqual([type(c).__name__ for c in provinces], ["Country", "Country", "Province"])
+
+    def test_indexes(self):
+        expected = [self.select(condition) for condition in self.conditions]
+        repository = LookupBaseModel.repository
+        repository.cache_model(Country, indexes=[
+            HashIndex(Country.code), SortedIndex(Country.population), SortedIndex(Country.area)])
+
+        self.assertEqual([self.select(condition) for condition in self.conditions], expected)
+        self.assertEqual(len(repository.cached_objects(Country, Equals(Country.code, "DE"))), 1)
+        stats = {s["property"]: s for s in repository.index_stats(Country)}
+        self.assertEqual(stats["code"]["hits"], 3)
+        self.assertEqual(stats["population"]["entries"], 4)
+        self.assertGreater(stats["area"]["memory_bytes"], 0)
+
+        country = Country.selection.where(Equals(Country.code, "DE")).evaluate()[0]
+        country.population = 5
+        country.save()
+        self.assertEqual(self.select(LessThan(Country.population, 10)), [2, 4])
+        country.delete_object()
+        self.assertEqual(self.select(LessThan(Country.population, 10)), [4])
+
+    def test_unsaved_changes(self):
+        repository = LookupBaseModel.repository
+        condition = LessThan(Country.population, 50)
+        expected = self.select(condition)
+        self.assertEqual(expected, [1, 4])
+
+        # like SQL, in-memory selections test saved values, with and without indexes
+        for indexes in ([], [SortedIndex(Country.population)]):
+            repository.clear_cache()
+            repository.cache_model(Country, indexes=indexes)
+            france = Country.selection.where(Equals(Country.code, "FR")).evaluate()[0]
+            france.population = 1
+
+            with self.assertNumQueries(0):
+                self.assertEqual(self.select(condition), expected)
+
+        france.save()
+        self.assertEqual(self.select(condition), [1, 3, 4])
+
 
 if __name__ == "__main__":
     unittest.main()